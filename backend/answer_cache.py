@@ -0,0 +1,235 @@
+# Answer cache: the result of a query (first page, row count, LLM context) keyed on (normalized SQL, role, data
+# version), and the generated answer additionally keyed on the normalized question. A new data version (bumped
+# by every ingestion) makes older entries unreachable; they age out of the size-bounded LRU.
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+import sqlglot
+from backend.sql_cache import normalize_question
+from backend.data_version import get_data_versions
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+# "memory" (in-process LRU), "disk" (local SQLite file, shared by workers on one host, survives restarts) or "off"
+ANSWER_CACHE_BACKEND = os.getenv("ANSWER_CACHE_BACKEND", "memory")
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", str(BASE_DIR / '.cache' / 'answer_cache.db'))
+
+def _key(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+def normalize_sql(sql: str) -> str:
+    # Canonical formatting, so whitespace and keyword case do not split entries; string literals are kept as is
+    try:
+        return sqlglot.parse_one(sql, read="postgres").sql(dialect="postgres")
+    except sqlglot.errors.SqlglotError:
+        return sql.strip()
+
+class SizedMemoryBackend:
+    # LRU bounded by the total size of the stored values rather than by entry count
+    def __init__(self, max_bytes: int = ANSWER_CACHE_MAX_BYTES, ttl: float = ANSWER_CACHE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.time():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, time.time() + self.ttl)
+        self.bytes += len(value)
+        while self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        value, _ = self._entries.pop(key)
+        self.bytes -= len(value)
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+class SQLiteSizedBackend:
+    # Same policy in a local SQLite file; last use is tracked per entry and the least recently used go first
+    def __init__(self, path: str = ANSWER_CACHE_PATH, max_bytes: int = ANSWER_CACHE_MAX_BYTES,
+                 ttl: float = ANSWER_CACHE_TTL_SECONDS):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS answer_cache (key TEXT PRIMARY KEY, value BLOB, size INTEGER, "
+                           "expires_at REAL, used_at REAL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_answer_cache_used_at ON answer_cache (used_at)")
+        self._conn.commit()
+
+    @property
+    def bytes(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM answer_cache").fetchone()[0]
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM answer_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                self._conn.execute("DELETE FROM answer_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE answer_cache SET used_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def set(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO answer_cache (key, value, size, expires_at, used_at) "
+                               "VALUES (?, ?, ?, ?, ?)", (key, value, len(value), now + self.ttl, now))
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM answer_cache").fetchone()[0]
+            if total > self.max_bytes:
+                # expired entries first, then the least recently used until the total fits
+                total -= self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM answer_cache WHERE expires_at < ?",
+                                            (now,)).fetchone()[0]
+                self._conn.execute("DELETE FROM answer_cache WHERE expires_at < ?", (now,))
+                victims = []
+                for victim, size in self._conn.execute("SELECT key, size FROM answer_cache ORDER BY used_at"):
+                    if total <= self.max_bytes:
+                        break
+                    victims.append((victim,))
+                    total -= size
+                self._conn.executemany("DELETE FROM answer_cache WHERE key = ?", victims)
+                self.evictions += len(victims)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM answer_cache")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM answer_cache").fetchone()[0]
+
+class CacheLookup:
+    # What one request found: the cached result and/or answer, and the keys to store what it computes
+    def __init__(self, result_key: str = None, answer_key: str = None, result: dict = None, answer: str = None,
+                 enabled: bool = True):
+        self.result_key = result_key
+        self.answer_key = answer_key
+        self.result = result
+        self.answer = answer
+        self.enabled = enabled
+
+    @property
+    def status(self) -> str:
+        # "answer": no query and no LLM call; "result": rows from the cache, answer generated; "miss"; "off"
+        if not self.enabled:
+            return "off"
+        return "answer" if self.answer is not None else "result" if self.result is not None else "miss"
+
+class AnswerCache:
+    def __init__(self, backend, table_name: str = 'financials'):
+        self.backend = backend
+        self.table_name = table_name
+        self.answer_hits = 0
+        self.result_hits = 0
+        self.misses = 0
+
+    async def lookup(self, sql: str, user_role: str, question: str) -> CacheLookup:
+        version = await get_data_versions().get(self.table_name)
+        result_key = _key(normalize_sql(sql), user_role, self.table_name, version)
+        template, literals = normalize_question(question)
+        answer_key = _key(result_key, template, literals)
+        lookup = CacheLookup(result_key, answer_key)
+        answer = self.backend.get(answer_key)
+        if answer is not None:
+            lookup.answer = answer.decode("utf-8")
+        result = self.backend.get(result_key)
+        if result is not None:
+            lookup.result = json.loads(result)
+        if lookup.answer is not None and lookup.result is None:
+            # the rows were evicted before the answer; both are needed to respond
+            lookup.answer = None
+        if lookup.status == "answer":
+            self.answer_hits += 1
+        elif lookup.status == "result":
+            self.result_hits += 1
+        else:
+            self.misses += 1
+        return lookup
+
+    def store_result(self, lookup: CacheLookup, result: dict):
+        if lookup.result_key is not None:
+            self.backend.set(lookup.result_key, json.dumps(result, default=str).encode("utf-8"))
+
+    def store_answer(self, lookup: CacheLookup, answer: str):
+        if lookup.answer_key is not None:
+            self.backend.set(lookup.answer_key, answer.encode("utf-8"))
+
+    def stats(self) -> dict:
+        lookups = self.answer_hits + self.result_hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "bytes": self.backend.bytes,
+            "max_bytes": self.backend.max_bytes,
+            "evictions": self.backend.evictions,
+            "answer_hits": self.answer_hits,
+            "result_hits": self.result_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.answer_hits + self.result_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+class _NoCache:
+    async def lookup(self, sql: str, user_role: str, question: str) -> CacheLookup:
+        return CacheLookup(enabled=False)
+
+    def store_result(self, lookup: CacheLookup, result: dict):
+        pass
+
+    def store_answer(self, lookup: CacheLookup, answer: str):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": "off"}
+
+_answer_cache = None
+
+def get_answer_cache():
+    global _answer_cache
+    if _answer_cache is None:
+        if ANSWER_CACHE_BACKEND == "disk":
+            _answer_cache = AnswerCache(SQLiteSizedBackend())
+        elif ANSWER_CACHE_BACKEND == "off":
+            _answer_cache = _NoCache()
+        else:
+            _answer_cache = AnswerCache(SizedMemoryBackend())
+    return _answer_cache
@@ -0,0 +1,22 @@
+# One-off migration: build the per-user chat session index documents from existing messages
+# Usage: python -m backend.backfill_session_index [--user-id USER_ID]
+import argparse
+import asyncio
+from backend.cosmos_utils import create_chat_repository
+
+async def main(user_id: str = None):
+    repo = await create_chat_repository()
+    try:
+        if user_id:
+            doc = await repo.backfill_session_index(user_id, overwrite=True)
+            print(f"Indexed {len(doc['sessions'])} sessions for user {user_id}")
+        else:
+            print(f"Indexed sessions for {await repo.backfill_all_session_indexes()} users")
+    finally:
+        await repo.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--user-id", default=None)
+    args = parser.parse_args()
+    asyncio.run(main(args.user_id))
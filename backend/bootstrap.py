@@ -0,0 +1,23 @@
+# Provisions the cloud resources the API expects to exist, so that neither startup nor requests make
+# control-plane calls: the Cosmos chat-history database and container (with the history composite index).
+# Also sets created_at on messages saved before it existed, which history pages order by. Safe to re-run.
+# Usage: python -m backend.bootstrap
+import asyncio
+import time
+from backend.cosmos_utils import COSMOS_DB, COSMOS_CONTAINER, CHAT_STORE, create_chat_repository
+
+async def main():
+    if CHAT_STORE == "memory":
+        print("CHAT_STORE=memory: nothing to provision")
+        return
+    started = time.perf_counter()
+    repo = await create_chat_repository(provision=True)
+    try:
+        print(f"Cosmos database {COSMOS_DB!r} and container {COSMOS_CONTAINER!r} ready "
+              f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+        print(f"Set created_at on {await repo.backfill_created_at()} older messages")
+    finally:
+        await repo.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
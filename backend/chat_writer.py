@@ -0,0 +1,141 @@
+# Write-behind persistence for chat messages: an in-process queue flushed in per-partition batches,
+# with backpressure, a flush on shutdown and an on-disk spill file replayed at startup
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+from backend.cosmos_utils import prepare_message
+from backend.tracing import count
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+# "true" acknowledges /chat/save/ once the message is queued instead of after the Cosmos write
+CHAT_WRITE_BEHIND = os.getenv("CHAT_WRITE_BEHIND", "false").lower() == "true"
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", "100"))
+CHAT_WRITE_FLUSH_MS = float(os.getenv("CHAT_WRITE_FLUSH_MS", "50"))
+CHAT_WRITE_MAX_PENDING = int(os.getenv("CHAT_WRITE_MAX_PENDING", "10000"))
+CHAT_WRITE_RETRIES = int(os.getenv("CHAT_WRITE_RETRIES", "3"))
+CHAT_WRITE_SPILL_PATH = os.getenv("CHAT_WRITE_SPILL_PATH", str(BASE_DIR / ".cache" / "chat_spill.jsonl"))
+
+logger = logging.getLogger(__name__)
+
+class ChatWriteBehindQueue:
+    # enqueue() returns as soon as the message is accepted (it blocks only while max_pending messages are
+    # waiting). A background task takes up to batch_size messages or whatever arrived within flush_ms and
+    # writes them per partition (session) through ChatHistoryRepository.write_partition.
+    # Partitions that still fail after the retries are appended to the spill file.
+    def __init__(self, repository, batch_size: int = CHAT_WRITE_BATCH_SIZE, flush_ms: float = CHAT_WRITE_FLUSH_MS,
+                 max_pending: int = CHAT_WRITE_MAX_PENDING, retries: int = CHAT_WRITE_RETRIES,
+                 spill_path: str = CHAT_WRITE_SPILL_PATH, backoff: float = 0.2):
+        self.repository = repository
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self.retries = retries
+        self.backoff = backoff
+        self.spill_path = Path(spill_path)
+        self._queue = asyncio.Queue(maxsize=max_pending)
+        self._worker = None
+        self.written = 0
+        self.batches = 0
+        self.spilled = 0
+        self.replayed = 0
+
+    async def start(self):
+        await self.replay_spill()
+        self._worker = asyncio.create_task(self._run())
+
+    async def enqueue(self, item: dict) -> dict:
+        item = prepare_message(item)
+        self.repository.remember(item)
+        await self._queue.put(item)
+        return item
+
+    async def close(self):
+        # Flushes everything still queued; what cannot be written ends up in the spill file
+        if self._worker is None:
+            return
+        await self._queue.join()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self.flush(batch)
+            except Exception:
+                logger.exception("Chat write-behind flush failed; spilling %d messages", len(batch))
+                self._spill(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def flush(self, items: list):
+        # Partitions are written concurrently; each one is retried on its own
+        by_session = {}
+        for item in items:
+            by_session.setdefault(item["session_id"], []).append(item)
+        self.batches += 1
+        count("chat_write_batches")
+        results = await asyncio.gather(*(self._write(session_items) for session_items in by_session.values()))
+        failed = [item for session_items, error in zip(by_session.values(), results) if error for item in session_items]
+        if failed:
+            logger.warning("Chat store unavailable (%s); spilling %d messages to %s",
+                           next(error for error in results if error), len(failed), self.spill_path)
+            self._spill(failed)
+
+    async def _write(self, items: list):
+        # Returns None once written, or the last error after the retries
+        for attempt in range(self.retries + 1):
+            try:
+                await self.repository.write_partition(items)
+                self.written += len(items)
+                return None
+            except Exception as e:
+                if attempt == self.retries:
+                    return e
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    def _spill(self, items: list):
+        self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.spill_path, "a", encoding="utf-8") as spill:
+            for item in items:
+                spill.write(json.dumps(item, default=str) + "\n")
+        self.spilled += len(items)
+        count("chat_messages_spilled", len(items))
+
+    async def replay_spill(self):
+        # Moves the spill file aside before replaying, so messages that fail again are spilled afresh
+        replay_path = self.spill_path.with_suffix(self.spill_path.suffix + ".replay")
+        if self.spill_path.exists():
+            with open(self.spill_path, "r", encoding="utf-8") as spill, open(replay_path, "a", encoding="utf-8") as replay:
+                replay.write(spill.read())
+            self.spill_path.unlink()
+        if not replay_path.exists():
+            return
+        with open(replay_path, "r", encoding="utf-8") as replay:
+            items = [json.loads(line) for line in replay if line.strip()]
+        logger.info("Replaying %d spilled chat messages from %s", len(items), replay_path)
+        spilled_before = self.spilled
+        for start in range(0, len(items), self.batch_size):
+            await self.flush(items[start:start + self.batch_size])
+        self.replayed += len(items) - (self.spilled - spilled_before)
+        replay_path.unlink()
+
+    def stats(self) -> dict:
+        return {"pending": self._queue.qsize(), "written": self.written, "batches": self.batches,
+                "spilled": self.spilled, "replayed": self.replayed}
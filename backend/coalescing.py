@@ -0,0 +1,76 @@
+# Single-flight request coalescing: concurrent calls with the same key share one in-flight execution. The
+# shared task keeps running while anyone still waits for it and is cancelled when the last waiter goes away;
+# its result or error is delivered to every waiter.
+import asyncio
+import logging
+import os
+
+# Identical /rag-advanced/ questions (normalized question + role) in flight at the same time run once
+RAG_COALESCING = os.getenv("RAG_COALESCING", "true").lower() == "true"
+
+logger = logging.getLogger(__name__)
+
+class _Call:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self.cancelled = 0
+        self.errors = 0
+        self._calls = {}
+
+    async def run(self, key, factory):
+        # Returns (result, shared): shared is False for the caller that started the execution
+        call = self._calls.get(key)
+        shared = call is not None
+        if call is None:
+            call = self._calls[key] = _Call(asyncio.ensure_future(factory()))
+            call.task.add_done_callback(lambda task: self._finished(key, call))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+        call.waiters += 1
+        try:
+            # shield: one waiter being cancelled must not cancel the execution the others wait for
+            return await asyncio.shield(call.task), shared
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # nobody is left to receive the result; later callers start a fresh execution
+                self.cancelled += 1
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _finished(self, key, call):
+        self._forget(key, call)
+        if not call.task.cancelled() and call.task.exception() is not None:
+            self.errors += 1
+            if call.waiters > 1:
+                logger.info("Coalesced execution failed for %d waiters: %s", call.waiters, call.task.exception())
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        started = self.leaders + self.coalesced
+        return {
+            "in_flight": len(self._calls),
+            "executions": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_rate": round(self.coalesced / started, 4) if started else 0.0,
+            "cancelled": self.cancelled,
+            "errors": self.errors,
+        }
+
+_rag_coalescer = None
+
+def get_rag_coalescer():
+    global _rag_coalescer
+    if _rag_coalescer is None and RAG_COALESCING:
+        _rag_coalescer = SingleFlight()
+    return _rag_coalescer
@@ -0,0 +1,482 @@
+# Optional in-process columnar mirror of the financials table (NumPy arrays, dictionary-encoded strings)
+# that answers simple single-table SQL with vectorized filter / group-by / aggregate.
+import asyncio
+import logging
+import os
+import re
+import time
+import numpy as np
+import sqlglot
+from sqlglot import exp
+from sqlalchemy import text
+from backend.schema_catalog import get_schema_catalog
+from backend.data_version import read_data_version, get_data_versions
+
+COLUMNAR_ENGINE = os.getenv("COLUMNAR_ENGINE", "false").lower() == "true"
+COLUMNAR_LOAD_BATCH = int(os.getenv("COLUMNAR_LOAD_BATCH", "50000"))
+
+_NUMERIC_TYPES = ("int", "float", "double", "numeric", "decimal", "real")
+
+logger = logging.getLogger(__name__)
+
+def _is_numeric(data_type: str) -> bool:
+    return any(token in data_type for token in _NUMERIC_TYPES)
+
+def _is_temporal(data_type: str) -> bool:
+    return "date" in data_type or "time" in data_type
+
+class Unsupported(Exception):
+    # Raised for any SQL construct the columnar engine does not implement; the caller falls back to the DB.
+    pass
+
+class Vector:
+    # kind "num": float64 values, NaN = NULL. kind "dict": int32 codes into `dictionary`, -1 = NULL.
+    def __init__(self, kind: str, data, dictionary=None, is_int: bool = False):
+        self.kind = kind
+        self.data = data
+        self.dictionary = dictionary
+        self.is_int = is_int
+
+    def take(self, indices):
+        return Vector(self.kind, self.data[indices], self.dictionary, self.is_int)
+
+    def sort_key(self, desc: bool, nulls_first: bool):
+        if self.kind == "num":
+            key = -self.data if desc else self.data
+            return np.where(np.isnan(key), -np.inf if nulls_first else np.inf, key)
+        order = np.argsort(np.array(self.dictionary, dtype=object), kind="stable")
+        rank = np.zeros(len(self.dictionary) + 1, dtype=np.int64)
+        rank[order] = np.arange(1, len(self.dictionary) + 1)
+        key = rank[self.data]
+        key = -key if desc else key
+        nulls = -(len(self.dictionary) + 1) if nulls_first else len(self.dictionary) + 1
+        return np.where(self.data < 0, nulls, key)
+
+    def to_list(self) -> list:
+        if self.kind == "num":
+            if self.is_int:
+                return [None if np.isnan(v) else int(v) for v in self.data.tolist()]
+            return [None if v != v else v for v in self.data.tolist()]
+        values = self.dictionary
+        return [None if code < 0 else values[code] for code in self.data.tolist()]
+
+def _literal(node):
+    if isinstance(node, exp.Literal):
+        return node.this if node.is_string else float(node.this)
+    if isinstance(node, exp.Neg) and isinstance(node.this, exp.Literal) and not node.this.is_string:
+        return -float(node.this.this)
+    if isinstance(node, exp.Boolean):
+        return node.this
+    raise Unsupported(f"literal {node.sql()}")
+
+def _like_regex(pattern: str, case_insensitive: bool):
+    regex = "".join(".*" if ch == "%" else "." if ch == "_" else re.escape(ch) for ch in pattern)
+    return re.compile(f"^{regex}$", re.IGNORECASE | re.DOTALL if case_insensitive else re.DOTALL)
+
+_COMPARE = {
+    exp.EQ: lambda a, b: a == b, exp.NEQ: lambda a, b: a != b,
+    exp.GT: lambda a, b: a > b, exp.GTE: lambda a, b: a >= b,
+    exp.LT: lambda a, b: a < b, exp.LTE: lambda a, b: a <= b,
+}
+_FLIPPED = {exp.EQ: exp.EQ, exp.NEQ: exp.NEQ, exp.GT: exp.LT, exp.GTE: exp.LTE, exp.LT: exp.GT, exp.LTE: exp.GTE}
+_ARITHMETIC = {
+    exp.Add: np.add, exp.Sub: np.subtract, exp.Mul: np.multiply,
+}
+
+class ColumnarFinancials:
+    def __init__(self, engine, table_name: str = 'financials'):
+        self.engine = engine
+        self.table_name = table_name
+        self._lock = asyncio.Lock()
+        self.refreshes = 0
+        self.queries = 0
+        self.fallbacks = 0
+        self._catch_up = None
+        self._reset([])
+
+    def _reset(self, columns: list):
+        self.columns = columns
+        self.column_names = [name for name, _ in columns]
+        self.numeric = {name: np.empty(0, dtype=np.float64) for name, data_type in columns if _is_numeric(data_type)}
+        self.integers = {name for name, data_type in columns if "int" in data_type}
+        self.codes = {name: np.empty(0, dtype=np.int32) for name, data_type in columns if not _is_numeric(data_type)}
+        # dates and timestamps are mirrored as ISO strings: fine to return, not to compare or group (the database
+        # compares them as dates, casting the literal)
+        self.temporal = {name for name, data_type in columns if _is_temporal(data_type)}
+        self.dictionaries = {name: [] for name in self.codes}
+        self._lookup = {name: {} for name in self.codes}
+        self.row_count = 0
+        self.last_id = None
+        self.loaded = False
+        # data version of the table when the mirror was last refreshed; the rows may be newer, never older
+        self.version = None
+
+    # --- loading ---
+    async def refresh(self, full: bool = False, if_behind: bool = False):
+        # Incremental: only rows with id above the last mirrored id are read. A schema change (new Excel
+        # headers, a widened type) or `full` (rows updated or deleted in place, which the id cursor cannot see) rebuilds the
+        # mirror from scratch. if_behind skips the refresh when one that ran meanwhile caught up already.
+        async with self._lock:
+            if if_behind and await self.current():
+                return
+            started = time.perf_counter()
+            table = await get_schema_catalog().get(self.table_name)
+            columns = [(col.name, col.data_type.lower()) for col in table.columns]
+            if full or columns != self.columns or 'id' not in self.column_names:
+                self._reset(columns)
+            if not self.column_names:
+                return
+            sql = f"SELECT * FROM {self.table_name}"
+            params = {}
+            if self.last_id is not None:
+                sql += " WHERE id > :last_id"
+                params["last_id"] = self.last_id
+            sql += " ORDER BY id"
+            numeric_parts = {name: [] for name in self.numeric}
+            code_parts = {name: [] for name in self.codes}
+            added = 0
+            async with self.engine.connect() as conn:
+                version = await read_data_version(conn, self.table_name)
+                result = await conn.stream(text(sql), params)
+                positions = {name: i for i, name in enumerate(result.keys())}
+                async for batch in result.partitions(COLUMNAR_LOAD_BATCH):
+                    values = list(zip(*batch))
+                    for name in self.numeric:
+                        numeric_parts[name].append(np.fromiter(
+                            (np.nan if v is None else float(v) for v in values[positions[name]]),
+                            dtype=np.float64, count=len(batch)))
+                    for name in self.codes:
+                        code_parts[name].append(self._encode(name, values[positions[name]]))
+                    added += len(batch)
+            if added:
+                for name, parts in numeric_parts.items():
+                    self.numeric[name] = np.concatenate([self.numeric[name]] + parts)
+                for name, parts in code_parts.items():
+                    self.codes[name] = np.concatenate([self.codes[name]] + parts)
+                self.row_count += added
+                self.last_id = int(np.nanmax(self.numeric["id"])) if "id" in self.numeric else self.row_count
+            self.loaded = True
+            self.version = version
+            self.refreshes += 1
+            logger.info("Columnar mirror of %s: +%d rows (%d total) in %.2fs", self.table_name, added,
+                        self.row_count, time.perf_counter() - started)
+
+    def _encode(self, name: str, values):
+        lookup = self._lookup[name]
+        dictionary = self.dictionaries[name]
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            if value is None:
+                codes[i] = -1
+                continue
+            if not isinstance(value, str):
+                value = value.isoformat() if hasattr(value, "isoformat") else str(value)
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(dictionary)
+                dictionary.append(value)
+            codes[i] = code
+        return codes
+
+    async def current(self) -> bool:
+        # Whether the mirror holds the table's current data version (as this process last read it)
+        return self.version is not None and self.version >= await get_data_versions().get(self.table_name)
+
+    async def catch_up(self) -> bool:
+        # current(), and when the mirror is behind - a load ran in another worker, whose after_ingest refreshes
+        # only its own mirror - a rebuild starts in the background; queries use the database until it is done.
+        # In full: whether that load updated or deleted rows is not known here.
+        if await self.current():
+            return True
+        if self.loaded and (self._catch_up is None or self._catch_up.done()):
+            self._catch_up = asyncio.create_task(self.refresh(full=True, if_behind=True))
+        return False
+
+    # --- query execution ---
+    def execute(self, sql: str):
+        # Returns a list of row dicts, or None when the SQL is outside the supported subset.
+        if not self.loaded:
+            return None
+        try:
+            tree = sqlglot.parse_one(sql, read="postgres")
+            rows = self._execute(tree)
+        except (Unsupported, sqlglot.errors.ParseError) as e:
+            self.fallbacks += 1
+            logger.debug("Columnar engine fell through (%s): %s", e, sql)
+            return None
+        self.queries += 1
+        return rows
+
+    def _execute(self, tree):
+        if not isinstance(tree, exp.Select):
+            raise Unsupported("not a SELECT")
+        for arg in ("joins", "having", "with", "with_", "distinct", "windows", "qualify", "laterals"):
+            if tree.args.get(arg):
+                raise Unsupported(arg)
+        source = tree.args.get("from_") or tree.args.get("from")
+        if source is None or not isinstance(source.this, exp.Table) or source.this.name != self.table_name:
+            raise Unsupported("source is not the financials table")
+        self._alias = source.this.alias_or_name
+        if any(node.find(exp.Window) for node in tree.expressions):
+            raise Unsupported("window function")
+
+        where = tree.args.get("where")
+        index = np.nonzero(self._predicate(where.this))[0] if where else np.arange(self.row_count)
+
+        select = []
+        for node in tree.expressions:
+            if isinstance(node, exp.Star):
+                select += [(name, exp.column(name)) for name in self.column_names]
+            else:
+                select.append((node.output_name or node.key, node.unalias() if isinstance(node, exp.Alias) else node))
+
+        group = tree.args.get("group")
+        aggregate = group is not None or any(node.find(exp.AggFunc) for _, node in select)
+        if aggregate:
+            keys = [self._comparable(node) for node in (group.expressions if group else [])]
+            inverse, first, groups = self._group(keys, index)
+            evaluate = lambda node: self._group_value(node, index, inverse, first, groups, keys)
+        else:
+            evaluate = lambda node: self._row_vector(node, index)
+
+        outputs = [(name, evaluate(node)) for name, node in select]
+        count = len(outputs[0][1].data) if outputs else 0
+
+        order = tree.args.get("order")
+        if order:
+            sort_keys = []
+            for ordered in order.expressions:
+                node = ordered.this
+                vector = next((vec for name, vec in outputs
+                               if isinstance(node, exp.Column) and not node.table and node.name == name), None)
+                if vector is None and isinstance(node, exp.Literal) and not node.is_string:
+                    vector = outputs[int(node.this) - 1][1]
+                if vector is None:
+                    vector = evaluate(node)
+                # sqlglot fills in nulls_first with the PostgreSQL default when the query leaves it out
+                sort_keys.append(vector.sort_key(bool(ordered.args.get("desc")), bool(ordered.args.get("nulls_first"))))
+            positions = np.lexsort(sort_keys[::-1])
+        else:
+            positions = np.arange(count)
+        offset = tree.args.get("offset")
+        if offset is not None:
+            positions = positions[int(_literal(offset.expression)):]
+        limit = tree.args.get("limit")
+        if limit is not None:
+            positions = positions[:int(_literal(limit.expression))]
+        columns = [(name, vector.take(positions).to_list()) for name, vector in outputs]
+        return [dict(zip([name for name, _ in columns], values)) for values in zip(*[vals for _, vals in columns])]
+
+    def _column_name(self, node) -> str:
+        if not isinstance(node, exp.Column):
+            raise Unsupported(f"expression {node.sql()}")
+        if node.table and node.table != self._alias:
+            raise Unsupported(f"column from {node.table}")
+        if node.name not in self.column_names:
+            raise Unsupported(f"unknown column {node.name}")
+        return node.name
+
+    def _comparable(self, node) -> str:
+        name = self._column_name(node)
+        if name in self.temporal:
+            raise Unsupported(f"comparison on date/time column {name}")
+        return name
+
+    def _predicate(self, node):
+        # Rows where the condition is TRUE (what WHERE keeps)
+        return self._truth(node)[0]
+
+    def _truth(self, node):
+        # SQL three-valued logic: (TRUE mask, FALSE mask); rows in neither are NULL (unknown). NOT swaps the
+        # two, so `NOT (cost > 5)` keeps rows where cost is NULL out, like the database does.
+        if isinstance(node, exp.Paren):
+            return self._truth(node.this)
+        if isinstance(node, exp.And):
+            (left_true, left_false), (right_true, right_false) = self._truth(node.this), self._truth(node.expression)
+            return left_true & right_true, left_false | right_false
+        if isinstance(node, exp.Or):
+            (left_true, left_false), (right_true, right_false) = self._truth(node.this), self._truth(node.expression)
+            return left_true | right_true, left_false & right_false
+        if isinstance(node, exp.Not):
+            true, false = self._truth(node.this)
+            return false, true
+        if isinstance(node, exp.Boolean):
+            true = np.full(self.row_count, node.this)
+            return true, ~true
+        if isinstance(node, exp.Is):
+            if not isinstance(node.expression, exp.Null):
+                raise Unsupported("IS other than NULL")
+            nulls = ~self._not_null(self._column_name(node.this))
+            true = ~nulls if node.args.get("negate") else nulls
+            return true, ~true
+        if isinstance(node, exp.In):
+            if node.args.get("query"):
+                raise Unsupported("IN subquery")
+            name = self._comparable(node.this)
+            values = [_literal(value) for value in node.expressions]
+            if name in self.numeric:
+                true = np.isin(self.numeric[name], [v for v in values if not isinstance(v, str)])
+            else:
+                true = self._match(name, lambda value: value in values)
+            return true, ~true & self._not_null(name)
+        if isinstance(node, exp.Between):
+            return self._truth(exp.and_(exp.GTE(this=node.this, expression=node.args["low"]),
+                                        exp.LTE(this=node.this, expression=node.args["high"])))
+        if isinstance(node, (exp.Like, exp.ILike)):
+            name = self._comparable(node.this)
+            pattern = _like_regex(_literal(node.expression), isinstance(node, exp.ILike))
+            true = self._match(name, lambda value: bool(pattern.match(str(value))))
+            return true, ~true & self._not_null(name)
+        compare = _COMPARE.get(type(node))
+        if compare is None:
+            raise Unsupported(f"predicate {node.sql()}")
+        left, right, op = node.this, node.expression, type(node)
+        if isinstance(left, exp.Literal) and isinstance(right, exp.Column):
+            left, right, op = right, left, _FLIPPED[op]
+            compare = _COMPARE[op]
+        if isinstance(left, exp.Column) and self._comparable(left) in self.codes:
+            literal = _literal(right)
+            true = self._match(left.name, lambda value: compare(value, literal))
+            return true, ~true & self._not_null(left.name)
+        left_values = self._numeric(self._row_vector(left))
+        right_values = self._numeric(self._row_vector(right))
+        known = ~np.isnan(left_values) & ~np.isnan(right_values)
+        true = compare(left_values, right_values) & known
+        return true, ~true & known
+
+    def _not_null(self, name: str):
+        return ~np.isnan(self.numeric[name]) if name in self.numeric else self.codes[name] >= 0
+
+    def _match(self, name: str, test):
+        # Evaluate the test once per distinct value (dictionary entry), then map back through the codes
+        if name in self.numeric:
+            data = self.numeric[name]
+            return np.array([test(v) for v in data.tolist()], dtype=bool) & ~np.isnan(data)
+        dictionary = self.dictionaries[name]
+        matches = np.fromiter((test(value) for value in dictionary), dtype=bool, count=len(dictionary))
+        return np.append(matches, False)[self.codes[name]]
+
+    def _row_vector(self, node, index=None) -> Vector:
+        if isinstance(node, exp.Paren):
+            return self._row_vector(node.this, index)
+        if isinstance(node, exp.Column):
+            name = self._column_name(node)
+            if name in self.numeric:
+                data = self.numeric[name]
+                return Vector("num", data if index is None else data[index], is_int=name in self.integers)
+            data = self.codes[name]
+            return Vector("dict", data if index is None else data[index], self.dictionaries[name])
+        if isinstance(node, exp.Literal):
+            size = self.row_count if index is None else len(index)
+            if node.is_string:
+                # constant text column (e.g. a masked value); arithmetic on it is still unsupported
+                return Vector("dict", np.zeros(size, dtype=np.int32), [node.this])
+            return Vector("num", np.full(size, float(node.this)))
+        if isinstance(node, exp.Neg):
+            return Vector("num", -self._numeric(self._row_vector(node.this, index)))
+        return Vector("num", self._arithmetic(node, lambda child: self._numeric(self._row_vector(child, index))))
+
+    def _numeric(self, vector: Vector):
+        if vector.kind != "num":
+            raise Unsupported("arithmetic on text")
+        return vector.data
+
+    def _arithmetic(self, node, evaluate):
+        if isinstance(node, exp.Cast):
+            return evaluate(node.this)
+        if isinstance(node, exp.Paren):
+            return evaluate(node.this)
+        if type(node) in _ARITHMETIC:
+            return _ARITHMETIC[type(node)](evaluate(node.this), evaluate(node.expression))
+        if isinstance(node, exp.Div):
+            numerator, denominator = evaluate(node.this), evaluate(node.expression)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return np.where(denominator == 0, np.nan, numerator / np.where(denominator == 0, 1, denominator))
+        if isinstance(node, exp.Nullif):
+            value, other = evaluate(node.this), evaluate(node.expression)
+            return np.where(value == other, np.nan, value)
+        if isinstance(node, exp.Round):
+            decimals = node.args.get("decimals")
+            return np.round(evaluate(node.this), int(_literal(decimals)) if decimals is not None else 0)
+        if isinstance(node, exp.Abs):
+            return np.abs(evaluate(node.this))
+        if isinstance(node, exp.Coalesce):
+            result = evaluate(node.this)
+            for other in node.expressions:
+                result = np.where(np.isnan(result), evaluate(other), result)
+            return result
+        raise Unsupported(f"expression {node.sql()}")
+
+    def _group(self, keys: list, index):
+        # Mixed-radix combination of the per-key codes, compacted with np.unique
+        if not keys:
+            return np.zeros(len(index), dtype=np.int64), np.zeros(1, dtype=np.int64), 1
+        combined = np.zeros(len(index), dtype=np.int64)
+        for name in keys:
+            if name in self.codes:
+                codes = self.codes[name][index].astype(np.int64) + 1
+                radix = len(self.dictionaries[name]) + 1
+            else:
+                _, codes = np.unique(self.numeric[name][index], return_inverse=True)
+                radix = int(codes.max()) + 1 if len(codes) else 1
+            combined = combined * radix + codes
+        _, first, inverse = np.unique(combined, return_index=True, return_inverse=True)
+        return inverse.ravel(), first, len(first)
+
+    def _group_value(self, node, index, inverse, first, groups, keys) -> Vector:
+        if isinstance(node, exp.Paren):
+            return self._group_value(node.this, index, inverse, first, groups, keys)
+        if isinstance(node, exp.Column):
+            name = self._column_name(node)
+            if name not in keys:
+                raise Unsupported(f"{name} is neither grouped nor aggregated")
+            return self._row_vector(node, index).take(first)
+        if isinstance(node, exp.Count):
+            arg = node.this
+            if isinstance(arg, exp.Distinct):
+                raise Unsupported("COUNT(DISTINCT)")
+            if isinstance(arg, exp.Star) or arg is None:
+                counts = np.bincount(inverse, minlength=groups)
+            else:
+                vector = self._row_vector(arg, index)
+                valid = ~np.isnan(vector.data) if vector.kind == "num" else vector.data >= 0
+                counts = np.bincount(inverse, weights=valid, minlength=groups)
+            return Vector("num", counts.astype(np.float64), is_int=True)
+        if isinstance(node, (exp.Sum, exp.Avg, exp.Min, exp.Max)):
+            values = self._numeric(self._row_vector(node.this, index))
+            valid = ~np.isnan(values)
+            counts = np.bincount(inverse, weights=valid, minlength=groups)
+            if isinstance(node, (exp.Sum, exp.Avg)):
+                sums = np.bincount(inverse, weights=np.where(valid, values, 0.0), minlength=groups)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    result = sums / counts if isinstance(node, exp.Avg) else sums
+            else:
+                order = np.argsort(inverse, kind="stable")
+                starts = np.searchsorted(inverse[order], np.arange(groups))
+                reducer = np.fmin if isinstance(node, exp.Min) else np.fmax
+                result = reducer.reduceat(values[order], starts) if len(order) else np.full(groups, np.nan)
+            return Vector("num", np.where(counts > 0, result, np.nan))
+        if isinstance(node, exp.Literal):
+            if node.is_string:
+                return Vector("dict", np.zeros(groups, dtype=np.int32), [node.this])
+            return Vector("num", np.full(groups, _literal(node)))
+        if isinstance(node, exp.AggFunc):
+            raise Unsupported(f"aggregate {node.key}")
+        return Vector("num", self._arithmetic(
+            node, lambda child: self._numeric(self._group_value(child, index, inverse, first, groups, keys))))
+
+    def stats(self) -> dict:
+        return {"rows": self.row_count, "refreshes": self.refreshes,
+                "queries": self.queries, "fallbacks": self.fallbacks}
+
+_columnar_engine = None
+
+def get_columnar_engine():
+    # None unless COLUMNAR_ENGINE=true
+    global _columnar_engine
+    if not COLUMNAR_ENGINE:
+        return None
+    if _columnar_engine is None:
+        from backend.db import engine
+        _columnar_engine = ColumnarFinancials(engine)
+    return _columnar_engine
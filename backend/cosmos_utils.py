@@ -1,9 +1,15 @@
 # Cosmos DB utilities for chat history
 from azure.cosmos.aio import CosmosClient
-from azure.cosmos import PartitionKey
+from azure.cosmos import PartitionKey, exceptions
+from azure.core import MatchConditions
+import logging
 import os
+import time
+import uuid
+from collections import OrderedDict
 from dotenv import load_dotenv
 from pathlib import Path
+from backend.tracing import count
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 ENV_PATH = BASE_DIR / '.env'
@@ -13,41 +19,351 @@ COSMOS_ENDPOINT = os.getenv("COSMOS_ENDPOINT", "https://your-cosmos-account.docu
 COSMOS_KEY = os.getenv("COSMOS_KEY", "your-cosmos-key")
 COSMOS_DB = os.getenv("COSMOS_DB", "chatdb")
 COSMOS_CONTAINER = os.getenv("COSMOS_CONTAINER", "chathistory")
+# "cosmos" for Azure Cosmos DB, "memory" for the in-process stand-in (local runs, benchmarks)
+CHAT_STORE = os.getenv("CHAT_STORE", "cosmos")
+# Create the database/container at startup instead of expecting `python -m backend.bootstrap` to have run
+COSMOS_PROVISION_ON_STARTUP = os.getenv("COSMOS_PROVISION_ON_STARTUP", "false").lower() == "true"
+# Per-session history cache (sessions kept, newest messages kept per session, staleness bound across instances)
+CHAT_CACHE_SESSIONS = int(os.getenv("CHAT_CACHE_SESSIONS", "1000"))
+CHAT_CACHE_MAX_MESSAGES = int(os.getenv("CHAT_CACHE_MAX_MESSAGES", "500"))
+CHAT_CACHE_TTL_SECONDS = float(os.getenv("CHAT_CACHE_TTL_SECONDS", "60"))
+# Cosmos transactional batches are limited to 100 operations
+COSMOS_BATCH_LIMIT = 100
+# Per-user session index document: most recently active sessions kept (bounds the document size)
+SESSION_INDEX_MAX_SESSIONS = int(os.getenv("SESSION_INDEX_MAX_SESSIONS", "10000"))
+SESSION_INDEX_ID = "session-index"
+SESSION_TITLE_LENGTH = 60
+# Composite index behind the history page order (see _query_history)
+HISTORY_COMPOSITE_INDEX = [{"path": "/created_at", "order": "ascending"}, {"path": "/id", "order": "ascending"}]
+HISTORY_INDEXING_POLICY = {"indexingMode": "consistent", "includedPaths": [{"path": "/*"}],
+                           "compositeIndexes": [HISTORY_COMPOSITE_INDEX]}
 
-async def get_cosmos_container():
-    client = CosmosClient(COSMOS_ENDPOINT, COSMOS_KEY)
+logger = logging.getLogger(__name__)
+
+def _cursor(item: dict) -> float:
+    # created_at is stamped on save; documents written before it existed fall back to _ts (epoch seconds)
+    return item.get("created_at") or item.get("_ts") or 0
+
+def _after(message: dict, after_ts: float, after_id: str = None) -> bool:
+    # History order is (ts, id); the cursor is the last message returned. Without after_id (older clients)
+    # everything at after_ts counts as seen.
+    return message["ts"] > after_ts or (after_id is not None and message["ts"] == after_ts
+                                        and (message.get("id") or "") > after_id)
+
+def _order(message: dict):
+    return message["ts"], message.get("id") or ""
+
+def _message(item: dict) -> dict:
+    return {"id": item.get("id"), "user": item["user"], "assistant": item["assistant"], "timestamp": item.get("timestamp"),
+            "ts": _cursor(item)}
+
+def prepare_message(item: dict) -> dict:
+    # id and created_at are fixed when the message is accepted, so a delayed or retried write is idempotent
+    item = dict(item)
+    item.setdefault("id", str(uuid.uuid4()))
+    item.setdefault("created_at", time.time())
+    return item
+
+def _index_partition(user_id: str) -> str:
+    # The index lives in its own logical partition of the chat container, next to the messages
+    return f"session-index:{user_id}"
+
+def _session_entry(entry: dict, items: list) -> dict:
+    # items: new messages of one session, oldest first
+    last_active = _cursor(items[-1])
+    if entry is None:
+        return {"title": (items[0].get("user") or "")[:SESSION_TITLE_LENGTH], "created_at": _cursor(items[0]),
+                "last_active": last_active, "message_count": len(items)}
+    return dict(entry, last_active=max(entry["last_active"], last_active), message_count=entry["message_count"] + len(items))
+
+def _trim_index(doc: dict):
+    sessions = doc["sessions"]
+    if len(sessions) > SESSION_INDEX_MAX_SESSIONS:
+        keep = sorted(sessions, key=lambda sid: sessions[sid]["last_active"], reverse=True)[:SESSION_INDEX_MAX_SESSIONS]
+        doc["sessions"] = {sid: sessions[sid] for sid in keep}
+
+class SessionHistoryCache:
+    # LRU of (session_id, user_id) -> newest messages. An entry holds every message with ts > `since`
+    # (None = the whole session), so any read with after_ts >= since is answered without Cosmos.
+    # save_chat_message writes through; the TTL bounds staleness when several instances share a session.
+    def __init__(self, max_sessions: int = CHAT_CACHE_SESSIONS, max_messages: int = CHAT_CACHE_MAX_MESSAGES,
+                 ttl: float = CHAT_CACHE_TTL_SECONDS):
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def _entry(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[2] < time.monotonic():
+            del self._entries[key]
+            return None
+        return entry
+
+    def get(self, key, after_ts: float = None, after_id: str = None):
+        entry = self._entry(key)
+        # messages at exactly `since` may be missing from the entry, so a cursor inside that instant is a miss
+        if entry is None or (entry[0] is not None and (after_ts is None or after_ts < entry[0] or
+                                                       (after_ts == entry[0] and after_id is not None))):
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        messages = entry[1]
+        start = len(messages)
+        while after_ts is not None and start > 0 and _after(messages[start - 1], after_ts, after_id):
+            start -= 1
+        return messages[start:] if after_ts is not None else list(messages)
+
+    def put(self, key, messages: list, since: float = None):
+        messages = list(messages)
+        if len(messages) > self.max_messages:
+            since = messages[-self.max_messages - 1]["ts"]
+            messages = messages[-self.max_messages:]
+        self._entries[key] = [since, messages, time.monotonic() + self.ttl]
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_sessions:
+            self._entries.popitem(last=False)
+
+    def append(self, key, message: dict):
+        entry = self._entry(key)
+        if entry is None:
+            return
+        messages = entry[1]
+        if message.get("id") is not None and any(m.get("id") == message["id"] for m in messages):
+            return
+        messages.append(message)
+        if len(messages) > 1 and _order(messages[-2]) > _order(message):
+            # clock skew between instances
+            messages.sort(key=_order)
+        if len(messages) > self.max_messages:
+            entry[0] = messages[-self.max_messages - 1]["ts"]
+            del messages[:-self.max_messages]
+
+    def stats(self) -> dict:
+        return {"sessions": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+class ChatHistoryRepository:
+    # One pooled CosmosClient and a cached container handle per process; database/container
+    # provisioning is provision_chat_store() (the bootstrap command), never on the request path.
+    def __init__(self, client, container, cache: SessionHistoryCache = None):
+        self.client = client
+        self.container = container
+        self.cache = cache
+
+    @classmethod
+    async def create(cls, client=None, cache: SessionHistoryCache = None, provision: bool = COSMOS_PROVISION_ON_STARTUP):
+        client = client or CosmosClient(COSMOS_ENDPOINT, COSMOS_KEY)
+        if provision:
+            container = await provision_chat_store(client)
+        else:
+            # handles only, no round trip: a missing container surfaces as a 404 on first use
+            container = client.get_database_client(COSMOS_DB).get_container_client(COSMOS_CONTAINER)
+        return cls(client, container, cache if cache is not None else SessionHistoryCache())
+
+    async def close(self):
+        await self.client.close()
+
+    async def save_chat_message(self, item: dict):
+        await self.write_partition([prepare_message(item)])
+
+    async def save_chat_messages(self, items: list):
+        by_session = {}
+        for item in items:
+            by_session.setdefault(item["session_id"], []).append(prepare_message(item))
+        for session_items in by_session.values():
+            await self.write_partition(session_items)
+
+    def remember(self, item: dict):
+        # Makes a message visible to history reads on this instance before it is persisted
+        if self.cache is not None:
+            self.cache.append((item["session_id"], item["user_id"]), _message(item))
+
+    async def write_partition(self, items: list):
+        # Messages of one session (one partition), prepared and oldest first: a single upsert, or transactional
+        # batches of up to 100 upserts, then one index patch per user. Raises if the messages were not written;
+        # retrying is safe because ids are fixed.
+        session_id = items[0]["session_id"]
+        for start in range(0, len(items), COSMOS_BATCH_LIMIT):
+            chunk = items[start:start + COSMOS_BATCH_LIMIT]
+            count("cosmos_round_trips")
+            if len(chunk) == 1:
+                await self.container.upsert_item(chunk[0])
+            else:
+                await self.container.execute_item_batch([("upsert", (item,)) for item in chunk], partition_key=session_id)
+        by_user = {}
+        for item in items:
+            self.remember(item)
+            by_user.setdefault(item["user_id"], []).append(item)
+        for user_items in by_user.values():
+            await self._update_session_index(user_items)
+
+    # --- per-user session index ---
+    async def _update_session_index(self, items: list):
+        # The messages and the index live in different partitions, so they cannot share a transaction. The
+        # index is changed with an atomic server-side patch touching only this session's entry (no read,
+        # no rewrite of the whole document). A failure is logged and repaired by the next backfill.
+        user_id, session_id = items[0]["user_id"], items[0]["session_id"]
+        path = "/sessions/" + session_id.replace("~", "~0").replace("/", "~1")
+        touch = [{"op": "set", "path": f"{path}/last_active", "value": max(_cursor(item) for item in items)},
+                 {"op": "incr", "path": f"{path}/message_count", "value": len(items)}]
+        try:
+            try:
+                count("cosmos_round_trips")
+                await self.container.patch_item(SESSION_INDEX_ID, partition_key=_index_partition(user_id),
+                                                patch_operations=touch, no_response=True)
+            except exceptions.CosmosResourceNotFoundError:
+                # first save since the index was introduced: build it from the messages, this one included
+                await self.backfill_session_index(user_id)
+            except exceptions.CosmosHttpResponseError as e:
+                if e.status_code != 400:
+                    raise
+                # 400: the session has no entry yet. `add` would replace an entry a concurrent first save created
+                # meanwhile, so it only applies while there is none; otherwise (412) that entry is touched.
+                key = session_id.replace("\\", "\\\\").replace('"', '\\"')
+                try:
+                    count("cosmos_round_trips")
+                    await self.container.patch_item(SESSION_INDEX_ID, partition_key=_index_partition(user_id),
+                                                    patch_operations=[{"op": "add", "path": path,
+                                                                       "value": _session_entry(None, items)}],
+                                                    filter_predicate=f'FROM c WHERE NOT IS_DEFINED(c.sessions["{key}"])',
+                                                    no_response=True)
+                except exceptions.CosmosAccessConditionFailedError:
+                    count("cosmos_round_trips")
+                    await self.container.patch_item(SESSION_INDEX_ID, partition_key=_index_partition(user_id),
+                                                    patch_operations=touch, no_response=True)
+        except exceptions.CosmosHttpResponseError as e:
+            logger.warning("Session index for user %s not updated (%s); run the backfill to reconcile", user_id, e)
+
+    async def backfill_session_index(self, user_id: str, overwrite: bool = False) -> dict:
+        # Builds the user's index from their messages (one cross-partition scan). Without overwrite an index
+        # created concurrently by another writer wins.
+        query = "SELECT * FROM c WHERE c.user_id=@user_id"
+        params = [{"name": "@user_id", "value": user_id}]
+        items = self.container.query_items(query=query, parameters=params, enable_cross_partition_query=True)
+        count("cosmos_round_trips")
+        sessions = {}
+        for item in sorted([item async for item in items], key=_cursor):
+            sessions[item["session_id"]] = _session_entry(sessions.get(item["session_id"]), [item])
+        doc = {"id": SESSION_INDEX_ID, "session_id": _index_partition(user_id), "doc_type": "session_index",
+               "owner": user_id, "sessions": sessions}
+        _trim_index(doc)
+        count("cosmos_round_trips")
+        if overwrite:
+            return await self.container.upsert_item(doc)
+        try:
+            return await self.container.create_item(doc)
+        except exceptions.CosmosResourceExistsError:
+            return await self._read_session_index(user_id)
+
+    async def backfill_created_at(self) -> int:
+        # Migration for messages saved before created_at existed: sets it from _ts so history pages (ordered
+        # by created_at) include them. Returns the number of messages updated.
+        query = "SELECT * FROM c WHERE IS_DEFINED(c.assistant) AND NOT IS_DEFINED(c.created_at)"
+        items = self.container.query_items(query=query, enable_cross_partition_query=True)
+        count("cosmos_round_trips")
+        updated = 0
+        async for item in items:
+            await self.container.patch_item(item["id"], partition_key=item["session_id"], no_response=True,
+                                            patch_operations=[{"op": "add", "path": "/created_at", "value": item["_ts"]}])
+            count("cosmos_round_trips")
+            updated += 1
+        return updated
+
+    async def backfill_all_session_indexes(self) -> int:
+        # Migration for existing data: rebuilds every user's index. Returns the number of users indexed.
+        items = self.container.query_items(query="SELECT DISTINCT c.user_id FROM c", enable_cross_partition_query=True)
+        count("cosmos_round_trips")
+        user_ids = [item["user_id"] async for item in items if item.get("user_id")]
+        for user_id in user_ids:
+            await self.backfill_session_index(user_id, overwrite=True)
+        return len(user_ids)
+
+    async def _read_session_index(self, user_id: str) -> dict:
+        count("cosmos_round_trips")
+        return await self.container.read_item(SESSION_INDEX_ID, partition_key=_index_partition(user_id))
+
+    async def list_sessions(self, user_id: str) -> list:
+        # One point read of the user's index; most recently active first
+        try:
+            doc = await self._read_session_index(user_id)
+        except exceptions.CosmosResourceNotFoundError:
+            doc = await self.backfill_session_index(user_id)
+        if len(doc["sessions"]) > SESSION_INDEX_MAX_SESSIONS:
+            # patches only ever add entries; drop the least recently active ones here (a lost race is harmless)
+            _trim_index(doc)
+            try:
+                count("cosmos_round_trips")
+                await self.container.replace_item(SESSION_INDEX_ID, doc, etag=doc["_etag"],
+                                                  match_condition=MatchConditions.IfNotModified)
+            except exceptions.CosmosAccessConditionFailedError:
+                pass
+        sessions = [dict(entry, session_id=session_id) for session_id, entry in doc["sessions"].items()]
+        return sorted(sessions, key=lambda entry: entry["last_active"], reverse=True)
+
+    async def get_chat_history(self, session_id: str, user_id: str, limit: int = None, after_ts: float = None,
+                               after_id: str = None) -> dict:
+        # Messages after the (after_ts, after_id) cursor (all when None), oldest first by (ts, id), at most
+        # `limit`. Continue with after_ts=last_ts, after_id=last_id while has_more; polling with the last seen
+        # cursor returns only new messages.
+        key = (session_id, user_id)
+        messages = self.cache.get(key, after_ts, after_id) if self.cache is not None else None
+        if messages is None:
+            messages = await self._query_history(session_id, user_id, after_ts, after_id, limit + 1 if limit else None)
+            if self.cache is not None and (limit is None or len(messages) <= limit):
+                self.cache.put(key, messages, after_ts)
+        has_more = limit is not None and len(messages) > limit
+        if has_more:
+            messages = messages[:limit]
+        return {"history": messages, "last_ts": messages[-1]["ts"] if messages else after_ts,
+                "last_id": messages[-1]["id"] if messages else after_id, "has_more": has_more}
+
+    async def _query_history(self, session_id: str, user_id: str, after_ts: float = None, after_id: str = None,
+                             top: int = None) -> list:
+        # Single-partition query: session_id is the partition key. Every page uses the same order,
+        # (created_at, id), so a page boundary inside one created_at value neither skips nor repeats messages.
+        # Documents written before created_at existed get it from `python -m backend.bootstrap`.
+        params = [
+            {"name": "@session_id", "value": session_id},
+            {"name": "@user_id", "value": user_id}
+        ]
+        query = "SELECT {top}* FROM c WHERE c.session_id=@session_id AND c.user_id=@user_id"
+        if after_ts is not None and after_id is not None:
+            query += " AND (c.created_at > @after_ts OR (c.created_at = @after_ts AND c.id > @after_id))"
+            params += [{"name": "@after_ts", "value": after_ts}, {"name": "@after_id", "value": after_id}]
+        elif after_ts is not None:
+            query += " AND c.created_at > @after_ts"
+            params.append({"name": "@after_ts", "value": after_ts})
+        query += " ORDER BY c.created_at ASC, c.id ASC"
+        if top:
+            params.append({"name": "@top", "value": top})
+        items = self.container.query_items(query=query.format(top="TOP @top " if top else ""), parameters=params,
+                                           partition_key=session_id)
+        count("cosmos_round_trips")
+        return [_message(item) async for item in items]
+
+    async def get_all_sessions(self, user_id: str):
+        return [entry["session_id"] for entry in await self.list_sessions(user_id)]
+
+async def provision_chat_store(client):
+    # Control-plane calls: creates the chat database and container when missing, returns the container. History
+    # pages are ordered by (created_at, id), which Cosmos only serves with a matching composite index; containers
+    # created before it are updated in place.
     database = await client.create_database_if_not_exists(COSMOS_DB)
     container = await database.create_container_if_not_exists(
-        id=COSMOS_CONTAINER, partition_key=PartitionKey(path="/session_id")
+        id=COSMOS_CONTAINER, partition_key=PartitionKey(path="/session_id"), indexing_policy=HISTORY_INDEXING_POLICY
     )
-    return client, container
-
-async def save_chat_message(item: dict):
-    client, container = await get_cosmos_container()
-    await container.upsert_item(item)
-    await client.close()
-
-async def get_chat_history(session_id: str, user_id: str):
-    client, container = await get_cosmos_container()
-    query = f"SELECT * FROM c WHERE c.session_id=@session_id AND c.user_id=@user_id ORDER BY c._ts ASC"
-    params = [
-        {"name": "@session_id", "value": session_id},
-        {"name": "@user_id", "value": user_id}
-    ]
-    items = container.query_items(query=query, parameters=params, enable_cross_partition_query=True)
-    history = []
-    async for item in items:
-        history.append({"user": item["user"], "assistant": item["assistant"], "timestamp": item.get("timestamp")})
-    await client.close()
-    return history
-
-async def get_all_sessions(user_id: str):
-    client, container = await get_cosmos_container()
-    query = "SELECT DISTINCT c.session_id FROM c WHERE c.user_id=@user_id"
-    params = [{"name": "@user_id", "value": user_id}]
-    items = container.query_items(query=query, parameters=params, enable_cross_partition_query=True)
-    sessions = set()
-    async for item in items:
-        sessions.add(item["session_id"])
-    await client.close()
-    return list(sessions)
+    policy = (await container.read()).get("indexingPolicy") or {}
+    if HISTORY_COMPOSITE_INDEX not in policy.get("compositeIndexes", []):
+        policy["compositeIndexes"] = policy.get("compositeIndexes", []) + [HISTORY_COMPOSITE_INDEX]
+        container = await database.replace_container(container, partition_key=PartitionKey(path="/session_id"),
+                                                     indexing_policy=policy)
+    return container
+
+async def create_chat_repository(provision: bool = COSMOS_PROVISION_ON_STARTUP) -> ChatHistoryRepository:
+    if CHAT_STORE == "memory":
+        from backend.fakes import InMemoryCosmosClient
+        return await ChatHistoryRepository.create(InMemoryCosmosClient(), provision=provision)
+    return await ChatHistoryRepository.create(provision=provision)
@@ -0,0 +1,88 @@
+# Data version per table, bumped in the same transaction as every ingestion that changes the table, so
+# caches keyed on it (the answer cache) never serve results from before a load - in any worker process.
+import os
+import time
+from datetime import datetime, timezone
+from sqlalchemy import Table, Column, String, BigInteger, DateTime, MetaData, select, update
+
+# How long a process trusts the version it last read; ingestions in the same process invalidate it at once
+DATA_VERSION_TTL_SECONDS = float(os.getenv("DATA_VERSION_TTL_SECONDS", "5"))
+
+_version_metadata = MetaData()
+data_versions = Table(
+    'data_versions', _version_metadata,
+    Column('table_name', String(255), primary_key=True),
+    Column('version', BigInteger, nullable=False),
+    Column('updated_at', DateTime),
+)
+
+def rewritten_key(table_name: str) -> str:
+    # The version of the last change that updated or deleted rows (or changed a column's type) instead of only
+    # adding rows; derived stores built from that version or later may add the rows past their last id
+    return f"{table_name}:rewritten"
+
+async def bump_data_version(conn, table_name: str, rewrites: bool = False) -> int:
+    # Call inside the loading transaction, so the new version is visible exactly when the rows are. Returns it.
+    await conn.run_sync(_version_metadata.create_all)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    result = await conn.execute(update(data_versions).where(data_versions.c.table_name == table_name)
+                                .values(version=data_versions.c.version + 1, updated_at=now))
+    if result.rowcount == 0:
+        await conn.execute(data_versions.insert().values(table_name=table_name, version=1, updated_at=now))
+    version = await read_data_version(conn, table_name)
+    if rewrites:
+        await write_data_version(conn, rewritten_key(table_name), version)
+    return version
+
+async def read_data_version(conn, table_name: str) -> int:
+    # The version as the caller's transaction sees it; 0 before the first load
+    await conn.run_sync(_version_metadata.create_all)
+    return (await conn.execute(select(data_versions.c.version)
+                               .where(data_versions.c.table_name == table_name))).scalar() or 0
+
+async def write_data_version(conn, table_name: str, version: int):
+    # For stores derived from a table and shared through the database (rollup tables): the table's version they
+    # were built from, recorded under their own name in the same transaction as the rebuild
+    await conn.run_sync(_version_metadata.create_all)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    result = await conn.execute(update(data_versions).where(data_versions.c.table_name == table_name)
+                                .values(version=version, updated_at=now))
+    if result.rowcount == 0:
+        await conn.execute(data_versions.insert().values(table_name=table_name, version=version, updated_at=now))
+
+class DataVersions:
+    def __init__(self, engine, ttl: float = DATA_VERSION_TTL_SECONDS):
+        self.engine = engine
+        self.ttl = ttl
+        self.reads = 0
+        self._versions = {}
+        self._created = False
+
+    async def get(self, table_name: str) -> int:
+        cached = self._versions.get(table_name)
+        if cached is not None and time.monotonic() - cached[1] < self.ttl:
+            return cached[0]
+        self.reads += 1
+        async with self.engine.begin() as conn:
+            if not self._created:
+                await conn.run_sync(_version_metadata.create_all)
+                self._created = True
+            version = (await conn.execute(select(data_versions.c.version)
+                                          .where(data_versions.c.table_name == table_name))).scalar() or 0
+        self._versions[table_name] = (version, time.monotonic())
+        return version
+
+    def invalidate(self, table_name: str = None):
+        if table_name is None:
+            self._versions.clear()
+        else:
+            self._versions.pop(table_name, None)
+
+_data_versions = None
+
+def get_data_versions() -> DataVersions:
+    global _data_versions
+    if _data_versions is None:
+        from backend.db import engine
+        _data_versions = DataVersions(engine)
+    return _data_versions
@@ -0,0 +1,407 @@
+# Local in-process stand-ins for cloud services, used by local runs and benchmarks
+import asyncio
+import copy
+import hashlib
+import os
+import re
+import time
+import uuid
+from azure.core import MatchConditions
+from azure.cosmos import exceptions
+from azure.core.exceptions import ResourceNotFoundError
+
+_WHERE = re.compile(r"\bWHERE\b(.*?)(?:\bORDER BY\b|$)", re.IGNORECASE | re.DOTALL)
+_TOKEN = re.compile(r"\s*(?:(\()|(\))|\b(AND|OR|NOT)\b|"
+                    r'IS_DEFINED\(c((?:\.\w+|\["(?:[^"\\]|\\.)*"\])+)\)|'
+                    r"c\.(\w+)\s*(=|!=|>=|<=|>|<)\s*@(\w+))", re.IGNORECASE)
+_PATH_PART = re.compile(r'\.(\w+)|\["((?:[^"\\]|\\.)*)"\]')
+_ORDER_BY = re.compile(r"ORDER BY\s+(.*)$", re.IGNORECASE | re.DOTALL)
+_ORDER_KEY = re.compile(r"c\.(\w+)(?:\s+(ASC|DESC))?", re.IGNORECASE)
+_SELECT = re.compile(r"SELECT\s+(?:TOP\s+@(\w+)\s+)?(DISTINCT\s+)?(.*?)\s+FROM\s+c\b", re.IGNORECASE | re.DOTALL)
+_OPERATORS = {
+    "=": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+}
+
+def _where(query: str, values: dict):
+    # The WHERE clause as a predicate over a document: comparisons with @parameters, IS_DEFINED (of a field or a
+    # path such as c.sessions["id"]), AND/OR/NOT and parentheses (the subset the repositories use)
+    match = _WHERE.search(query)
+    if match is None:
+        return lambda item: True
+    tokens, position, text = [], 0, match.group(1).strip()
+    while position < len(text):
+        token = _TOKEN.match(text, position)
+        if token is None:
+            raise ValueError(f"unsupported query syntax: {text[position:]}")
+        tokens.append(token.groups())
+        position = token.end()
+
+    def parse_or(i):
+        left, i = parse_and(i)
+        while i < len(tokens) and (tokens[i][2] or "").upper() == "OR":
+            right, i = parse_and(i + 1)
+            left = (lambda a, b: lambda item: a(item) or b(item))(left, right)
+        return left, i
+
+    def parse_and(i):
+        left, i = parse_not(i)
+        while i < len(tokens) and (tokens[i][2] or "").upper() == "AND":
+            right, i = parse_not(i + 1)
+            left = (lambda a, b: lambda item: a(item) and b(item))(left, right)
+        return left, i
+
+    def parse_not(i):
+        if (tokens[i][2] or "").upper() == "NOT":
+            operand, i = parse_not(i + 1)
+            return (lambda a: lambda item: not a(item))(operand), i
+        opening, _, _, defined, field, op, param = tokens[i]
+        if opening:
+            inner, i = parse_or(i + 1)
+            return inner, i + 1
+        if defined:
+            parts = [name or re.sub(r"\\(.)", r"\1", quoted) for name, quoted in _PATH_PART.findall(defined)]
+            return (lambda path: lambda item: _defined(item, path))(parts), i + 1
+        return (lambda f, check, value: lambda item: check(item.get(f), value))(field, _OPERATORS[op], values[param]), i + 1
+
+    return parse_or(0)[0]
+
+def _defined(item, path: list) -> bool:
+    for part in path:
+        if not isinstance(item, dict) or part not in item:
+            return False
+        item = item[part]
+    return True
+
+class InMemoryCosmosClient:
+    # Mirrors the subset of azure.cosmos.aio.CosmosClient used by cosmos_utils. Counts control-plane
+    # (database/container provisioning) and data-plane round trips, plus documents examined by queries;
+    # `latency` adds a delay to each call and `unavailable` makes data-plane calls fail.
+    def __init__(self, latency: float = 0.0, partition_key_path: str = "session_id"):
+        self.latency = latency
+        self.partition_key_path = partition_key_path
+        self.control_plane_calls = 0
+        self.data_plane_calls = 0
+        self.cross_partition_queries = 0
+        self.documents_scanned = 0
+        # set to True to simulate an outage: every data-plane call fails with a 503
+        self.unavailable = False
+        self.databases = {}
+
+    async def _round_trip(self, control_plane: bool = False):
+        if control_plane:
+            self.control_plane_calls += 1
+        else:
+            self.data_plane_calls += 1
+            if self.unavailable:
+                raise exceptions.CosmosHttpResponseError(status_code=503, message="Service unavailable")
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def create_database_if_not_exists(self, id, **kwargs):
+        await self._round_trip(control_plane=True)
+        return self.databases.setdefault(id, InMemoryDatabase(self, id))
+
+    def get_database_client(self, database):
+        return self.databases.setdefault(database, InMemoryDatabase(self, database))
+
+    async def close(self):
+        pass
+
+class InMemoryDatabase:
+    def __init__(self, client, id):
+        self.client = client
+        self.id = id
+        self.containers = {}
+
+    async def create_container_if_not_exists(self, id, partition_key=None, indexing_policy=None, **kwargs):
+        await self.client._round_trip(control_plane=True)
+        if id not in self.containers:
+            self.containers[id] = InMemoryContainer(self.client, id, indexing_policy)
+        return self.containers[id]
+
+    async def replace_container(self, container, partition_key=None, indexing_policy=None, **kwargs):
+        await self.client._round_trip(control_plane=True)
+        container = self.containers[getattr(container, "id", container)]
+        container.indexing_policy = copy.deepcopy(indexing_policy)
+        return container
+
+    def get_container_client(self, container):
+        return self.containers.setdefault(container, InMemoryContainer(self.client, container))
+
+class InMemoryContainer:
+    def __init__(self, client, id, indexing_policy=None):
+        self.client = client
+        self.id = id
+        self.items = {}
+        self.indexing_policy = copy.deepcopy(indexing_policy)
+        self._clock = 0
+
+    async def read(self, **kwargs):
+        # Container properties; only the indexing policy is modelled
+        await self.client._round_trip(control_plane=True)
+        return {"id": self.id, "indexingPolicy": copy.deepcopy(self.indexing_policy or {"indexingMode": "consistent"})}
+
+    def _stamp(self, body):
+        # _ts is a monotonically increasing counter here so ORDER BY c._ts is deterministic
+        self._clock = max(self._clock + 1, int(time.time()))
+        item = copy.deepcopy(dict(body))
+        item["_ts"] = self._clock
+        item["_etag"] = uuid.uuid4().hex
+        return item
+
+    def _key(self, body):
+        return (body[self.client.partition_key_path], body["id"])
+
+    async def upsert_item(self, body, **kwargs):
+        await self.client._round_trip()
+        item = self._stamp(body)
+        self.items[self._key(item)] = item
+        return copy.deepcopy(item)
+
+    async def create_item(self, body, **kwargs):
+        await self.client._round_trip()
+        if self._key(body) in self.items:
+            raise exceptions.CosmosResourceExistsError(status_code=409, message="Entity with the specified id already exists")
+        item = self._stamp(body)
+        self.items[self._key(item)] = item
+        return copy.deepcopy(item)
+
+    async def read_item(self, item, partition_key, **kwargs):
+        await self.client._round_trip()
+        stored = self.items.get((partition_key, item))
+        if stored is None:
+            raise exceptions.CosmosResourceNotFoundError(status_code=404, message="Entity with the specified id does not exist")
+        return copy.deepcopy(stored)
+
+    async def replace_item(self, item, body, etag=None, match_condition=None, **kwargs):
+        await self.client._round_trip()
+        stored = self.items.get(self._key(body))
+        if stored is None:
+            raise exceptions.CosmosResourceNotFoundError(status_code=404, message="Entity with the specified id does not exist")
+        if match_condition == MatchConditions.IfNotModified and stored["_etag"] != etag:
+            raise exceptions.CosmosAccessConditionFailedError(status_code=412, message="Precondition failed")
+        replaced = self._stamp(body)
+        self.items[self._key(replaced)] = replaced
+        return copy.deepcopy(replaced)
+
+    async def execute_item_batch(self, batch_operations, partition_key, **kwargs):
+        # Transactional batch: all operations target one partition and apply together (upsert/create only)
+        await self.client._round_trip()
+        if len(batch_operations) > 100:
+            raise exceptions.CosmosHttpResponseError(status_code=400, message="batch exceeds 100 operations")
+        staged = []
+        for operation, args in batch_operations:
+            body = args[0]
+            if body[self.client.partition_key_path] != partition_key:
+                raise exceptions.CosmosHttpResponseError(status_code=400, message="partition key mismatch")
+            if operation == "create" and (self._key(body) in self.items or any(self._key(s) == self._key(body) for s in staged)):
+                raise exceptions.CosmosBatchOperationError(error_index=len(staged), headers={}, status_code=409,
+                                                           message="conflict", operation_responses=[])
+            staged.append(self._stamp(body))
+        for item in staged:
+            self.items[self._key(item)] = item
+        return [{"statusCode": 200, "resourceBody": copy.deepcopy(item)} for item in staged]
+
+    async def patch_item(self, item, partition_key, patch_operations, no_response=None, filter_predicate=None, **kwargs):
+        # add/set/incr/remove on JSON-pointer paths; like Cosmos, a missing parent path is a 400 and a document
+        # not matching filter_predicate ("FROM c WHERE ...") a 412
+        await self.client._round_trip()
+        stored = self.items.get((partition_key, item))
+        if stored is None:
+            raise exceptions.CosmosResourceNotFoundError(status_code=404, message="Entity with the specified id does not exist")
+        if filter_predicate is not None and not _where(filter_predicate, {})(stored):
+            raise exceptions.CosmosAccessConditionFailedError(status_code=412, message="Precondition failed")
+        for operation in patch_operations:
+            *parents, leaf = [part.replace("~1", "/").replace("~0", "~") for part in operation["path"].split("/")[1:]]
+            target = stored
+            for part in parents:
+                if not isinstance(target, dict) or part not in target:
+                    raise exceptions.CosmosHttpResponseError(status_code=400, message=f"path {operation['path']} not found")
+                target = target[part]
+            if operation["op"] == "incr":
+                target[leaf] = target.get(leaf, 0) + operation["value"]
+            elif operation["op"] == "remove":
+                target.pop(leaf, None)
+            else:
+                target[leaf] = copy.deepcopy(operation["value"])
+        self._clock = max(self._clock + 1, int(time.time()))
+        stored["_ts"] = self._clock
+        stored["_etag"] = uuid.uuid4().hex
+        return None if no_response else copy.deepcopy(stored)
+
+    def query_items(self, query, parameters=None, partition_key=None, enable_cross_partition_query=None, **kwargs):
+        return self._query(query, parameters or [], partition_key)
+
+    async def _query(self, query, parameters, partition_key):
+        await self.client._round_trip()
+        if partition_key is None:
+            self.client.cross_partition_queries += 1
+        values = {p["name"].lstrip("@"): p["value"] for p in parameters}
+        where = _where(query, values)
+        pk_path = self.client.partition_key_path
+        scanned = [item for item in self.items.values() if partition_key is None or item.get(pk_path) == partition_key]
+        self.client.documents_scanned += len(scanned)
+        matched = [item for item in scanned if where(item)]
+        order = _ORDER_BY.search(query)
+        if order:
+            keys = _ORDER_KEY.findall(order.group(1))
+            # like Cosmos, ORDER BY drops documents that do not have the fields
+            matched = [item for item in matched if all(item.get(field) is not None for field, _ in keys)]
+            for field, direction in reversed(keys):
+                matched.sort(key=lambda item: item[field], reverse=direction.upper() == "DESC")
+        select = _SELECT.search(query)
+        top, distinct, projection = select.group(1), bool(select.group(2)), select.group(3).strip()
+        if top:
+            matched = matched[:values[top]]
+        if projection != "*":
+            fields = [name.strip()[2:] for name in projection.split(",")]
+            matched = [{field: item.get(field) for field in fields} for item in matched]
+        seen = set()
+        for item in matched:
+            if distinct:
+                key = tuple(sorted(item.items()))
+                if key in seen:
+                    continue
+                seen.add(key)
+            yield dict(item)
+
+class LocalBlobServiceClient:
+    # Mirrors the subset of azure.storage.blob.aio.BlobServiceClient used by storage_utils, backed by a
+    # directory: <root>/<container>/<blob name>. ETags change whenever a file's size or mtime changes.
+    # `latency` adds a delay to each call; `round_trips` counts list/download calls.
+    def __init__(self, root: str, latency: float = 0.0):
+        self.root = root
+        self.latency = latency
+        self.round_trips = 0
+
+    async def _round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def get_container_client(self, container):
+        return LocalContainerClient(self, container)
+
+    async def close(self):
+        pass
+
+class LocalBlobProperties:
+    def __init__(self, name: str, path: str):
+        stat = os.stat(path)
+        self.name = name
+        self.size = stat.st_size
+        self.etag = '"' + hashlib.md5(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest() + '"'
+
+class LocalContainerClient:
+    def __init__(self, service, container):
+        self.service = service
+        self.container_name = container
+        self.path = os.path.join(service.root, container)
+
+    async def list_blobs(self, name_starts_with=None, **kwargs):
+        await self.service._round_trip()
+        for directory, _, files in sorted(os.walk(self.path)):
+            for file_name in sorted(files):
+                path = os.path.join(directory, file_name)
+                name = os.path.relpath(path, self.path).replace(os.sep, "/")
+                if name_starts_with is None or name.startswith(name_starts_with):
+                    yield LocalBlobProperties(name, path)
+
+    def get_blob_client(self, blob):
+        return LocalBlobClient(self, blob)
+
+class LocalBlobClient:
+    def __init__(self, container, blob):
+        self.container = container
+        self.blob_name = blob
+        self.path = os.path.join(container.path, *blob.split("/"))
+
+    async def download_blob(self, **kwargs):
+        await self.container.service._round_trip()
+        if not os.path.isfile(self.path):
+            raise ResourceNotFoundError(message=f"The specified blob does not exist: {self.blob_name}")
+        return LocalBlobDownloader(self.blob_name, self.path)
+
+class LocalBlobDownloader:
+    CHUNK_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        self.properties = LocalBlobProperties(name, path)
+
+    async def readall(self):
+        with open(self.path, "rb") as blob:
+            return blob.read()
+
+    async def chunks(self):
+        with open(self.path, "rb") as blob:
+            while True:
+                data = blob.read(self.CHUNK_SIZE)
+                if not data:
+                    return
+                yield data
+
+class FakeChatModel:
+    # Offline stand-in for AzureOpenAIModel. `latency` is time to first token, `tokens_per_second` paces the
+    # completion, `rate_limit_every` makes every Nth call raise a 429. `responder(messages)` overrides the
+    # canned answers. Tracks calls and peak in-flight concurrency for load tests.
+    DEFAULT_SQL = "SELECT project, SUM(revenue) AS revenue FROM financials GROUP BY project"
+
+    def __init__(self, latency: float = 0.2, tokens_per_second: float = None, rate_limit_every: int = 0,
+                 responder=None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.rate_limit_every = rate_limit_every
+        self.responder = responder
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def respond(self, messages: list) -> str:
+        if self.responder:
+            return self.responder(messages)
+        if "SQL expert" in messages[0]["content"]:
+            return self.DEFAULT_SQL
+        return "Summary: revenue is concentrated in the top projects. (offline fake model)"
+
+    async def complete(self, deployment: str, messages: list, max_tokens: int, temperature: float):
+        from backend.llm_client import LLMResponse, RateLimitedError
+        self.calls += 1
+        if self.rate_limit_every and self.calls % self.rate_limit_every == 0:
+            raise RateLimitedError("fake 429", retry_after=0.0)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            text = self.respond(messages)
+            tokens = text.split()
+            delay = self.latency + (len(tokens) / self.tokens_per_second if self.tokens_per_second else 0.0)
+            await asyncio.sleep(delay)
+            prompt_tokens = sum(len(m["content"].split()) for m in messages)
+            return LLMResponse(text, prompt_tokens, len(tokens))
+        finally:
+            self.in_flight -= 1
+
+    async def stream(self, deployment: str, messages: list, max_tokens: int, temperature: float):
+        from backend.llm_client import RateLimitedError
+        self.calls += 1
+        if self.rate_limit_every and self.calls % self.rate_limit_every == 0:
+            raise RateLimitedError("fake 429", retry_after=0.0)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            for i, token in enumerate(self.respond(messages).split(" ")):
+                if self.tokens_per_second:
+                    await asyncio.sleep(1 / self.tokens_per_second)
+                yield token if i == 0 else " " + token
+        finally:
+            self.in_flight -= 1
+
+    async def close(self):
+        pass
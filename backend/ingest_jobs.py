@@ -0,0 +1,214 @@
+# Ingestion jobs: every workbook under a container/prefix is downloaded concurrently, parsed sheet by sheet
+# in a process pool and loaded with bounded concurrency; workbooks whose ETag is already loaded are skipped.
+import asyncio
+import logging
+import os
+import shutil
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from backend.storage_utils import (list_excel_blobs, download_blob_to_file, list_sheet_names, read_excel_sheet,
+                                   iter_parquet_chunks, file_digest)
+from backend.ingest_utils import (read_ledger, load_frames, after_ingest, parse_hints, has_changes, rewrites_rows,
+                                  delta_key, ingest_table, INGEST_CHUNK_SIZE, INGEST_MODE)
+from backend.tracing import stage
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+# Processes parsing workbooks (Excel parsing is CPU-bound); 0 parses in threads instead
+INGEST_PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+INGEST_DOWNLOAD_CONCURRENCY = int(os.getenv("INGEST_DOWNLOAD_CONCURRENCY", "8"))
+# Concurrent load transactions against the database
+INGEST_LOAD_CONCURRENCY = int(os.getenv("INGEST_LOAD_CONCURRENCY", "4"))
+# Downloaded workbooks are spooled here and deleted once loaded
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR", str(BASE_DIR / ".cache" / "ingest"))
+# Finished jobs kept for the status endpoints
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "100"))
+
+logger = logging.getLogger(__name__)
+
+class IngestionJob:
+    # Job status: queued -> running -> succeeded | partial (some workbooks failed) | failed.
+    # Workbook status: pending -> downloading -> parsing -> loading -> loaded, or skipped / failed.
+    def __init__(self, container_name: str, prefix: str = None, table_name: str = 'financials',
+                 sheet_names: list = None, force: bool = False, known_columns_only: bool = False,
+                 mode: str = None, natural_key: list = None, delete_missing: bool = False, delete_scope: list = None):
+        self.id = uuid.uuid4().hex
+        self.container_name = container_name
+        self.prefix = prefix
+        self.table_name = ingest_table(table_name)
+        self.sheet_names = sheet_names
+        self.force = force
+        # parse only the columns the table already has (usecols from the schema catalog)
+        self.known_columns_only = known_columns_only
+        self.dtypes = None
+        # delta mode merges each workbook on the natural key; see ingest_utils.DeltaMerge
+        self.mode = mode or INGEST_MODE
+        self.natural_key = delta_key(self.mode, natural_key)
+        self.delete_missing = delete_missing
+        self.delete_scope = delete_scope
+        self.status = "queued"
+        # set once a workbook changed the table (rebuild: updated or deleted rows); derived data is refreshed
+        # at the end of the job
+        self.changed = False
+        self.rebuild = False
+        self.error = None
+        self.blobs = {}
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.task = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "partial", "failed")
+
+    def summary(self, with_blobs: bool = True) -> dict:
+        progress = {}
+        for entry in self.blobs.values():
+            progress[entry["status"]] = progress.get(entry["status"], 0) + 1
+        elapsed = (self.finished_at or time.time()) - self.started_at if self.started_at else None
+        summary = {"job_id": self.id, "status": self.status, "container_name": self.container_name,
+                   "prefix": self.prefix, "table_name": self.table_name, "mode": self.mode,
+                   "blobs_total": len(self.blobs), "progress": progress,
+                   "rows": sum(entry["rows"] for entry in self.blobs.values()),
+                   "seconds": round(elapsed, 3) if elapsed is not None else None, "error": self.error}
+        if self.natural_key:
+            summary["changes"] = {name: sum(entry["changes"][name] for entry in self.blobs.values() if entry.get("changes"))
+                                  for name in ("inserted", "updated", "unchanged", "deleted", "duplicates")}
+        if with_blobs:
+            summary["blobs"] = [{"name": name, **entry} for name, entry in self.blobs.items()]
+        return summary
+
+class IngestionScheduler:
+    def __init__(self, engine, parse_workers: int = INGEST_PARSE_WORKERS,
+                 download_concurrency: int = INGEST_DOWNLOAD_CONCURRENCY,
+                 load_concurrency: int = INGEST_LOAD_CONCURRENCY, spool_dir: str = INGEST_SPOOL_DIR,
+                 chunk_size: int = INGEST_CHUNK_SIZE, history: int = INGEST_JOB_HISTORY):
+        self.engine = engine
+        self.parse_workers = parse_workers
+        self.spool_dir = Path(spool_dir)
+        self.chunk_size = chunk_size
+        self.history = history
+        self.jobs = OrderedDict()
+        self._pool = None
+        self._downloads = asyncio.Semaphore(download_concurrency)
+        self._loads = asyncio.Semaphore(load_concurrency)
+        # parsed workbooks waiting for a load slot are held in memory; this bounds how many
+        self._in_flight = asyncio.Semaphore(max(parse_workers, 1) + load_concurrency)
+
+    def submit(self, job: IngestionJob) -> IngestionJob:
+        self.jobs[job.id] = job
+        finished = [job_id for job_id, old in self.jobs.items() if old.done]
+        for job_id in finished[:max(len(self.jobs) - self.history, 0)]:
+            del self.jobs[job_id]
+        job.task = asyncio.create_task(self._run(job))
+        return job
+
+    def get(self, job_id: str):
+        return self.jobs.get(job_id)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+        return self._pool
+
+    async def close(self):
+        for job in self.jobs.values():
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
+        await asyncio.gather(*(job.task for job in self.jobs.values() if job.task is not None), return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _run(self, job: IngestionJob):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            blobs = await list_excel_blobs(job.container_name, job.prefix)
+            ledger = await read_ledger(self.engine, job.table_name)
+            job.dtypes = await parse_hints(job.table_name)
+            for blob in blobs:
+                unchanged = not job.force and ledger.get(f"{job.container_name}/{blob['name']}") == blob["etag"]
+                job.blobs[blob["name"]] = {"etag": blob["etag"], "size": blob["size"], "rows": 0,
+                                           "status": "skipped" if unchanged else "pending", "sheets": None,
+                                           "changes": None, "seconds": None, "error": None}
+            pending = [name for name, entry in job.blobs.items() if entry["status"] == "pending"]
+            await asyncio.gather(*(self._ingest_blob(job, name, index) for index, name in enumerate(pending)))
+            if job.changed:
+                with stage("ingest_refresh"):
+                    await after_ingest(job.table_name, rebuild=job.rebuild)
+            failed = sum(1 for name in pending if job.blobs[name]["status"] == "failed")
+            job.status = "succeeded" if not failed else "failed" if failed == len(pending) else "partial"
+        except Exception as e:
+            logger.exception("Ingestion job %s failed", job.id)
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            shutil.rmtree(self.spool_dir / job.id, ignore_errors=True)
+            logger.info("Ingestion job %s %s: %s", job.id, job.status, job.summary(with_blobs=False)["progress"])
+
+    async def _ingest_blob(self, job: IngestionJob, name: str, index: int):
+        entry = job.blobs[name]
+        started = time.perf_counter()
+        path = self.spool_dir / job.id / f"{index}{Path(name).suffix}"
+        try:
+            async with self._downloads:
+                entry["status"] = "downloading"
+                with stage("ingest_download"):
+                    etag = await download_blob_to_file(job.container_name, name, str(path))
+            async with self._in_flight:
+                entry["status"] = "parsing"
+                with stage("ingest_parse"):
+                    sheets = job.sheet_names or await asyncio.to_thread(list_sheet_names, str(path))
+                    digest = await asyncio.to_thread(file_digest, str(path))
+                    usecols = list(job.dtypes) if job.known_columns_only and job.dtypes else None
+                    parsed = await asyncio.gather(*(self._parse(str(path), sheet, digest, job.dtypes, usecols)
+                                                    for sheet in sheets))
+                path.unlink(missing_ok=True)
+                entry["status"] = "loading"
+                async with self._loads:
+                    with stage("ingest_load"):
+                        stats = await load_frames(self.engine, job.table_name, [frame for frames in parsed for frame in frames],
+                                                  source=f"{job.container_name}/{name}", etag=etag,
+                                                  natural_key=job.natural_key, delete_missing=job.delete_missing,
+                                                  delete_scope=job.delete_scope)
+            job.changed = job.changed or has_changes(stats)
+            job.rebuild = job.rebuild or rewrites_rows(stats)
+            rows = stats.pop("rows")
+            entry.update(status="loaded", etag=etag, rows=rows, sheets=list(sheets), changes=stats or None)
+        except Exception as e:
+            logger.warning("Ingestion job %s: %s failed: %s", job.id, name, e)
+            entry.update(status="failed", error=str(e))
+        finally:
+            entry["seconds"] = round(time.perf_counter() - started, 3)
+            path.unlink(missing_ok=True)
+
+    async def _parse(self, path: str, sheet_name: str, digest: str, dtypes: dict, usecols: list) -> list:
+        args = (read_excel_sheet, path, sheet_name, self.chunk_size, digest, dtypes, usecols)
+        if self.parse_workers <= 0:
+            result = await asyncio.to_thread(*args)
+        else:
+            result = await asyncio.get_running_loop().run_in_executor(self._get_pool(), *args)
+        if isinstance(result, str):
+            # staged Parquet path: read back here, memory-mapped
+            return await asyncio.to_thread(lambda: list(iter_parquet_chunks(result, self.chunk_size)))
+        return result
+
+_ingestion_scheduler = None
+
+def get_ingestion_scheduler() -> IngestionScheduler:
+    global _ingestion_scheduler
+    if _ingestion_scheduler is None:
+        from backend.db import engine
+        _ingestion_scheduler = IngestionScheduler(engine)
+    return _ingestion_scheduler
+
+async def close_ingestion_scheduler():
+    global _ingestion_scheduler
+    if _ingestion_scheduler is not None:
+        await _ingestion_scheduler.close()
+        _ingestion_scheduler = None
@@ -0,0 +1,642 @@
+# Bulk Excel ingestion pipeline: chunked reads, type inference widened across chunks, COPY/executemany loads
+import asyncio
+import logging
+import os
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+from sqlalchemy import (MetaData, Table, Column, Integer, BigInteger, Float, Numeric, Date, DateTime, Boolean, String,
+                        Text, bindparam, inspect, select, text)
+from sqlalchemy.types import to_instance
+from backend.storage_utils import iter_staged_chunks
+from backend.schema_catalog import get_schema_catalog, INTERNAL_COLUMNS
+from backend.columnar import get_columnar_engine
+from backend.rollups import get_rollup_router
+from backend.data_version import bump_data_version, read_data_version, get_data_versions
+from backend.tracing import stage, count
+
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "10000"))
+# "append" inserts every row; "delta" merges on the natural key (new rows inserted, changed rows updated)
+INGEST_MODE = os.getenv("INGEST_MODE", "append")
+INGEST_MODES = ("append", "delta")
+INGEST_NATURAL_KEY = [name.strip() for name in os.getenv("INGEST_NATURAL_KEY", "project,period").split(",") if name.strip()]
+# Tables ingestion requests may load into; everything else (the ledger, data versions, rollups) is off limits
+INGEST_TABLES = [name.strip() for name in os.getenv("INGEST_TABLES", "financials").split(",") if name.strip()]
+ROW_HASH_COLUMN, KEY_HASH_COLUMN = INTERNAL_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Which blob version (ETag) was last loaded into which table; ingestion jobs skip unchanged workbooks
+_ledger_metadata = MetaData()
+ingest_ledger = Table(
+    'ingest_ledger', _ledger_metadata,
+    Column('source', String(1024), primary_key=True),
+    Column('table_name', String(255), primary_key=True),
+    Column('etag', String(255), nullable=False),
+    Column('rows', BigInteger),
+    Column('ingested_at', DateTime),
+)
+_table_locks = {}
+# (database, table, natural key) -> (data version, key index) of the last delta load this process committed; a
+# load that finds the same version uses it instead of reading every row's hashes back (see DeltaMerge)
+_key_indexes = {}
+
+def infer_column_types(df: pd.DataFrame) -> dict:
+    # Types for a new table (or new columns) from one chunk; later chunks widen them (see column_types_for)
+    return {col: _infer_type(df[col].dropna()) for col in df.columns}
+
+def _infer_type(series: pd.Series):
+    if series.empty:
+        return Text
+    if pd.api.types.is_bool_dtype(series):
+        return Boolean
+    if pd.api.types.is_integer_dtype(series):
+        return BigInteger
+    if pd.api.types.is_float_dtype(series):
+        return Float
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return DateTime
+    if pd.to_numeric(series, errors="coerce").notna().all():
+        return Float
+    return Text
+
+def _kind(col_type):
+    # What a column type (class or reflected instance) counts as when widening: Boolean, BigInteger, Float,
+    # DateTime or Text
+    col_type = col_type if isinstance(col_type, type) else type(col_type)
+    if issubclass(col_type, Boolean):
+        return Boolean
+    if issubclass(col_type, Integer):
+        return BigInteger
+    if issubclass(col_type, (Float, Numeric)):
+        return Float
+    if issubclass(col_type, (DateTime, Date)):
+        return DateTime
+    return Text
+
+def _widest(col_type, other):
+    # Numbers widen to Float, anything else that differs to Text
+    kinds = {_kind(col_type), _kind(other)}
+    if len(kinds) == 1:
+        return col_type
+    if kinds <= {Boolean, BigInteger, Float}:
+        return Float if Float in kinds else BigInteger
+    return Text
+
+def _fits(series: pd.Series, col_type) -> bool:
+    # Whether every (non-null) value survives coercion to col_type (see _normalize_series) instead of turning into
+    # NULL - text in a numeric column - or being rounded - fractions in an integer one
+    kind = _kind(col_type)
+    if kind is Text:
+        return True
+    if kind is Boolean:
+        return pd.api.types.is_bool_dtype(series) or all(isinstance(value, (bool, np.bool_)) for value in series)
+    if kind is DateTime:
+        return pd.api.types.is_datetime64_any_dtype(series) or pd.to_datetime(series, errors="coerce").notna().all()
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series) or \
+            (kind is Float and pd.api.types.is_float_dtype(series)):
+        return True
+    numbers = pd.to_numeric(series, errors="coerce")
+    return bool(numbers.notna().all() and (kind is Float or (numbers % 1 == 0).all()))
+
+def column_types_for(df: pd.DataFrame, known: dict = None) -> dict:
+    # The types df's columns need given the ones they already have (known: {column: type}, e.g. the table's):
+    # inferred for new columns, the known type when every value fits it, otherwise a wider one
+    known = known or {}
+    types = {}
+    for col in df.columns:
+        if col == 'id':
+            continue
+        current = known.get(col)
+        if current is not None and _kind(current) is Text:
+            types[col] = current
+            continue
+        series = df[col].dropna()
+        if current is None:
+            types[col] = _infer_type(series)
+        elif _fits(series, current):
+            types[col] = current
+        else:
+            types[col] = _widest(current, _infer_type(series))
+    return types
+
+def column_changes(df: pd.DataFrame, known: dict) -> dict:
+    # Only the columns df needs added or widened; {} when it fits the known types
+    return {col: col_type for col, col_type in column_types_for(df, known).items()
+            if col not in known or _kind(col_type) is not _kind(known[col])}
+
+def table_column_types(table: Table) -> dict:
+    return {col.name: col.type for col in table.columns}
+
+def dtype_hints(table) -> dict:
+    # Parser dtype hints ({column: kind}) for the columns a catalogued table already has
+    hints = {}
+    for col in table.columns:
+        data_type = col.data_type.lower()
+        if col.name == 'id':
+            continue
+        if "int" in data_type:
+            hints[col.name] = "int"
+        elif any(token in data_type for token in ("float", "double", "numeric", "decimal", "real")):
+            hints[col.name] = "float"
+        elif "bool" in data_type:
+            hints[col.name] = "bool"
+        elif "date" in data_type or "time" in data_type:
+            hints[col.name] = "datetime"
+        else:
+            hints[col.name] = "text"
+    return hints
+
+_HINT_TYPES = {"int": BigInteger, "float": Float, "bool": Boolean, "datetime": DateTime, "text": Text}
+
+async def parse_hints(table_name: str) -> dict:
+    # {} for a table that does not exist yet (types are then inferred from the first chunk)
+    try:
+        return dtype_hints(await get_schema_catalog().get(table_name))
+    except Exception as e:
+        logger.info("No parse hints for %s: %s", table_name, e)
+        return {}
+
+def _table_exists(sync_conn, table_name):
+    return inspect(sync_conn).has_table(table_name)
+
+async def prepare_table(conn, table_name: str, column_types: dict, natural_key: list = None) -> Table:
+    # Create the table on first load; on later loads add any new Excel headers as columns and reflect the result.
+    # Delta loads (natural_key set) also get the row- and key-hash columns and an index on the key hash, which
+    # merges match on (see DeltaMerge.merge).
+    if natural_key:
+        missing_key = [col for col in natural_key if col not in column_types]
+        if missing_key:
+            raise ValueError(f"Natural key column(s) {', '.join(missing_key)} not found in the workbook")
+        column_types = {**column_types, ROW_HASH_COLUMN: BigInteger, KEY_HASH_COLUMN: BigInteger}
+    table = await _create_or_extend(conn, table_name, column_types)
+    if natural_key:
+        preparer = conn.dialect.identifier_preparer
+        index_name = f"ix_{table_name}_{KEY_HASH_COLUMN}"[:63]
+        await conn.execute(text(f"CREATE INDEX IF NOT EXISTS {preparer.quote(index_name)} ON {preparer.quote(table_name)} "
+                                f"({preparer.quote(KEY_HASH_COLUMN)})"))
+    return table
+
+async def _create_or_extend(conn, table_name: str, column_types: dict) -> Table:
+    # Existing columns whose type is narrower than the requested one are widened (see _widest)
+    metadata = MetaData()
+    if not await conn.run_sync(_table_exists, table_name):
+        columns = [Column(col, col_type) for col, col_type in column_types.items() if col != 'id']
+        table = Table(table_name, metadata, Column('id', Integer, primary_key=True, autoincrement=True), *columns)
+        await conn.run_sync(metadata.create_all)
+        return table
+    table = await conn.run_sync(lambda sync_conn: Table(table_name, metadata, autoload_with=sync_conn))
+    preparer = conn.dialect.identifier_preparer
+    missing = [col for col in column_types if col not in table.c]
+    for col in missing:
+        col_type = to_instance(column_types[col]).compile(dialect=conn.dialect)
+        await conn.execute(text(f"ALTER TABLE {preparer.quote(table_name)} ADD COLUMN {preparer.quote(col)} {col_type}"))
+    widened = {col: _widest(table.c[col].type, col_type) for col, col_type in column_types.items()
+               if col in table.c and col != 'id'}
+    widened = {col: col_type for col, col_type in widened.items() if _kind(col_type) is not _kind(table.c[col].type)}
+    for col, col_type in widened.items():
+        await _widen_column(conn, table_name, col, col_type)
+    if widened:
+        if KEY_HASH_COLUMN in table.c:
+            # hashes of the old values would not match the same values coerced to the new type; DeltaMerge
+            # backfills the key hashes, and rows without a row hash count as changed
+            await conn.execute(table.update().values({ROW_HASH_COLUMN: None, KEY_HASH_COLUMN: None}))
+        # cached key indexes (and answers) of other processes are keyed on the data version
+        await bump_data_version(conn, table_name, rewrites=True)
+    if missing or widened:
+        metadata = MetaData()
+        table = await conn.run_sync(lambda sync_conn: Table(table_name, metadata, autoload_with=sync_conn))
+    return table
+
+async def _widen_column(conn, table_name: str, col: str, col_type):
+    preparer = conn.dialect.identifier_preparer
+    target, column = preparer.quote(table_name), preparer.quote(col)
+    type_sql = to_instance(col_type).compile(dialect=conn.dialect)
+    logger.info("Widening %s.%s to %s", table_name, col, type_sql)
+    if conn.dialect.name == "sqlite":
+        # SQLite cannot change a column's declared type: copy the values into a new column that takes its place
+        # (fails for indexed columns)
+        widened = preparer.quote(f"{col}__widened")
+        await conn.execute(text(f"ALTER TABLE {target} ADD COLUMN {widened} {type_sql}"))
+        await conn.execute(text(f"UPDATE {target} SET {widened} = CAST({column} AS {type_sql})"))
+        await conn.execute(text(f"ALTER TABLE {target} DROP COLUMN {column}"))
+        await conn.execute(text(f"ALTER TABLE {target} RENAME COLUMN {widened} TO {column}"))
+    else:
+        await conn.execute(text(f"ALTER TABLE {target} ALTER COLUMN {column} TYPE {type_sql} USING {column}::{type_sql}"))
+
+def _normalize_series(series: pd.Series, col_type) -> pd.Series:
+    # Vectorised conversion to the column's type, still as a pandas Series (what delta loads hash)
+    if isinstance(col_type, Boolean):
+        return series
+    if isinstance(col_type, (Integer, BigInteger)):
+        return pd.to_numeric(series, errors="coerce").round().astype("Int64")
+    if isinstance(col_type, Float):
+        return pd.to_numeric(series, errors="coerce").astype(float)
+    if isinstance(col_type, DateTime):
+        return pd.to_datetime(series, errors="coerce")
+    # one vectorised isna() instead of a pd.isna() call per cell
+    return series.astype(str).where(series.notna(), None)
+
+def _python_values(values: pd.Series) -> list:
+    # Driver-native Python values of a normalized Series, None for missing
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return [None if missing else v.to_pydatetime() for v, missing in zip(values, values.isna().tolist())]
+    return values.to_numpy(dtype=object, na_value=None).tolist()
+
+def _coerce_series(series: pd.Series, col_type) -> list:
+    return _python_values(_normalize_series(series, col_type))
+
+def coerce_columns(df: pd.DataFrame, table: Table) -> list:
+    # Column-wise conversion to driver-native Python values, one list per df column
+    return [_coerce_series(df[col], table.c[col].type) for col in df.columns]
+
+def coerce_chunk(df: pd.DataFrame, table: Table) -> list:
+    # Row tuples in df column order
+    return list(zip(*coerce_columns(df, table)))
+
+def _hashable(values) -> pd.Series:
+    series = values.reset_index(drop=True) if isinstance(values, pd.Series) else pd.Series(values)
+    # integers hash as floats, so a chunk with empty cells (float64 + NaN) hashes like one without
+    return series.astype("float64") if series.dtype.kind in "iu" else series
+
+def row_hashes(columns: list) -> np.ndarray:
+    # 64-bit hash of each row of the given columns (coerced lists or normalized Series), signed to fit a BIGINT column;
+    # hash_pandas_object uses a fixed key, so equal values hash the same in every process
+    frame = pd.DataFrame({position: _hashable(values) for position, values in enumerate(columns)})
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy().view(np.int64)
+
+async def load_chunk(conn, table: Table, columns: list, records: list):
+    if conn.dialect.driver == "asyncpg":
+        # COPY FROM STDIN (binary) on the transaction's own asyncpg connection
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            table.name, records=records, columns=columns, schema_name=table.schema
+        )
+    else:
+        # Batched executemany fallback for other dialects
+        await conn.execute(table.insert(), [dict(zip(columns, record)) for record in records])
+
+class DeltaMerge:
+    # Delta ingestion inside the load transaction. create() reads (id, row hash, key hash) of every target row;
+    # add() hashes each incoming row (natural key, and the remaining columns) and drops rows whose key and
+    # content are already there, so only new and changed rows are converted to Python values and reach the
+    # temporary staging table. merge() then updates changed rows, inserts new keys and optionally deletes keys
+    # missing from the load - limited to rows sharing a delete_scope value (e.g. region) with it. A 1% change
+    # writes ~1% of rows. The key index is kept per process after commit (publish()) and reused while the
+    # table's data version is unchanged, so the next load reads back only the rows it changed; incoming rows
+    # are still hashed once each.
+    def __init__(self, conn, table: Table, natural_key: list, delete_missing: bool = False, delete_scope: list = None):
+        self.conn = conn
+        self.table = table
+        self.natural_key = natural_key
+        self.delete_missing = delete_missing
+        self.delete_scope = delete_scope or []
+        self.columns = []
+        self.rows = 0
+        self.staged = 0
+        self.unchanged = 0
+        self._loaded_keys = []
+        self._loaded_scopes = []
+        self._index_key = (str(conn.engine.url), table.name, tuple(natural_key))
+        self._version = None
+        self._next = None
+        self.index_reused = False
+        metadata = MetaData()
+        self.staging = Table(f"{table.name}_delta_staging", metadata, Column('_seq', BigInteger),
+                             *[Column(col.name, col.type) for col in table.columns if col.name != 'id'],
+                             prefixes=["TEMPORARY"])
+        self.deletes = Table(f"{table.name}_delta_deletes", metadata, Column('id', BigInteger), prefixes=["TEMPORARY"])
+
+    async def create(self):
+        for temp in (self.staging, self.deletes):
+            await self.conn.run_sync(temp.drop, checkfirst=True)
+            await self.conn.run_sync(temp.create)
+        scope = self.delete_scope if self.delete_missing else []
+        self._version = await read_data_version(self.conn, self.table.name)
+        cached = _key_indexes.get(self._index_key)
+        if cached is not None and cached[0] == self._version and not scope:
+            self._keys, self._ids, self._known, self._hashes = cached[1]
+            self._scopes = None
+            self.index_reused = True
+            return
+        table = self.table.c
+        result = await self.conn.execute(select(table.id, table[ROW_HASH_COLUMN], table[KEY_HASH_COLUMN],
+                                                *[table[col] for col in scope]))
+        columns = list(zip(*result.all())) or [()] * (3 + len(scope))
+        stored_keys = pd.array(columns[2], dtype="Int64")
+        keys = stored_keys.fillna(0).to_numpy(dtype=np.int64)
+        if stored_keys.isna().any():
+            await self._backfill_keys(columns[0], keys)
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        self._ids = np.array(columns[0], dtype=np.int64)[order]
+        # rows loaded before delta mode have no hash and always count as changed
+        stored = pd.array(columns[1], dtype="Int64")
+        self._known = ~stored.isna()[order]
+        self._hashes = stored.fillna(0).to_numpy(dtype=np.int64)[order]
+        self._scopes = row_hashes(columns[3:])[order] if scope else None
+
+    async def _backfill_keys(self, ids: tuple, keys: np.ndarray):
+        # Rows merged before the key-hash column existed: hash their keys here once and store the hashes
+        table = self.table.c
+        result = await self.conn.execute(select(table.id, *[table[col] for col in self.natural_key])
+                                         .where(table[KEY_HASH_COLUMN].is_(None)))
+        columns = list(zip(*result.all()))
+        if not columns:
+            # a concurrent load committed the backfill in between; those rows count as changed this time
+            return
+        # normalized as in add(), so a stored key hashes like the same key arriving in a workbook
+        hashes = row_hashes([_normalize_series(pd.Series(values), table[col].type)
+                             for col, values in zip(self.natural_key, columns[1:])])
+        keys[pd.Index(ids).get_indexer(columns[0])] = hashes
+        await self.conn.execute(self.table.update().where(table.id == bindparam("row_id"))
+                                .values({KEY_HASH_COLUMN: bindparam("key_hash")}),
+                                [{"row_id": row_id, "key_hash": key} for row_id, key in zip(columns[0], hashes.tolist())])
+
+    async def add(self, df: pd.DataFrame):
+        # same column order as the target so the hash does not depend on the workbook's column order
+        columns = [col.name for col in self.table.columns if col.name in df.columns and col.name != 'id']
+        values = [_normalize_series(df[col].reset_index(drop=True), self.table.c[col].type) for col in columns]
+        by_name = dict(zip(columns, values))
+        keys = row_hashes([by_name[col] for col in self.natural_key])
+        hashes = row_hashes([vals for col, vals in zip(columns, values) if col not in self.natural_key])
+        if len(self._keys):
+            positions = np.searchsorted(self._keys, keys).clip(max=len(self._keys) - 1)
+            same = (self._keys[positions] == keys) & self._known[positions] & (self._hashes[positions] == hashes)
+        else:
+            same = np.zeros(len(df), dtype=bool)
+        if self.delete_missing:
+            self._loaded_keys.append(keys)
+            if self.delete_scope:
+                self._loaded_scopes.append(row_hashes([by_name[col] for col in self.delete_scope]))
+        positions = np.flatnonzero(~same)
+        changed = list(zip((self.rows + positions).tolist(), *[_python_values(vals.iloc[positions]) for vals in values],
+                           hashes[positions].tolist(), keys[positions].tolist()))
+        self.columns += [col for col in columns if col not in self.columns]
+        self.rows += len(df)
+        self.unchanged += len(df) - len(changed)
+        if changed:
+            await load_chunk(self.conn, self.staging, ['_seq', *columns, ROW_HASH_COLUMN, KEY_HASH_COLUMN], changed)
+            self.staged += len(changed)
+
+    async def merge(self) -> dict:
+        quote = self.conn.dialect.identifier_preparer.quote
+        target, staging = quote(self.table.name), quote(self.staging.name)
+        keys = [quote(col) for col in self.natural_key]
+        # on the key hash (indexed, and equal for NULL key parts), then on the key itself with NULLs equal
+        key_hash = quote(KEY_HASH_COLUMN)
+        match = " AND ".join([f"t.{key_hash} = s.{key_hash}"] + [_null_safe_equal(self.conn, f"t.{key}", f"s.{key}")
+                                                               for key in keys])
+        columns = [quote(col) for col in self.columns + [ROW_HASH_COLUMN, KEY_HASH_COLUMN] if col not in self.natural_key]
+        execute = lambda sql: self.conn.execute(text(sql))
+        duplicates = updated = inserted = deleted = 0
+        if self.staged:
+            await execute(f"CREATE INDEX {quote(self.staging.name + '_key')} ON {staging} ({key_hash})")
+            if self.conn.dialect.name == "postgresql":
+                # temporary tables are never auto-analyzed; without stats the planner misjudges the joins below
+                await execute(f"ANALYZE {staging}")
+            # a key repeated within the load keeps its last row
+            duplicates = (await execute(
+                f"DELETE FROM {staging} WHERE _seq NOT IN (SELECT MAX(_seq) FROM {staging} GROUP BY {', '.join(keys)})"
+            )).rowcount
+            updated = (await execute(
+                f"UPDATE {target} AS t SET {', '.join(f'{col} = s.{col}' for col in columns)} FROM {staging} AS s "
+                f"WHERE {match}"
+            )).rowcount
+            inserted = (await execute(
+                f"INSERT INTO {target} ({', '.join(keys + columns)}) SELECT {', '.join(f's.{col}' for col in keys + columns)} "
+                f"FROM {staging} AS s WHERE NOT EXISTS (SELECT 1 FROM {target} AS t WHERE {match})"
+            )).rowcount
+        keep = np.ones(len(self._ids), dtype=bool)
+        if self.delete_missing:
+            loaded = np.concatenate(self._loaded_keys) if self._loaded_keys else np.empty(0, dtype=np.int64)
+            missing = ~np.isin(self._keys, loaded)
+            if self.delete_scope:
+                scopes = np.concatenate(self._loaded_scopes) if self._loaded_scopes else np.empty(0, dtype=np.int64)
+                missing &= np.isin(self._scopes, scopes)
+            ids = self._ids[missing].tolist()
+            if ids:
+                await load_chunk(self.conn, self.deletes, ['id'], [(row_id,) for row_id in ids])
+                deleted = (await execute(f"DELETE FROM {target} WHERE id IN (SELECT id FROM {quote(self.deletes.name)})")).rowcount
+                keep = ~missing
+        # the index after the merge: updated and inserted rows read back (they are in staging), deleted ones dropped
+        changed = [()] * 3
+        if self.staged:
+            changed = list(zip(*(await execute(
+                f"SELECT t.id, t.{quote(KEY_HASH_COLUMN)}, t.{quote(ROW_HASH_COLUMN)} FROM {target} AS t "
+                f"JOIN {staging} AS s ON {match}"
+            )).all())) or changed
+        changed_ids = np.array(changed[0], dtype=np.int64)
+        keep &= ~np.isin(self._ids, changed_ids)
+        keys = np.concatenate([self._keys[keep], np.array(changed[1], dtype=np.int64)])
+        order = np.argsort(keys, kind="stable")
+        self._next = (keys[order], np.concatenate([self._ids[keep], changed_ids])[order],
+                      np.concatenate([self._known[keep], np.ones(len(changed_ids), dtype=bool)])[order],
+                      np.concatenate([self._hashes[keep], np.array(changed[2], dtype=np.int64)])[order])
+        for temp in (self.staging, self.deletes):
+            await self.conn.run_sync(temp.drop)
+        return {"inserted": inserted, "updated": updated, "unchanged": self.unchanged + self.staged - duplicates - inserted - updated,
+                "deleted": deleted, "duplicates": duplicates}
+
+    def publish(self, version: int = None):
+        # After commit: keep the merged key index for the next load. `version` is what bump_data_version returned
+        # (None when nothing changed); any other load committed in between makes the index stale, so it is dropped.
+        if self._next is not None and (version is None or version == self._version + 1):
+            _key_indexes[self._index_key] = (self._version if version is None else version, self._next)
+        else:
+            _key_indexes.pop(self._index_key, None)
+
+def _null_safe_equal(conn, left: str, right: str) -> str:
+    if conn.dialect.name == "sqlite":
+        return f"{left} IS {right}"
+    if conn.dialect.name == "postgresql":
+        return f"{left} IS NOT DISTINCT FROM {right}"
+    return f"({left} = {right} OR ({left} IS NULL AND {right} IS NULL))"
+
+async def prepare_table_for(engine, table_name: str, column_types: dict, natural_key: list = None) -> Table:
+    # CREATE/ALTER in its own committed transaction, one at a time per table, so concurrent loads into
+    # the same table do not race on the DDL. Call it before the load transaction: the load holds its
+    # connection until commit, and this one would wait for a second (forever with a pool of one).
+    lock = _table_locks.setdefault(table_name, asyncio.Lock())
+    async with lock:
+        async with engine.begin() as conn:
+            return await prepare_table(conn, table_name, column_types, natural_key)
+
+async def prepare_frames(engine, table_name: str, frames: list, natural_key: list = None) -> Table:
+    # Creates, extends or widens the table so that every frame fits it. The types are checked against the catalog
+    # first, then again against the table as reflected, which another process may have changed in the meantime.
+    known = {col: _HINT_TYPES[kind] for col, kind in (await parse_hints(table_name)).items()}
+    while True:
+        column_types = {}
+        for frame in frames:
+            column_types.update(column_types_for(frame, {**known, **column_types}))
+        table = await prepare_table_for(engine, table_name, column_types, natural_key)
+        if all(_kind(table.c[col].type) is _kind(col_type) for col, col_type in column_types.items()):
+            return table
+        known = table_column_types(table)
+
+async def read_ledger(engine, table_name: str) -> dict:
+    # {source: etag} of everything already loaded into table_name; creates the ledger on first use
+    async with engine.begin() as conn:
+        await conn.run_sync(_ledger_metadata.create_all)
+        result = await conn.execute(select(ingest_ledger.c.source, ingest_ledger.c.etag)
+                                    .where(ingest_ledger.c.table_name == table_name))
+        return dict(result.all())
+
+async def load_frames(engine, table_name: str, frames: list, source: str = None, etag: str = None,
+                      natural_key: list = None, delete_missing: bool = False, delete_scope: list = None) -> dict:
+    # Loads parsed chunks (e.g. every sheet of one workbook) in one transaction together with the ledger
+    # row, so a workbook is either fully loaded and recorded or not at all. natural_key switches to a
+    # delta merge. Returns {"rows"} plus the merge counts for delta loads.
+    frames = [frame for frame in frames if not frame.empty]
+    table = await prepare_frames(engine, table_name, frames, natural_key) if frames else None
+    stats = {"rows": sum(len(frame) for frame in frames)}
+    delta = version = None
+    async with engine.begin() as conn:
+        if natural_key and table is not None:
+            delta = DeltaMerge(conn, table, natural_key, delete_missing, delete_scope)
+            await delta.create()
+            for frame in frames:
+                await delta.add(frame)
+            stats.update(await delta.merge())
+        else:
+            for frame in frames:
+                columns = [col for col in frame.columns if col != 'id']
+                await load_chunk(conn, table, columns, coerce_chunk(frame[columns], table))
+        if has_changes(stats):
+            version = await bump_data_version(conn, table_name, rewrites=rewrites_rows(stats))
+        if source is not None:
+            rows = stats["rows"]
+            key = (ingest_ledger.c.source == source) & (ingest_ledger.c.table_name == table_name)
+            await conn.execute(ingest_ledger.delete().where(key))
+            await conn.execute(ingest_ledger.insert().values(source=source, table_name=table_name, etag=etag, rows=rows,
+                                                             ingested_at=datetime.now(timezone.utc).replace(tzinfo=None)))
+    if delta is not None:
+        delta.publish(version)
+    count("ingested_rows", stats["rows"])
+    return stats
+
+def delta_key(mode: str = None, natural_key: list = None):
+    # The natural key to merge on, or None for append loads
+    mode = mode or INGEST_MODE
+    if mode not in INGEST_MODES:
+        raise ValueError(f"Unknown ingestion mode {mode!r}; expected one of {', '.join(INGEST_MODES)}")
+    return (natural_key or INGEST_NATURAL_KEY) if mode == "delta" else None
+
+def ingest_table(table_name: str) -> str:
+    # table_name if ingestion may load into it
+    if table_name not in INGEST_TABLES:
+        raise ValueError(f"Ingestion into table {table_name!r} is not allowed; expected one of {', '.join(INGEST_TABLES)}")
+    return table_name
+
+def has_changes(stats: dict) -> bool:
+    # Append loads change the table whenever they load rows; delta loads only when something was merged
+    if "inserted" in stats:
+        return stats["inserted"] + stats["updated"] + stats["deleted"] > 0
+    return stats["rows"] > 0
+
+def rewrites_rows(stats: dict) -> bool:
+    # Delta loads that updated or deleted rows changed existing ids, not just added new ones
+    return stats.get("updated", 0) + stats.get("deleted", 0) > 0
+
+async def after_ingest(table_name: str, rebuild: bool = False):
+    # Everything derived from the table is refreshed once the load has committed; `rebuild` (see
+    # rewrites_rows) reloads the columnar mirror in full instead of appending rows past its last id. The new
+    # data version is picked up last: queries skip derived stores that are behind it (see rag_utils), so
+    # this process keeps using them on the old version until they have caught up.
+    get_schema_catalog().invalidate(table_name)
+    columnar = get_columnar_engine()
+    if columnar is not None and columnar.table_name == table_name:
+        await columnar.refresh(full=rebuild)
+    router = get_rollup_router()
+    if router is not None and router.table_name == table_name:
+        await router.refresh()
+    get_data_versions().invalidate(table_name)
+
+class _ColumnsChanged(Exception):
+    # A chunk needs columns the table lacks or does not fit their types; raised inside the load transaction so
+    # that it rolls back
+    def __init__(self, known: dict, changes: dict):
+        super().__init__(f"Columns to add or widen: {', '.join(changes)}")
+        self.known = known
+        self.changes = changes
+
+async def _next_chunk(chunks):
+    # Excel parsing is CPU-bound, keep it off the event loop
+    with stage("ingest_parse"):
+        return await asyncio.to_thread(next, chunks, None)
+
+async def ingest_excel_bytes(engine, excel_bytes: bytes, table_name: str = 'financials',
+                             chunk_size: int = INGEST_CHUNK_SIZE, sheet_name: str = None, mode: str = None,
+                             natural_key: list = None, delete_missing: bool = False, delete_scope: list = None) -> dict:
+    # mode "delta" merges on natural_key (default INGEST_NATURAL_KEY) instead of appending. A chunk that does not
+    # fit the table (new headers, text in a numeric column) rolls the load back; the rest of the workbook is then
+    # only parsed to collect every change, the columns are added or widened and the load starts over.
+    started = time.perf_counter()
+    natural_key = delta_key(mode, natural_key)
+    while True:
+        chunks = iter_staged_chunks(excel_bytes, chunk_size=chunk_size, sheet_name=sheet_name,
+                                    dtypes=await parse_hints(table_name))
+        try:
+            stats, delta, version = await _load_chunks(engine, table_name, chunks, natural_key, delete_missing,
+                                                       delete_scope)
+            break
+        except _ColumnsChanged as changed:
+            known, changes = {**changed.known, **changed.changes}, changed.changes
+            while True:
+                chunk = await _next_chunk(chunks)
+                if chunk is None:
+                    break
+                more = column_changes(chunk, known)
+                known.update(more)
+                changes.update(more)
+            await prepare_table_for(engine, table_name, changes)
+            get_schema_catalog().invalidate(table_name)
+    if delta is not None:
+        delta.publish(version)
+    rows = stats["rows"]
+    count("ingested_rows", rows)
+    if has_changes(stats):
+        with stage("ingest_refresh"):
+            await after_ingest(table_name, rebuild=rewrites_rows(stats))
+    elapsed = time.perf_counter() - started
+    rows_per_sec = rows / elapsed if elapsed > 0 else 0.0
+    logger.info("Ingested %d rows into %s in %.2fs (%.0f rows/sec)%s", rows, table_name, elapsed, rows_per_sec,
+                "" if delta is None else f": {stats}")
+    return {**stats, "seconds": round(elapsed, 3), "rows_per_sec": round(rows_per_sec, 1)}
+
+async def _load_chunks(engine, table_name: str, chunks, natural_key: list = None, delete_missing: bool = False,
+                       delete_scope: list = None):
+    # One attempt at loading every chunk in one transaction; returns (stats, delta merge or None, data version)
+    chunk = await _next_chunk(chunks)
+    if chunk is None:
+        return {"rows": 0}, None, None
+    # DDL before the load transaction (see prepare_table_for); later chunks are checked against the result
+    table = await prepare_frames(engine, table_name, [chunk], natural_key)
+    known = table_column_types(table)
+    delta = version = None
+    rows = 0
+    async with engine.begin() as conn:
+        if natural_key:
+            delta = DeltaMerge(conn, table, natural_key, delete_missing, delete_scope)
+            await delta.create()
+        while chunk is not None:
+            changes = column_changes(chunk, known)
+            if changes:
+                raise _ColumnsChanged(known, changes)
+            with stage("ingest_load"):
+                if delta is not None:
+                    await delta.add(chunk)
+                else:
+                    columns = [col for col in chunk.columns if col != 'id']
+                    await load_chunk(conn, table, columns, coerce_chunk(chunk[columns], table))
+            rows += len(chunk)
+            chunk = await _next_chunk(chunks)
+        stats = {"rows": rows}
+        if delta is not None:
+            with stage("ingest_merge"):
+                stats.update(await delta.merge())
+        if has_changes(stats):
+            version = await bump_data_version(conn, table_name, rewrites=rewrites_rows(stats))
+    return stats, delta, version
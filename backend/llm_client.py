@@ -0,0 +1,183 @@
+# Async LLM client layer: pooled connections, per-call timeouts, per-deployment concurrency and 429 retries
+import asyncio
+import logging
+import os
+import random
+from dotenv import load_dotenv
+from pathlib import Path
+from backend.tracing import count
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+ENV_PATH = BASE_DIR / '.env'
+load_dotenv(dotenv_path=ENV_PATH)
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "your-azure-openai-key")
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://your-azure-openai-resource.openai.azure.com/")
+OPENAI_API_DEPLOYMENT = os.getenv("OPENAI_API_DEPLOYMENT", "gpt-4o")
+OPENAI_API_VERSION = os.getenv("OPENAI_API_VERSION", "2024-02-15-preview")
+# "azure" for Azure OpenAI, "fake" for the local stand-in model in backend/fakes.py
+LLM_BACKEND = os.getenv("LLM_BACKEND", "azure")
+# Fake model pacing (load tests): time to first token and completion token rate (0 = whole answer at once)
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "200"))
+FAKE_LLM_TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "0"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_SECONDS = float(os.getenv("LLM_BACKOFF_SECONDS", "0.5"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "64"))
+
+logger = logging.getLogger(__name__)
+
+class RateLimitedError(Exception):
+    def __init__(self, message: str = "rate limited", retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class LLMResponse:
+    def __init__(self, text: str, prompt_tokens: int = 0, completion_tokens: int = 0):
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+class AzureOpenAIModel:
+    # Native async Azure OpenAI client over one pooled httpx connection pool; the SDK's own
+    # retries are disabled so LLMClient controls backoff.
+    def __init__(self):
+        import httpx
+        import openai
+        self._openai = openai
+        self._client = openai.AsyncAzureOpenAI(
+            api_key=OPENAI_API_KEY,
+            azure_endpoint=OPENAI_API_BASE,
+            api_version=OPENAI_API_VERSION,
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS)
+            ),
+        )
+
+    async def complete(self, deployment: str, messages: list, max_tokens: int, temperature: float) -> LLMResponse:
+        try:
+            response = await self._client.chat.completions.create(
+                model=deployment, messages=messages, max_tokens=max_tokens, temperature=temperature
+            )
+        except self._openai.RateLimitError as e:
+            retry_after = e.response.headers.get("retry-after") if e.response is not None else None
+            raise RateLimitedError(str(e), float(retry_after) if retry_after else None) from e
+        usage = response.usage
+        return LLMResponse(
+            response.choices[0].message.content or "",
+            usage.prompt_tokens if usage else 0,
+            usage.completion_tokens if usage else 0,
+        )
+
+    async def stream(self, deployment: str, messages: list, max_tokens: int, temperature: float):
+        try:
+            response = await self._client.chat.completions.create(
+                model=deployment, messages=messages, max_tokens=max_tokens, temperature=temperature, stream=True
+            )
+        except self._openai.RateLimitError as e:
+            retry_after = e.response.headers.get("retry-after") if e.response is not None else None
+            raise RateLimitedError(str(e), float(retry_after) if retry_after else None) from e
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def close(self):
+        await self._client.close()
+
+class LLMClient:
+    # Shared by every pipeline stage. Each deployment gets its own semaphore so one slow model cannot
+    # starve another; 429s are retried with full-jitter exponential backoff outside the semaphore.
+    def __init__(self, model, timeout: float = LLM_TIMEOUT_SECONDS, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 max_retries: int = LLM_MAX_RETRIES, backoff: float = LLM_BACKOFF_SECONDS):
+        self.model = model
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._semaphores = {}
+
+    def _semaphore(self, deployment: str) -> asyncio.Semaphore:
+        if deployment not in self._semaphores:
+            self._semaphores[deployment] = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphores[deployment]
+
+    async def chat(self, messages: list, max_tokens: int = 256, temperature: float = 0.0,
+                   deployment: str = OPENAI_API_DEPLOYMENT, timeout: float = None) -> LLMResponse:
+        semaphore = self._semaphore(deployment)
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with semaphore:
+                    count("llm_calls")
+                    response = await asyncio.wait_for(
+                        self.model.complete(deployment, messages, max_tokens, temperature), timeout or self.timeout
+                    )
+                count("llm_prompt_tokens", response.prompt_tokens)
+                count("llm_completion_tokens", response.completion_tokens)
+                return response
+            except RateLimitedError as e:
+                count("llm_rate_limited")
+                if attempt == self.max_retries:
+                    raise
+                delay = max(e.retry_after or 0.0, random.uniform(0, self.backoff * 2 ** attempt))
+                logger.warning("LLM deployment %s rate limited, retry %d in %.2fs", deployment, attempt + 1, delay)
+                await asyncio.sleep(delay)
+
+    async def stream(self, messages: list, max_tokens: int = 512, temperature: float = 0.0,
+                     deployment: str = OPENAI_API_DEPLOYMENT, timeout: float = None):
+        # Yields text deltas as they arrive. 429s are retried only before the first delta; the timeout
+        # bounds the wait for each delta rather than the whole completion.
+        semaphore = self._semaphore(deployment)
+        timeout = timeout or self.timeout
+        for attempt in range(self.max_retries + 1):
+            started = False
+            try:
+                async with semaphore:
+                    count("llm_calls")
+                    deltas = self.model.stream(deployment, messages, max_tokens, temperature)
+                    try:
+                        while True:
+                            try:
+                                delta = await asyncio.wait_for(deltas.__anext__(), timeout)
+                            except StopAsyncIteration:
+                                return
+                            started = True
+                            # usage is not reported on streamed completions; count deltas instead
+                            count("llm_completion_deltas")
+                            yield delta
+                    finally:
+                        await deltas.aclose()
+            except RateLimitedError as e:
+                count("llm_rate_limited")
+                if started or attempt == self.max_retries:
+                    raise
+                delay = max(e.retry_after or 0.0, random.uniform(0, self.backoff * 2 ** attempt))
+                logger.warning("LLM deployment %s rate limited, retry %d in %.2fs", deployment, attempt + 1, delay)
+                await asyncio.sleep(delay)
+
+    async def close(self):
+        await self.model.close()
+
+_llm_client = None
+
+def get_llm_client() -> LLMClient:
+    global _llm_client
+    if _llm_client is None:
+        if LLM_BACKEND == "fake":
+            from backend.fakes import FakeChatModel
+            _llm_client = LLMClient(FakeChatModel(latency=FAKE_LLM_LATENCY_MS / 1000,
+                                                  tokens_per_second=FAKE_LLM_TOKENS_PER_SECOND or None))
+        else:
+            _llm_client = LLMClient(AzureOpenAIModel())
+    return _llm_client
+
+def set_llm_client(client: LLMClient):
+    global _llm_client
+    _llm_client = client
+
+async def close_llm_client():
+    global _llm_client
+    if _llm_client is not None:
+        await _llm_client.close()
+        _llm_client = None
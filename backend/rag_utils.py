@@ -1,38 +1,41 @@
 # OpenAI GPT-4o and RAG utilities
-import openai
-import os
+import time
 from sqlalchemy import text
-from db import engine
+from backend.db import connect
+from backend.llm_client import get_llm_client
+from backend.sql_cache import get_sql_cache, normalize_question
+from backend.schema_catalog import get_schema_catalog
+from backend.columnar import get_columnar_engine
+from backend.rollups import get_rollup_router
+from backend.sql_guard import get_sql_guard, QueryRejected
+from backend.role_policy import get_policy_engine, PolicyViolation
+from backend.answer_cache import get_answer_cache
+from backend.schema_linking import get_schema_linker
+from backend.coalescing import get_rag_coalescer
+from backend.tracing import stage, count
+from backend.result_utils import (ResultSummarizer, result_registry, paged_sql, json_safe,
+                                  RESULT_PAGE_SIZE, RESULT_STREAM_BATCH)
 from fastapi import HTTPException
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "your-azure-openai-key")
-OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://your-azure-openai-resource.openai.azure.com/")
-OPENAI_API_DEPLOYMENT = os.getenv("OPENAI_API_DEPLOYMENT", "gpt-4o")
-OPENAI_API_VERSION = os.getenv("OPENAI_API_VERSION", "2024-02-15-preview")
+async def get_table_schema(table_name: str = 'financials', with_stats: bool = False) -> str:
+    table = await get_table(table_name)
+    return table.describe(with_stats)
 
-async def get_table_schema(table_name: str = 'financials') -> str:
+async def get_table(table_name: str = 'financials'):
     try:
-        async with engine.begin() as conn:
-            result = await conn.execute(text(f"SELECT column_name, data_type FROM information_schema.columns WHERE table_name = '{table_name}'"))
-            schema = "\n".join([f"{row[0]}: {row[1]}" for row in result.fetchall()])
-        return schema
+        return await get_schema_catalog().get(table_name)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching table schema: {str(e)}")
 
 async def generate_sql_from_nl(query: str, table_schema: str) -> str:
     try:
-        openai.api_type = "azure"
-        openai.api_key = OPENAI_API_KEY
-        openai.api_base = OPENAI_API_BASE
-        openai.api_version = OPENAI_API_VERSION
         system_prompt = f"""
 You are a financial analytics SQL expert. Given a user question and the table schema, generate a safe, optimized SQL query to answer the question. Only use columns and tables present in the schema. Do not hallucinate. Return only the SQL query.
 
 Schema:
 {table_schema}
 """
-        response = openai.ChatCompletion.create(
-            engine=OPENAI_API_DEPLOYMENT,
+        response = await get_llm_client().chat(
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": query}
@@ -40,48 +43,224 @@ Schema:
             max_tokens=256,
             temperature=0.0
         )
-        sql = response.choices[0].message["content"].strip()
+        sql = response.text.strip()
         return sql
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating SQL from NL: {str(e)}")
 
-def mask_data(rows, user_role):
-    if user_role != 'admin':
+def sql_error(e: Exception, sql: str) -> HTTPException:
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, PolicyViolation):
+        return HTTPException(status_code=403, detail=f"SQL rejected by role policy: {str(e)}\nSQL: {sql}")
+    if isinstance(e, QueryRejected):
+        return HTTPException(status_code=400, detail=f"SQL rejected: {str(e)}\nSQL: {sql}")
+    if get_sql_guard().timed_out(e):
+        return HTTPException(status_code=504, detail=f"SQL execution timed out\nSQL: {sql}")
+    return HTTPException(status_code=400, detail=f"SQL execution error: {str(e)}\nSQL: {sql}")
+
+async def route_sql(sql: str):
+    router = get_rollup_router()
+    return router.route(sql) if router is not None and await router.current() else (sql, None)
+
+async def current_columnar():
+    # The columnar mirror, unless it is off or behind the table's data version (the database answers then,
+    # so no result - and no answer cache entry keyed on the new version - comes from older rows)
+    columnar = get_columnar_engine()
+    return columnar if columnar is not None and await columnar.catch_up() else None
+
+async def execute_streaming(sql: str):
+    # Rows stream through a server-side cursor in batches; only the budgeted context rows, the first
+    # page and constant-size aggregates are kept in memory. Aggregates a rollup covers read the rollup;
+    # SQL the columnar mirror understands never reaches the database. Returns (sql, summary): the SQL
+    # that ran, which the guard may have given a smaller LIMIT, and the summary (flagged capped when the
+    # guard's row limit cut the result off). Role masking is already part of the SQL (see role_policy).
+    started = time.perf_counter()
+    summary = ResultSummarizer(row_cap=get_sql_guard().row_cap(sql))
+    with stage("rollup_routing"):
+        sql, rollup = await route_sql(sql)
+    columnar = await current_columnar()
+    with stage("columnar"):
+        rows = columnar.execute(sql) if columnar is not None else None
+    if rows is not None:
         for row in rows:
-            if 'cost' in row:
-                row['cost'] = '***'
-    return rows
+            summary.add(row)
+    else:
+        # EXPLAIN and the query share one read-only transaction
+        guard = get_sql_guard()
+        with stage("sql_execution"):
+            async with connect() as conn:
+                try:
+                    async with guard.read_only(conn):
+                        with stage("sql_guard"):
+                            checked = sql
+                            sql, cost = await guard.enforce_cost(conn, sql)
+                        if sql != checked:
+                            summary.row_cap = guard.row_cap(sql, rewritten=True)
+                        executed = time.perf_counter()
+                        result = await conn.stream(text(sql))
+                        async for batch in result.partitions(RESULT_STREAM_BATCH):
+                            for row in batch:
+                                summary.add(dict(row._mapping))
+                except Exception as e:
+                    raise sql_error(e, sql)
+        guard.record(sql, cost, time.perf_counter() - executed, summary.row_count)
+    count("result_rows", summary.row_count)
+    if get_rollup_router() is not None:
+        get_rollup_router().record(rollup is not None, time.perf_counter() - started)
+    return sql, summary
+
+async def fetch_result_page(result_id: str, page: int, page_size: int = RESULT_PAGE_SIZE):
+    entry = result_registry.get(result_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Result expired or not found; re-run the query.")
+    sql, _, row_count = entry
+    sql, _ = await route_sql(sql)
+    columnar = await current_columnar()
+    # the SQL may fetch the guard's extra row past the cap; pages stop at row_count
+    limit = max(min(page_size, row_count - (page - 1) * page_size), 0)
+    rows = columnar.execute(sql) if columnar is not None else None
+    if rows is not None:
+        rows = rows[(page - 1) * page_size:(page - 1) * page_size + limit]
+    else:
+        async with connect() as conn:
+            try:
+                async with get_sql_guard().read_only(conn):
+                    result = await conn.execute(text(paged_sql(sql)), {"limit": limit, "offset": (page - 1) * page_size})
+                    rows = [{key: json_safe(value) for key, value in row._mapping.items()} for row in result]
+            except Exception as e:
+                raise sql_error(e, sql)
+    return {"result_id": result_id, "page": page, "page_size": page_size, "row_count": row_count,
+            "has_more": page * page_size < row_count, "data": rows}
+
+async def generate_sql(user_query: str, user_role: str = 'user') -> str:
+    with stage("schema"):
+        table = await get_table('financials')
+    # The prompt shows the schema as the role sees it; the cache key uses that column list (so roles with
+    # the same policy share entries), the prompt also carries per-column stats. On wide tables schema
+    # linking narrows the prompt to the columns the question is about.
+    policy = get_policy_engine().for_role(user_role)
+    linker = get_schema_linker()
+
+    def prompt_schema(query: str) -> str:
+        with stage("schema_linking"):
+            return linker.prompt(query, table, policy) if linker is not None else policy.describe(table, with_stats=True)
+
+    with stage("sql_generation"):
+        sql = await get_sql_cache().get_or_generate(
+            user_query, policy.describe(table),
+            lambda query, _: generate_sql_from_nl(query, prompt_schema(query))
+        )
+    # role masking in the SELECT lists, then read-only single SELECT and row cap; the cost check runs
+    # with the query
+    with stage("sql_guard"):
+        try:
+            return get_sql_guard().check(policy.apply(sql, table, get_sql_guard().dialect))
+        except QueryRejected as e:
+            raise sql_error(e, sql)
+
+def answer_messages(user_query: str, context: str) -> list:
+    prompt = f"Context:\n{context}\n\nUser Query: {user_query}\n\nAnswer as a financial analytics expert. Provide a summary and, if relevant, a table or chart-ready data."
+    return [{"role": "system", "content": "You are a financial analytics assistant."},
+            {"role": "user", "content": prompt}]
+
+def result_entry(sql: str, summary: ResultSummarizer) -> dict:
+    # What a response needs from an executed query; this is what the answer cache stores
+    return {"sql": sql, "data": summary.page, "row_count": summary.row_count, "summarized": summary.truncated,
+            "capped": summary.capped, "page_size": summary.page_size, "context": summary.context()}
+
+def page_info(user_role: str, result: dict) -> dict:
+    result_id = result_registry.register(result["sql"], user_role, result["row_count"])
+    return {"result_id": result_id, "page": 1, "page_size": result["page_size"],
+            "has_more": result["row_count"] > len(result["data"])}
+
+async def cached_result(sql: str, user_role: str, user_query: str):
+    # (lookup, result): the rows come from the answer cache when this SQL already ran for the role on the
+    # current data version, otherwise the query runs and its result is stored
+    cache = get_answer_cache()
+    with stage("answer_cache"):
+        lookup = await cache.lookup(sql, user_role, user_query)
+    if lookup.result is not None:
+        return lookup, lookup.result
+    sql, summary = await execute_streaming(sql)
+    result = result_entry(sql, summary)
+    cache.store_result(lookup, result)
+    return lookup, result
 
 async def run_rag_pipeline(user_query: str, user_role: str = 'user'):
+    # Concurrent requests for the same normalized question and role share one pipeline run; each gets its own
+    # copy of the response, flagged "coalesced" when another request's run produced it
+    coalescer = get_rag_coalescer()
+    if coalescer is None:
+        return {**await _run_rag_pipeline(user_query, user_role), "coalesced": False}
+    template, literals = normalize_question(user_query)
+    key = (template, tuple(literals), user_role)
+    result, shared = await coalescer.run(key, lambda: _run_rag_pipeline(user_query, user_role))
+    if shared:
+        count("coalesced_requests")
+    return {**result, "coalesced": shared}
+
+async def _run_rag_pipeline(user_query: str, user_role: str = 'user'):
     try:
-        schema = await get_table_schema('financials')
-        sql = await generate_sql_from_nl(user_query, schema)
-        async with engine.begin() as conn:
+        sql = await generate_sql(user_query, user_role)
+        lookup, result = await cached_result(sql, user_role, user_query)
+        answer = lookup.answer
+        if answer is None:
             try:
-                result = await conn.execute(text(sql))
-                rows = [dict(row) for row in result.fetchall()]
+                with stage("answer"):
+                    response = await get_llm_client().chat(
+                        messages=answer_messages(user_query, result["context"]),
+                        max_tokens=512,
+                        temperature=0.2
+                    )
+                answer = response.text
             except Exception as e:
-                raise HTTPException(status_code=400, detail=f"SQL execution error: {str(e)}\nSQL: {sql}")
-        rows = mask_data(rows, user_role)
-        context = "\n".join([str(row) for row in rows])
-        prompt = f"Context:\n{context}\n\nUser Query: {user_query}\n\nAnswer as a financial analytics expert. Provide a summary and, if relevant, a table or chart-ready data."
-        openai.api_type = "azure"
-        openai.api_key = OPENAI_API_KEY
-        openai.api_base = OPENAI_API_BASE
-        openai.api_version = OPENAI_API_VERSION
+                raise HTTPException(status_code=500, detail=f"Error generating LLM response: {str(e)}")
+            get_answer_cache().store_answer(lookup, answer)
+        return {
+            "result": answer,
+            "sql": result["sql"],
+            "data": result["data"],
+            "row_count": result["row_count"],
+            "summarized": result["summarized"],
+            "capped": result.get("capped", False),
+            "page": page_info(user_role, result),
+            "cache": lookup.status,
+        }
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"RAG pipeline error: {str(e)}")
+
+async def stream_rag_pipeline(user_query: str, user_role: str = 'user'):
+    # Same stages as run_rag_pipeline, yielded as (event, payload) pairs as soon as each one is ready:
+    # stage -> sql -> rows -> token* -> done, or error.
+    try:
+        yield "stage", {"stage": "generating_sql"}
+        sql = await generate_sql(user_query, user_role)
+        yield "sql", {"sql": sql}
+        yield "stage", {"stage": "running_query"}
+        lookup, result = await cached_result(sql, user_role, user_query)
+        yield "rows", {"row_count": result["row_count"], "summarized": result["summarized"],
+                       "capped": result.get("capped", False), "preview": result["data"][:10], "page": page_info(user_role, result), "cache": lookup.status}
+        yield "stage", {"stage": "answering"}
+        if lookup.answer is not None:
+            yield "token", {"text": lookup.answer}
+            yield "done", {"result": lookup.answer, "sql": result["sql"], "cache": lookup.status}
+            return
+        answer = []
         try:
-            response = openai.ChatCompletion.create(
-                engine=OPENAI_API_DEPLOYMENT,
-                messages=[{"role": "system", "content": "You are a financial analytics assistant."},
-                          {"role": "user", "content": prompt}],
-                max_tokens=512,
-                temperature=0.2
-            )
-            answer = response.choices[0].message["content"]
+            # time to the last token; the client sees the first one much sooner
+            with stage("answer"):
+                async for delta in get_llm_client().stream(answer_messages(user_query, result["context"]),
+                                                           max_tokens=512, temperature=0.2):
+                    answer.append(delta)
+                    yield "token", {"text": delta}
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error generating LLM response: {str(e)}")
-        return {"result": answer, "sql": sql, "data": rows}
+        get_answer_cache().store_answer(lookup, "".join(answer))
+        yield "done", {"result": "".join(answer), "sql": result["sql"], "cache": lookup.status}
     except HTTPException as e:
-        raise e
+        yield "error", {"status": e.status_code, "error": e.detail}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"RAG pipeline error: {str(e)}")
+        yield "error", {"status": 500, "error": f"RAG pipeline error: {str(e)}"}
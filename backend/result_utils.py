@@ -0,0 +1,181 @@
+# Streaming result consumption: row/byte budgets, on-the-fly summaries for LLM context, and result paging
+import heapq
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+
+RESULT_CONTEXT_MAX_ROWS = int(os.getenv("RESULT_CONTEXT_MAX_ROWS", "200"))
+RESULT_CONTEXT_MAX_BYTES = int(os.getenv("RESULT_CONTEXT_MAX_BYTES", "16000"))
+RESULT_PAGE_SIZE = int(os.getenv("RESULT_PAGE_SIZE", "100"))
+RESULT_STREAM_BATCH = int(os.getenv("RESULT_STREAM_BATCH", "1000"))
+RESULT_TOP_N = int(os.getenv("RESULT_TOP_N", "10"))
+RESULT_MAX_GROUPS = int(os.getenv("RESULT_MAX_GROUPS", "1000"))
+RESULT_REGISTRY_TTL_SECONDS = float(os.getenv("RESULT_REGISTRY_TTL_SECONDS", "3600"))
+
+def json_safe(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+class ColumnStats:
+    def __init__(self):
+        self.count = 0
+        self.nulls = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        if value is None:
+            self.nulls += 1
+            return
+        self.count += 1
+        if _is_number(value):
+            self.total += value
+        try:
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+        except TypeError:
+            # mixed types in one column (e.g. masked values); keep the stats seen so far
+            pass
+
+    def describe(self, numeric: bool) -> str:
+        parts = [f"count {self.count}", f"nulls {self.nulls}"]
+        if self.min is not None:
+            parts.append(f"min {self.min}, max {self.max}")
+        if numeric and self.count:
+            parts.append(f"sum {round(self.total, 2)}, avg {round(self.total / self.count, 2)}")
+        return ", ".join(parts)
+
+class ResultSummarizer:
+    # Consumes rows once as they stream from the database. Keeps the first rows that fit the context budget
+    # (and the first data page), plus constant-size aggregates: per-column stats, totals per value of the
+    # first text column (bounded group count) and the top-N rows by the first numeric column. With a row_cap
+    # (the SQL guard's row limit), rows past it are dropped and the result is flagged as capped.
+    def __init__(self, max_rows: int = RESULT_CONTEXT_MAX_ROWS, max_bytes: int = RESULT_CONTEXT_MAX_BYTES,
+                 page_size: int = RESULT_PAGE_SIZE, top_n: int = RESULT_TOP_N, max_groups: int = RESULT_MAX_GROUPS,
+                 row_cap: int = None):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.page_size = page_size
+        self.top_n = top_n
+        self.max_groups = max_groups
+        self.columns = None
+        self.row_count = 0
+        self.context_rows = []
+        self.context_bytes = 0
+        self.page = []
+        self.truncated = False
+        self.row_cap = row_cap
+        self.capped = False
+        self.stats = {}
+        self.numeric_columns = []
+        self.group_column = None
+        self.groups = {}
+        self.groups_overflow = False
+        self._top = []
+
+    def _init_columns(self, row: dict):
+        self.columns = list(row.keys())
+        self.stats = {col: ColumnStats() for col in self.columns}
+        self.numeric_columns = [col for col in self.columns if _is_number(row[col])]
+        self.group_column = next((col for col in self.columns if isinstance(row[col], str)), None)
+
+    def add(self, row: dict):
+        if self.row_cap is not None and self.row_count >= self.row_cap:
+            self.capped = True
+            return
+        row = {key: json_safe(value) for key, value in row.items()}
+        if self.columns is None:
+            self._init_columns(row)
+        self.row_count += 1
+        if len(self.page) < self.page_size:
+            self.page.append(row)
+        if not self.truncated:
+            line = str(row)
+            if len(self.context_rows) < self.max_rows and self.context_bytes + len(line) <= self.max_bytes:
+                self.context_rows.append(line)
+                self.context_bytes += len(line) + 1
+            else:
+                self.truncated = True
+        for col in self.columns:
+            self.stats[col].add(row.get(col))
+        numeric = [col for col in self.numeric_columns if _is_number(row.get(col))]
+        if self.group_column is not None and numeric:
+            key = row.get(self.group_column)
+            totals = self.groups.get(key)
+            if totals is None:
+                if len(self.groups) >= self.max_groups:
+                    self.groups_overflow = True
+                else:
+                    totals = self.groups[key] = {}
+            if totals is not None:
+                for col in numeric:
+                    totals[col] = totals.get(col, 0) + row[col]
+        if self.numeric_columns and _is_number(row.get(self.numeric_columns[0])):
+            entry = (row[self.numeric_columns[0]], self.row_count, row)
+            if len(self._top) < self.top_n:
+                heapq.heappush(self._top, entry)
+            elif entry[0] > self._top[0][0]:
+                heapq.heapreplace(self._top, entry)
+
+    def context(self) -> str:
+        capped = [f"The result was cut off at the {self.row_cap}-row limit: counts, totals and statistics cover "
+                  f"only those rows, not everything the question asks about."] if self.capped else []
+        if not self.truncated:
+            return "\n".join(capped + self.context_rows)
+        lines = [f"The query returned {self.row_count} rows; the context below is a summary, not the full result."]
+        lines += capped
+        lines.append("Column statistics:")
+        for col in self.columns or []:
+            lines.append(f"- {col}: {self.stats[col].describe(col in self.numeric_columns)}")
+        if self.groups:
+            suffix = f" (first {self.max_groups} groups)" if self.groups_overflow else ""
+            lines.append(f"Totals by {self.group_column}{suffix}:")
+            ranked = sorted(self.groups.items(), key=lambda item: -abs(next(iter(item[1].values()), 0)))
+            for key, totals in ranked[:self.top_n * 2]:
+                lines.append(f"- {key}: " + ", ".join(f"{col} {round(value, 2)}" for col, value in totals.items()))
+        if self._top:
+            lines.append(f"Top {len(self._top)} rows by {self.numeric_columns[0]}:")
+            lines += [str(row) for _, _, row in sorted(self._top, key=lambda entry: -entry[0])]
+        lines.append(f"First {len(self.context_rows)} rows:")
+        lines += self.context_rows[:self.top_n]
+        summary = "\n".join(lines)
+        return summary[:self.max_bytes]
+
+def paged_sql(sql: str) -> str:
+    return f"SELECT * FROM ({sql.strip().rstrip(';')}) AS paged_result LIMIT :limit OFFSET :offset"
+
+class ResultRegistry:
+    # Remembers the SQL behind each answer so /rag-advanced/data/ can page the full result without the
+    # client ever sending SQL back.
+    def __init__(self, ttl: float = RESULT_REGISTRY_TTL_SECONDS, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def register(self, sql: str, user_role: str, row_count: int) -> str:
+        result_id = uuid.uuid4().hex
+        self._entries[result_id] = (sql, user_role, row_count, time.time() + self.ttl)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return result_id
+
+    def get(self, result_id: str):
+        entry = self._entries.get(result_id)
+        if entry is None or entry[3] < time.time():
+            self._entries.pop(result_id, None)
+            return None
+        return entry[:3]
+
+result_registry = ResultRegistry()
@@ -0,0 +1,187 @@
+# Role policies for generated SQL: per role, which columns are hidden, masked or aggregate-only. The policy
+# shapes the schema the model sees and is enforced by rewriting the query's projections, so masked values
+# never leave the database.
+import json
+import logging
+import os
+import sqlglot
+from sqlglot import exp
+from backend.sql_guard import QueryRejected
+
+# JSON {"role": {"allowed": [...], "masked": [...], "aggregate_only": [...]}}; "*" applies to every role not
+# listed. "allowed" (optional) hides all other columns. Default: admins see everything, others get cost masked.
+ROLE_POLICIES = os.getenv("ROLE_POLICIES", "")
+MASK_VALUE = "***"
+
+DEFAULT_POLICIES = {"admin": {}, "*": {"masked": ["cost"]}}
+# Aggregates that never reveal a single row's value (MIN/MAX do)
+_SAFE_AGGREGATES = (exp.Sum, exp.Avg, exp.Count)
+_SQLGLOT_DIALECTS = {"postgresql": "postgres", "sqlite": "sqlite"}
+
+logger = logging.getLogger(__name__)
+
+class PolicyViolation(QueryRejected):
+    pass
+
+def _key(name: str) -> str:
+    # Column names are matched case-insensitively: unquoted identifiers fold in PostgreSQL and SQLite, and SQLite
+    # ignores case even when quoted. At worst this protects a differently-cased quoted namesake too.
+    return name.casefold()
+
+class RolePolicy:
+    def __init__(self, role: str, allowed: list = None, masked: list = None, aggregate_only: list = None):
+        self.role = role
+        self.allowed = {_key(name) for name in allowed} if allowed is not None else None
+        self.masked = {_key(name) for name in masked or ()}
+        self.aggregate_only = {_key(name) for name in aggregate_only or ()} - self.masked
+
+    @property
+    def unrestricted(self) -> bool:
+        return self.allowed is None and not self.masked and not self.aggregate_only
+
+    def protected(self, column: str) -> bool:
+        # Values of these columns never go into a prompt
+        return self.is_masked(column) or _key(column) in self.aggregate_only or self.hidden(column)
+
+    def is_masked(self, column: str) -> bool:
+        return _key(column) in self.masked
+
+    def hidden(self, column: str) -> bool:
+        key = _key(column)
+        return self.allowed is not None and key not in self.allowed and key not in self.masked \
+            and key not in self.aggregate_only
+
+    def describe(self, table, with_stats: bool = False, columns: set = None) -> str:
+        # The table schema as this role's prompt sees it: hidden columns left out, no stats for protected ones.
+        # `columns` narrows it to the columns schema linking picked.
+        lines = []
+        for col in table.columns:
+            if self.hidden(col.name) or (columns is not None and col.name not in columns):
+                continue
+            if self.is_masked(col.name):
+                lines.append(f"{col.describe()} (masked for this role: do not filter, group or sort on it)")
+            elif _key(col.name) in self.aggregate_only:
+                lines.append(f"{col.describe()} (aggregate only: use inside SUM, AVG or COUNT)")
+            else:
+                lines.append(col.describe(with_stats))
+        return "\n".join(lines)
+
+    def apply(self, sql: str, table, dialect: str = "postgresql") -> str:
+        # Rewrites every SELECT list so masked columns (and aggregate-only ones outside SUM/AVG/COUNT) come
+        # back as MASK_VALUE under the same output name; `SELECT *` over the table is expanded first.
+        # Raises PolicyViolation for hidden columns and for protected columns outside a SELECT list.
+        if self.unrestricted:
+            return sql
+        try:
+            tree = sqlglot.parse_one(sql, read="postgres")
+        except sqlglot.errors.SqlglotError:
+            # the SQL guard reports unparseable SQL
+            return sql
+        columns = [col.name for col in table.columns]
+        # only the table's own columns are protected; CTE columns and output aliases are checked where defined
+        protected = self.masked | self.aggregate_only | {_key(name) for name in columns if self.hidden(name)}
+        dialect = _SQLGLOT_DIALECTS.get(dialect, dialect)
+        self._reject_row_references(tree, table.name, columns, sql)
+        changed = False
+        for select in list(tree.find_all(exp.Select)):
+            changed |= self._expand_star(select, table.name, columns)
+            for index, node in enumerate(select.expressions):
+                refs = self._references(node, select, protected)
+                if not refs:
+                    continue
+                if any(self.hidden(col.name) for col in refs):
+                    self._violation(f"column {next(c.name for c in refs if self.hidden(c.name))} is not available", sql)
+                if any(self.is_masked(col.name) or not self._aggregated(col, select) for col in refs):
+                    select.expressions[index].replace(exp.alias_(exp.Literal.string(MASK_VALUE),
+                                                                 self._output_name(node, dialect, columns)))
+                    changed = True
+            for clause in ("where", "group", "having", "order", "joins", "qualify", "distinct"):
+                value = select.args.get(clause)
+                for part in value if isinstance(value, list) else [value] if value is not None else []:
+                    for col in self._references(part, select, protected):
+                        if self.hidden(col.name) or self.is_masked(col.name) or \
+                                (_key(col.name) in self.aggregate_only and not self._aggregated(col, select)):
+                            self._violation(f"column {col.name} cannot be used in {clause.upper().rstrip('S')}", sql)
+        return tree.sql(dialect=dialect) if changed else sql
+
+    def _output_name(self, node, dialect: str, columns: list):
+        # The column name the database would have given the unmasked expression
+        if isinstance(node, exp.Alias):
+            return node.args["alias"].copy()
+        if isinstance(node, exp.Column):
+            # a bare column comes back under the table's own spelling of it (`SELECT COST` returns "cost")
+            name = next((name for name in columns if _key(name) == _key(node.name)), node.name)
+            return exp.to_identifier(name, quoted=True)
+        if dialect != "postgres":
+            return exp.to_identifier(node.sql(dialect=dialect), quoted=True)
+        function = node.this if isinstance(node, exp.Window) else node
+        return exp.to_identifier(function.key if isinstance(function, exp.Func) else "?column?", quoted=True)
+
+    def _expand_star(self, select, table_name: str, columns: list) -> bool:
+        source = select.args.get("from_") or select.args.get("from")
+        if source is None or not any(isinstance(node, exp.Star) or (isinstance(node, exp.Column) and
+                                                                    isinstance(node.this, exp.Star))
+                                     for node in select.expressions):
+            return False
+        if select.args.get("joins") or not isinstance(source.this, exp.Table) or \
+                _key(source.this.name) != _key(table_name):
+            # stars over CTEs and subqueries pass through their (already rewritten) SELECT lists
+            if select.args.get("joins"):
+                self._violation("SELECT * over a join is not allowed for this role", select.sql())
+            return False
+        expanded = []
+        for node in select.expressions:
+            if isinstance(node, exp.Star) or (isinstance(node, exp.Column) and isinstance(node.this, exp.Star)):
+                expanded += [exp.column(name, quoted=True) for name in columns if not self.hidden(name)]
+            else:
+                expanded.append(node)
+        select.set("expressions", expanded)
+        return True
+
+    def _references(self, node, select, protected: set) -> list:
+        # Protected columns referenced by `node` in this SELECT's own scope (not in nested subqueries)
+        return [col for col in node.find_all(exp.Column)
+                if _key(col.name) in protected and col.find_ancestor(exp.Select) is select]
+
+    def _reject_row_references(self, tree, table_name: str, columns: list, sql: str):
+        # The table (or an alias of it) used as a value - `SELECT f`, `row_to_json(f)`, `to_json(f.*)`, `(f).cost` -
+        # carries every column, masked ones included. Top-level `f.*` is expanded instead.
+        rows = {_key(name) for node in tree.find_all(exp.Table) if _key(node.name) == _key(table_name)
+                for name in (node.name, node.alias_or_name)}
+        names = {_key(name) for name in columns}
+        for col in tree.find_all(exp.Column):
+            if isinstance(col.this, exp.Star):
+                if _key(col.table) in rows and not isinstance(col.parent, exp.Select):
+                    self._violation(f"whole-row reference {col.sql()} is not allowed", sql)
+            elif not col.table and _key(col.name) in rows and _key(col.name) not in names:
+                self._violation(f"whole-row reference {col.name} is not allowed", sql)
+
+    def _aggregated(self, col, select) -> bool:
+        if self.is_masked(col.name) or self.hidden(col.name):
+            return False
+        if _key(col.name) not in self.aggregate_only:
+            return True
+        aggregate = col.find_ancestor(exp.AggFunc, exp.Window)
+        return isinstance(aggregate, _SAFE_AGGREGATES) and aggregate.find_ancestor(exp.Select) is select \
+            and not isinstance(aggregate.parent, exp.Window)
+
+    def _violation(self, message: str, sql: str):
+        logger.warning("Role policy %s rejected query: %s: %s", self.role, message, sql)
+        raise PolicyViolation(f"{message} for this role")
+
+class PolicyEngine:
+    def __init__(self, policies: dict = None):
+        # roles without a policy fall back to "*", which defaults to the built-in one rather than to no policy
+        policies = {"*": DEFAULT_POLICIES["*"], **(policies if policies is not None else DEFAULT_POLICIES)}
+        self.policies = {role: RolePolicy(role, **spec) for role, spec in policies.items()}
+
+    def for_role(self, role: str) -> RolePolicy:
+        return self.policies.get(role) or self.policies["*"]
+
+_policy_engine = None
+
+def get_policy_engine() -> PolicyEngine:
+    global _policy_engine
+    if _policy_engine is None:
+        _policy_engine = PolicyEngine(json.loads(ROLE_POLICIES) if ROLE_POLICIES.strip() else None)
+    return _policy_engine
@@ -0,0 +1,292 @@
+# Precomputed rollups of financials (summary tables per dimension set) and a router that answers
+# matching aggregate SQL from the smallest rollup instead of scanning the base table.
+import asyncio
+import itertools
+import logging
+import os
+import time
+import sqlglot
+from sqlglot import exp
+from sqlalchemy import inspect, text
+from backend.schema_catalog import get_schema_catalog
+from backend.data_version import read_data_version, write_data_version, get_data_versions, rewritten_key
+
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "true").lower() == "true"
+# Dimensions the rollups group by; one summary table is kept per subset (including the grand total)
+ROLLUP_DIMENSIONS = [name.strip() for name in os.getenv("ROLLUP_DIMENSIONS", "project,period").split(",") if name.strip()]
+
+_NUMERIC_TYPES = ("int", "float", "double", "numeric", "decimal", "real")
+_SQLGLOT_DIALECTS = {"postgresql": "postgres", "sqlite": "sqlite"}
+
+logger = logging.getLogger(__name__)
+
+class NotRoutable(Exception):
+    pass
+
+class Rollup:
+    # One summary table: GROUP BY `dimensions` with COUNT(*) plus sum/count/min/max of every measure.
+    def __init__(self, base_table: str, dimensions: tuple, measures: list):
+        self.base_table = base_table
+        self.dimensions = dimensions
+        self.measures = measures
+        suffix = "by_" + "_".join(dimensions) if dimensions else "total"
+        self.name = f"{base_table}_rollup_{suffix}"
+        self.groups = None
+
+    @property
+    def columns(self) -> list:
+        columns = list(self.dimensions) + ["row_count"]
+        for measure in self.measures:
+            columns += [f"sum_{measure}", f"count_{measure}", f"min_{measure}", f"max_{measure}"]
+        return columns
+
+    def build_sql(self, quote, where: str = None) -> str:
+        select = [quote(dim) for dim in self.dimensions] + ["COUNT(*) AS row_count"]
+        for measure in self.measures:
+            column = quote(measure)
+            select += [f"SUM({column}) AS {quote('sum_' + measure)}", f"COUNT({column}) AS {quote('count_' + measure)}",
+                       f"MIN({column}) AS {quote('min_' + measure)}", f"MAX({column}) AS {quote('max_' + measure)}"]
+        sql = f"SELECT {', '.join(select)} FROM {quote(self.base_table)}"
+        if where:
+            sql += f" WHERE {where}"
+        if self.dimensions:
+            sql += " GROUP BY " + ", ".join(quote(dim) for dim in self.dimensions)
+        return sql
+
+    def merge_sql(self, quote, where: str) -> str:
+        # The rollup as it is plus the base-table rows matching `where`, re-aggregated per group
+        select = [quote(dim) for dim in self.dimensions] + ["CAST(SUM(row_count) AS BIGINT) AS row_count"]
+        for measure in self.measures:
+            total, counted, low, high = (quote(f"{prefix}_{measure}") for prefix in ("sum", "count", "min", "max"))
+            select += [f"SUM({total}) AS {total}", f"CAST(SUM({counted}) AS BIGINT) AS {counted}",
+                       f"MIN({low}) AS {low}", f"MAX({high}) AS {high}"]
+        columns = ", ".join(quote(column) for column in self.columns)
+        sql = (f"SELECT {', '.join(select)} FROM (SELECT {columns} FROM {quote(self.name)} UNION ALL "
+               f"{self.build_sql(quote, where)}) AS merged")
+        if self.dimensions:
+            sql += " GROUP BY " + ", ".join(quote(dim) for dim in self.dimensions)
+        return sql
+
+class RollupRouter:
+    def __init__(self, engine, table_name: str = 'financials', dimensions: list = ROLLUP_DIMENSIONS):
+        self.engine = engine
+        self.table_name = table_name
+        self.dimensions = dimensions
+        self.dialect = _SQLGLOT_DIALECTS.get(engine.dialect.name, engine.dialect.name)
+        self.rollups = []
+        self.base_rows = None
+        # the rollup tables are shared by every worker: the data version they were built from is stored under
+        # this name (see current())
+        self.version_key = f"{table_name}:rollups"
+        # and the highest base-table id they cover
+        self.last_id_key = f"{table_name}:rollups:last_id"
+        self.refreshes = 0
+        # how the last refresh went: "rebuilt" from the base table, "merged" rows added since, or "kept" as built
+        self.last_refresh = None
+        self.rewrites = 0
+        self.fallthroughs = 0
+        self._timings = {True: [0, 0.0], False: [0, 0.0]}
+        self._lock = asyncio.Lock()
+
+    # --- maintenance ---
+    def _plan(self, table) -> list:
+        dimensions = [name for name in self.dimensions if table.column(name) is not None]
+        measures = [col.name for col in table.columns if col.name != 'id' and col.name not in dimensions
+                    and any(token in col.data_type.lower() for token in _NUMERIC_TYPES)]
+        return [Rollup(self.table_name, combo, measures)
+                for size in range(len(dimensions) + 1) for combo in itertools.combinations(dimensions, size)]
+
+    async def refresh(self, only_missing: bool = False):
+        # Each summary table is built under a new name and swapped in by rename at the end of one transaction:
+        # readers see either the old or the new set, and wait only for the swap, not the build. Rows added since the
+        # last build (ids past the one recorded with it) are merged into the existing rollups; a rebuild from the
+        # full table happens when the columns changed, a load updated or deleted rows since (see rewritten_key), or
+        # the rollups' row count shows rows they missed. only_missing (used at startup) builds nothing when the
+        # tables were built from the current data version.
+        async with self._lock:
+            started = time.perf_counter()
+            try:
+                table = await get_schema_catalog().get(self.table_name)
+            except Exception as e:
+                logger.info("Rollups for %s not built: %s", self.table_name, e)
+                return
+            rollups = self._plan(table)
+            total = next(rollup for rollup in rollups if not rollup.dimensions)
+            quote = self.engine.dialect.identifier_preparer.quote
+            async with self.engine.begin() as conn:
+                async def scalar(sql, **params):
+                    return (await conn.execute(text(sql), params)).scalar()
+                # read before the base table, so the recorded version is never newer than the rollups
+                version = await read_data_version(conn, self.table_name)
+                built = await read_data_version(conn, self.version_key)
+                rewritten = await read_data_version(conn, rewritten_key(self.table_name))
+                last_id = await read_data_version(conn, self.last_id_key)
+                in_place = True
+                for rollup in rollups:
+                    in_place = in_place and await conn.run_sync(_has_columns, rollup.name, rollup.columns)
+                mode = "rebuilt"
+                if only_missing and in_place and built == version:
+                    mode = "kept"
+                elif in_place and rewritten <= built:
+                    # a load that committed rows below the last id after the last build (ids are not handed out in
+                    # commit order) shows as a count mismatch
+                    covered = await scalar(f"SELECT COUNT(*) FROM {quote(self.table_name)} WHERE id <= :last_id",
+                                           last_id=last_id)
+                    if covered == await scalar(f"SELECT row_count FROM {quote(total.name)}"):
+                        mode = "merged"
+                if mode != "kept":
+                    next_id = await scalar(f"SELECT MAX(id) FROM {quote(self.table_name)}") or 0
+                    for rollup in rollups:
+                        staged = quote(rollup.name + "_next")
+                        await conn.execute(text(f"DROP TABLE IF EXISTS {staged}"))
+                        if mode == "merged":
+                            sql = rollup.merge_sql(quote, f"id > {int(last_id)} AND id <= {int(next_id)}")
+                        else:
+                            sql = rollup.build_sql(quote, f"id <= {int(next_id)}")
+                        await conn.execute(text(f"CREATE TABLE {staged} AS {sql}"))
+                    # the only statements that lock the live tables; the locks are held until the commit just below
+                    for rollup in rollups:
+                        await conn.execute(text(f"DROP TABLE IF EXISTS {quote(rollup.name)}"))
+                        await conn.execute(text(f"ALTER TABLE {quote(rollup.name + '_next')} "
+                                                f"RENAME TO {quote(rollup.name)}"))
+                    await write_data_version(conn, self.version_key, version)
+                    await write_data_version(conn, self.last_id_key, next_id)
+                for rollup in rollups:
+                    rollup.groups = await scalar(f"SELECT COUNT(*) FROM {quote(rollup.name)}")
+                self.base_rows = await scalar(f"SELECT row_count FROM {quote(total.name)}") or 0
+            get_data_versions().invalidate(self.version_key)
+            self.rollups = sorted(rollups, key=lambda rollup: rollup.groups)
+            self.refreshes += 1
+            self.last_refresh = mode
+            logger.info("Rollups for %s %s in %.2fs: %s (base table %d rows)", self.table_name, mode,
+                        time.perf_counter() - started,
+                        ", ".join(f"{rollup.name}={rollup.groups}" for rollup in self.rollups), self.base_rows)
+
+    async def current(self) -> bool:
+        # Whether the rollup tables were built from the base table's current data version. After a load they
+        # are behind until the worker that ran it has rebuilt them; until then queries read the base table.
+        versions = get_data_versions()
+        return await versions.get(self.version_key) >= await versions.get(self.table_name)
+
+    # --- routing ---
+    def route(self, sql: str):
+        # Returns (sql, rollup): the rewritten SQL and the rollup it reads, or the original SQL and None.
+        if not self.rollups:
+            return sql, None
+        try:
+            tree = sqlglot.parse_one(sql, read="postgres")
+            rollup = self._match(tree)
+            routed = self._rewrite(tree, rollup).sql(dialect=self.dialect)
+        except (NotRoutable, sqlglot.errors.SqlglotError) as e:
+            self.fallthroughs += 1
+            logger.info("Rollup router: base table scan (%s): %s", e, sql)
+            return sql, None
+        self.rewrites += 1
+        logger.info("Rollup router: answered from %s (%d rows instead of %d, ~%.0fx fewer): %s", rollup.name,
+                    rollup.groups, self.base_rows, self.base_rows / max(rollup.groups, 1), routed)
+        return routed, rollup
+
+    def _match(self, tree) -> Rollup:
+        if not isinstance(tree, exp.Select):
+            raise NotRoutable("not a SELECT")
+        for arg in ("joins", "with", "with_", "laterals", "windows", "qualify"):
+            if tree.args.get(arg):
+                raise NotRoutable(arg)
+        source = tree.args.get("from_") or tree.args.get("from")
+        if source is None or not isinstance(source.this, exp.Table) or source.this.name != self.table_name:
+            raise NotRoutable(f"source is not {self.table_name}")
+        if any(isinstance(node, (exp.Select, exp.Subquery, exp.Window)) for node in tree.walk() if node is not tree):
+            raise NotRoutable("subquery or window function")
+        if any(isinstance(node, exp.Star) for node in tree.expressions):
+            raise NotRoutable("SELECT *")
+        aggregates = list(tree.find_all(exp.AggFunc))
+        if not aggregates:
+            raise NotRoutable("no aggregates")
+        measures = set(self.rollups[0].measures)
+        for node in aggregates:
+            if isinstance(node, exp.Count) and isinstance(node.this, exp.Star):
+                continue
+            if type(node) not in _REWRITES or not isinstance(node.this, exp.Column) or node.this.name not in measures:
+                raise NotRoutable(f"aggregate {node.sql()}")
+
+        aliases = {node.alias for node in tree.expressions if isinstance(node, exp.Alias)}
+        order = tree.args.get("order")
+        needed = set()
+        for column in tree.find_all(exp.Column):
+            if column.find_ancestor(exp.AggFunc):
+                continue
+            if order and column.find_ancestor(exp.Order) is order and not column.table and column.name in aliases:
+                continue
+            if column.name not in self.dimensions:
+                raise NotRoutable(f"column {column.name} is not a rollup dimension")
+            needed.add(column.name)
+        # rollups are sorted smallest first
+        rollup = next((rollup for rollup in self.rollups if needed <= set(rollup.dimensions)), None)
+        if rollup is None:
+            raise NotRoutable(f"no rollup covers {sorted(needed)}")
+        return rollup
+
+    def _rewrite(self, tree, rollup: Rollup):
+        tree = tree.copy()
+        table = (tree.args.get("from_") or tree.args.get("from")).this
+        # Keep the base table name as alias so qualified references (financials.project) still resolve
+        table.replace(exp.to_table(rollup.name, quoted=True).as_(table.alias_or_name, quoted=True))
+        for index, node in enumerate(tree.expressions):
+            if isinstance(node, exp.AggFunc):
+                # keep the column name the database would have given the bare aggregate
+                name = node.key if self.dialect == "postgres" else node.sql(dialect=self.dialect)
+                tree.expressions[index].replace(exp.alias_(node.copy(), name, quoted=True))
+        return tree.transform(lambda node: _REWRITES[type(node)](node) if type(node) in _REWRITES else node)
+
+    # --- reporting ---
+    def record(self, routed: bool, seconds: float):
+        timing = self._timings[routed]
+        timing[0] += 1
+        timing[1] += seconds
+
+    def stats(self) -> dict:
+        def average_ms(routed):
+            count, total = self._timings[routed]
+            return round(total / count * 1000, 3) if count else None
+        rollup_ms, base_ms = average_ms(True), average_ms(False)
+        return {"rollups": {rollup.name: rollup.groups for rollup in self.rollups}, "base_rows": self.base_rows,
+                "refreshes": self.refreshes, "last_refresh": self.last_refresh, "rewrites": self.rewrites, "fallthroughs": self.fallthroughs,
+                "avg_rollup_query_ms": rollup_ms, "avg_base_query_ms": base_ms,
+                "speedup": round(base_ms / rollup_ms, 1) if rollup_ms and base_ms else None}
+
+def _has_columns(sync_conn, table_name: str, columns: list) -> bool:
+    inspector = inspect(sync_conn)
+    if not inspector.has_table(table_name):
+        return False
+    return [col["name"] for col in inspector.get_columns(table_name)] == columns
+
+def _rollup_column(prefix: str, node) -> exp.Column:
+    return exp.column(f"{prefix}_{node.this.name}", table=node.this.table or None, quoted=True)
+
+def _sum(column) -> exp.Expression:
+    return exp.Sum(this=column)
+
+# Base-table aggregate -> equivalent re-aggregation over a rollup
+_REWRITES = {
+    exp.Sum: lambda node: _sum(_rollup_column("sum", node)),
+    exp.Min: lambda node: exp.Min(this=_rollup_column("min", node)),
+    exp.Max: lambda node: exp.Max(this=_rollup_column("max", node)),
+    exp.Count: lambda node: exp.Coalesce(
+        this=_sum(exp.column("row_count") if isinstance(node.this, exp.Star) else _rollup_column("count", node)),
+        expressions=[exp.Literal.number(0)]),
+    exp.Avg: lambda node: exp.Div(
+        this=exp.cast(_sum(_rollup_column("sum", node)), "double"),
+        expression=exp.Nullif(this=_sum(_rollup_column("count", node)), expression=exp.Literal.number(0))),
+}
+
+_rollup_router = None
+
+def get_rollup_router():
+    # None when ROLLUPS_ENABLED=false
+    global _rollup_router
+    if not ROLLUPS_ENABLED:
+        return None
+    if _rollup_router is None:
+        from backend.db import engine
+        _rollup_router = RollupRouter(engine)
+    return _rollup_router
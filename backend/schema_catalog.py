@@ -0,0 +1,200 @@
+# Schema catalog: table columns and per-column stats loaded once, invalidated by ingestion
+import asyncio
+import logging
+import os
+import time
+from sqlalchemy import inspect, text
+
+# Safety net for multi-worker deployments, where an ingestion in one process cannot invalidate another
+SCHEMA_CATALOG_TTL_SECONDS = float(os.getenv("SCHEMA_CATALOG_TTL_SECONDS", "300"))
+# Collect min/max/distinct stats per column: from the planner statistics on PostgreSQL, elsewhere with one aggregate
+# query per table load, run in the background (until it finishes the previous load's stats are shown)
+SCHEMA_CATALOG_STATS = os.getenv("SCHEMA_CATALOG_STATS", "true").lower() == "true"
+# Rows sampled per table load, for schema linking's value index and prompt examples (0 = none)
+SCHEMA_CATALOG_SAMPLE_ROWS = int(os.getenv("SCHEMA_CATALOG_SAMPLE_ROWS", "100"))
+
+# Bookkeeping columns (delta ingestion's row and key hashes) kept out of prompts, stats, rollups and the columnar mirror
+INTERNAL_COLUMNS = ("_row_hash", "_key_hash")
+
+_NUMERIC_OR_DATE = ("int", "float", "double", "numeric", "decimal", "real", "date", "time")
+
+logger = logging.getLogger(__name__)
+
+class ColumnInfo:
+    def __init__(self, name: str, data_type: str):
+        self.name = name
+        self.data_type = data_type
+        self.distinct_estimate = None
+        self.min_value = None
+        self.max_value = None
+
+    @property
+    def is_ordered(self) -> bool:
+        return any(token in self.data_type.lower() for token in _NUMERIC_OR_DATE)
+
+    def describe(self, with_stats: bool = False) -> str:
+        line = f"{self.name}: {self.data_type}"
+        if not with_stats:
+            return line
+        stats = []
+        if self.min_value is not None:
+            stats.append(f"min {self.min_value}, max {self.max_value}")
+        if self.distinct_estimate is not None:
+            stats.append(f"~{self.distinct_estimate} distinct")
+        return f"{line} ({'; '.join(stats)})" if stats else line
+
+class TableSchema:
+    def __init__(self, name: str, columns: list, version: int, row_count: int = None):
+        self.name = name
+        self.columns = columns
+        self.version = version
+        self.row_count = row_count
+        self.sample_rows = []
+        self.loaded_at = time.time()
+
+    def column(self, name: str):
+        return next((col for col in self.columns if col.name == name), None)
+
+    def describe(self, with_stats: bool = False) -> str:
+        # Same "column_name: data_type" lines get_table_schema has always returned
+        return "\n".join(col.describe(with_stats) for col in self.columns)
+
+class SchemaCatalog:
+    def __init__(self, engine, ttl: float = SCHEMA_CATALOG_TTL_SECONDS, collect_stats: bool = SCHEMA_CATALOG_STATS,
+                 sample_rows: int = SCHEMA_CATALOG_SAMPLE_ROWS):
+        self.engine = engine
+        self.ttl = ttl
+        self.collect_stats = collect_stats
+        self.sample_rows = sample_rows
+        self.version = 0
+        self.loads = 0
+        self._tables = {}
+        # invalidated tables, whose stats a reload keeps until its own are collected
+        self._previous = {}
+        self._stats_tasks = {}
+        self._lock = asyncio.Lock()
+
+    async def get(self, table_name: str = 'financials') -> TableSchema:
+        table = self._tables.get(table_name)
+        if table is not None and time.time() - table.loaded_at < self.ttl:
+            return table
+        async with self._lock:
+            table = self._tables.get(table_name)
+            if table is None or time.time() - table.loaded_at >= self.ttl:
+                table = await self._load(table_name)
+                self._tables[table_name] = table
+        return table
+
+    def invalidate(self, table_name: str = None):
+        for name in list(self._tables) if table_name is None else [table_name]:
+            if name in self._tables:
+                self._previous[name] = self._tables.pop(name)
+        self.version += 1
+
+    async def _load(self, table_name: str) -> TableSchema:
+        self.loads += 1
+        async with self.engine.connect() as conn:
+            if conn.dialect.name == "postgresql":
+                result = await conn.execute(
+                    text("SELECT column_name, data_type FROM information_schema.columns "
+                         "WHERE table_name = :table_name ORDER BY ordinal_position"),
+                    {"table_name": table_name},
+                )
+                columns = [ColumnInfo(row[0], row[1]) for row in result.fetchall() if row[0] not in INTERNAL_COLUMNS]
+            else:
+                raw = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_columns(table_name)
+                                          if inspect(sync_conn).has_table(table_name) else [])
+                columns = [ColumnInfo(col["name"], str(col["type"]).lower()) for col in raw if col["name"] not in INTERNAL_COLUMNS]
+            table = TableSchema(table_name, columns, self.version)
+            if self.collect_stats and columns:
+                if conn.dialect.name == "postgresql":
+                    await self._load_pg_stats(conn, table)
+                else:
+                    self._keep_stats(table, self._previous.pop(table_name, None) or self._tables.get(table_name))
+                    self._collect_stats(table)
+            if self.sample_rows and columns:
+                preparer = conn.dialect.identifier_preparer
+                result = await conn.execute(text(f"SELECT {', '.join(preparer.quote(col.name) for col in columns)} "
+                                                 f"FROM {preparer.quote(table_name)} LIMIT {int(self.sample_rows)}"))
+                table.sample_rows = [dict(row._mapping) for row in result]
+        logger.info("Loaded schema for %s (%d columns, catalog version %d)", table_name, len(columns), self.version)
+        return table
+
+    async def _load_pg_stats(self, conn, table: TableSchema):
+        # Planner statistics, no scan of the table: the row estimate from pg_class, distinct counts from pg_stats
+        # (negative n_distinct is a fraction of the row count) and min/max from the ends of the histogram and the
+        # most common values. Empty until the table has been analyzed.
+        table.row_count = (await conn.execute(text("SELECT reltuples::bigint FROM pg_class WHERE relname = :table_name"),
+                                              {"table_name": table.name})).scalar()
+        if table.row_count is not None and table.row_count < 0:
+            table.row_count = None
+        result = await conn.execute(
+            text("SELECT attname, n_distinct, histogram_bounds::text, most_common_vals::text FROM pg_stats "
+                 "WHERE tablename = :table_name"),
+            {"table_name": table.name},
+        )
+        for name, n_distinct, bounds, common in result.fetchall():
+            col = table.column(name)
+            if col is None:
+                continue
+            if n_distinct is not None:
+                col.distinct_estimate = int(n_distinct if n_distinct >= 0 else -n_distinct * (table.row_count or 0))
+            if col.is_ordered:
+                values = _pg_array(bounds) + _pg_array(common)
+                if values:
+                    numeric = not any(token in col.data_type.lower() for token in ("date", "time"))
+                    values = sorted(values, key=float if numeric else str)
+                    col.min_value, col.max_value = values[0], values[-1]
+
+    def _keep_stats(self, table: TableSchema, previous: TableSchema):
+        # The previous load's stats for the columns that kept their type, shown until the new ones are collected
+        if previous is None:
+            return
+        table.row_count = previous.row_count
+        for col in table.columns:
+            old = previous.column(col.name)
+            if old is not None and old.data_type == col.data_type:
+                col.distinct_estimate, col.min_value, col.max_value = old.distinct_estimate, old.min_value, old.max_value
+
+    def _collect_stats(self, table: TableSchema):
+        # Off the request path: a scan of the whole table. A newer load of the same table supersedes it.
+        running = self._stats_tasks.get(table.name)
+        if running is not None and not running.done():
+            running.cancel()
+        self._stats_tasks[table.name] = asyncio.create_task(self._scan_stats(table))
+
+    async def _scan_stats(self, table: TableSchema):
+        try:
+            async with self.engine.connect() as conn:
+                preparer = conn.dialect.identifier_preparer
+                selects = ["COUNT(*)"]
+                for col in table.columns:
+                    quoted = preparer.quote(col.name)
+                    if col.is_ordered:
+                        selects += [f"MIN({quoted})", f"MAX({quoted})"]
+                    selects.append(f"COUNT(DISTINCT {quoted})")
+                result = await conn.execute(text(f"SELECT {', '.join(selects)} FROM {preparer.quote(table.name)}"))
+                values = iter(result.fetchone())
+        except Exception as e:
+            logger.warning("Stats for %s not collected: %s", table.name, e)
+            return
+        table.row_count = next(values)
+        for col in table.columns:
+            if col.is_ordered:
+                col.min_value, col.max_value = next(values), next(values)
+            col.distinct_estimate = next(values)
+
+def _pg_array(literal: str) -> list:
+    # Elements of a one-dimensional array literal such as {1,2.5} or {"2024-01-01 00:00:00",...}
+    if not literal or literal == "{}":
+        return []
+    return [value.strip('"') for value in literal[1:-1].split(",") if value != "NULL"]
+
+_schema_catalog = None
+
+def get_schema_catalog() -> SchemaCatalog:
+    global _schema_catalog
+    if _schema_catalog is None:
+        from backend.db import engine
+        _schema_catalog = SchemaCatalog(engine)
+    return _schema_catalog
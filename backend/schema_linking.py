@@ -0,0 +1,153 @@
+# Schema linking for SQL generation: a small local index over column names, descriptions and sampled values
+# picks the columns a question is about, so wide tables (one column per Excel header) send a compact schema
+# and a few example rows instead of every column.
+import json
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+
+SCHEMA_LINKING = os.getenv("SCHEMA_LINKING", "true").lower() == "true"
+# Tables up to this many columns are sent whole; above it at most SCHEMA_LINK_MAX_COLUMNS are picked
+SCHEMA_LINK_MIN_COLUMNS = int(os.getenv("SCHEMA_LINK_MIN_COLUMNS", "30"))
+SCHEMA_LINK_MAX_COLUMNS = int(os.getenv("SCHEMA_LINK_MAX_COLUMNS", "12"))
+SCHEMA_LINK_MIN_SCORE = float(os.getenv("SCHEMA_LINK_MIN_SCORE", "0.15"))
+# Columns always sent (e.g. the dimensions most questions group by), comma separated
+SCHEMA_LINK_ALWAYS = [name.strip() for name in os.getenv("SCHEMA_LINK_ALWAYS", "").split(",") if name.strip()]
+SCHEMA_LINK_EXAMPLE_ROWS = int(os.getenv("SCHEMA_LINK_EXAMPLE_ROWS", "3"))
+# Column descriptions, JSON {"table": {"column": "description"}} inline or a path to a JSON file
+SCHEMA_DESCRIPTIONS = os.getenv("SCHEMA_DESCRIPTIONS", "")
+
+# Distinct sampled values indexed per column
+_MAX_VALUES = 20
+_WORD = re.compile(r"[a-z]+|\d+")
+
+def tokenize(text: str) -> list:
+    # snake_case, camelCase and digits split apart; plural "s" folded
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", str(text)).lower()
+    return [word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+            for word in _WORD.findall(text)]
+
+def features(words: list) -> Counter:
+    # Whole words plus character trigrams, so "rev" or "forecasted" still meet "revenue" / "forecast"
+    terms = Counter(words)
+    for word in words:
+        if len(word) > 3 and not word.isdigit():
+            padded = f"^{word}$"
+            terms.update(f"#{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    return terms
+
+def load_descriptions(spec: str = SCHEMA_DESCRIPTIONS) -> dict:
+    if not spec.strip():
+        return {}
+    if spec.lstrip().startswith("{"):
+        return json.loads(spec)
+    return json.loads(Path(spec).read_text(encoding="utf-8"))
+
+class ColumnIndex:
+    # TF-IDF vectors (words + trigrams) per column, built once per loaded TableSchema
+    def __init__(self, table, descriptions: dict = None):
+        self.table = table
+        descriptions = descriptions or {}
+        self.values = {}
+        documents = {}
+        for col in table.columns:
+            # the name counts twice: it is what the model will have to write
+            words = tokenize(col.name) * 2 + tokenize(descriptions.get(col.name, ""))
+            values = list(dict.fromkeys(str(row[col.name]) for row in table.sample_rows
+                                        if isinstance(row.get(col.name), str)))[:_MAX_VALUES]
+            self.values[col.name] = [value.lower() for value in values if len(value) >= 3]
+            for value in values:
+                words += tokenize(value)
+            documents[col.name] = features(words)
+        frequency = Counter(term for terms in documents.values() for term in terms)
+        self.idf = {term: math.log(1 + len(documents) / df) for term, df in frequency.items()}
+        self.vectors = {name: self._normalize(terms) for name, terms in documents.items()}
+
+    def _normalize(self, terms: Counter) -> dict:
+        vector = {term: (1 + math.log(tf)) * self.idf[term] for term, tf in terms.items() if term in self.idf}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        return {term: weight / norm for term, weight in vector.items()}
+
+    def scores(self, question: str) -> dict:
+        query = self._normalize(features(tokenize(question)))
+        scores = {name: sum(weight * vector.get(term, 0.0) for term, weight in query.items())
+                  for name, vector in self.vectors.items()}
+        lowered = question.lower()
+        for name, values in self.values.items():
+            # a sampled value quoted in the question ("Project 7", "EMEA") links its column outright
+            if any(value in lowered for value in values):
+                scores[name] += 1.0
+        return scores
+
+class SchemaLinker:
+    def __init__(self, min_columns: int = SCHEMA_LINK_MIN_COLUMNS, max_columns: int = SCHEMA_LINK_MAX_COLUMNS,
+                 min_score: float = SCHEMA_LINK_MIN_SCORE, always: list = None,
+                 example_rows: int = SCHEMA_LINK_EXAMPLE_ROWS, descriptions: dict = None):
+        self.min_columns = min_columns
+        self.max_columns = max_columns
+        self.min_score = min_score
+        self.always = SCHEMA_LINK_ALWAYS if always is None else always
+        self.example_rows = example_rows
+        self.descriptions = load_descriptions() if descriptions is None else descriptions
+        self.links = 0
+        self.fallbacks = 0
+        self.columns_sent = 0
+        self.columns_total = 0
+        self._indexes = {}
+
+    def index(self, table) -> ColumnIndex:
+        cached = self._indexes.get(table.name)
+        if cached is None or cached.table is not table:
+            cached = self._indexes[table.name] = ColumnIndex(table, self.descriptions.get(table.name))
+        return cached
+
+    def link(self, question: str, table, policy) -> list:
+        # Column names for the prompt, in table order; every visible column for narrow tables
+        visible = [col.name for col in table.columns if not policy.hidden(col.name)]
+        if len(visible) <= self.min_columns:
+            return visible
+        scores = self.index(table).scores(question)
+        ranked = sorted((name for name in visible if scores[name] >= self.min_score), key=lambda name: -scores[name])
+        picked = set(ranked[:self.max_columns]) | {name for name in self.always if name in visible}
+        if not ranked:
+            # nothing matched: the leading columns are usually the identifying ones
+            self.fallbacks += 1
+            picked |= set(visible[:self.max_columns])
+        self.links += 1
+        self.columns_sent += len(picked)
+        self.columns_total += len(visible)
+        return [name for name in visible if name in picked]
+
+    def prompt(self, question: str, table, policy) -> str:
+        # The schema block of the SQL prompt: linked columns with stats, then a few example rows of them.
+        # Narrow tables get the full schema as before.
+        columns = self.link(question, table, policy)
+        omitted = sum(1 for col in table.columns if not policy.hidden(col.name)) - len(columns)
+        if not omitted:
+            return policy.describe(table, with_stats=True)
+        schema = policy.describe(table, with_stats=True, columns=set(columns))
+        schema += f"\n({omitted} other columns not related to the question are not shown)"
+        shown = [name for name in columns if not policy.protected(name)]
+        rows = table.sample_rows[:self.example_rows]
+        if shown and rows:
+            lines = [" | ".join(shown)] + [" | ".join(str(row.get(name)) for name in shown) for row in rows]
+            schema += "\n\nExample rows:\n" + "\n".join(lines)
+        return schema
+
+    def stats(self) -> dict:
+        return {
+            "links": self.links,
+            "fallbacks": self.fallbacks,
+            "avg_columns_sent": round(self.columns_sent / self.links, 1) if self.links else 0.0,
+            "avg_columns_total": round(self.columns_total / self.links, 1) if self.links else 0.0,
+        }
+
+_schema_linker = None
+
+def get_schema_linker():
+    global _schema_linker
+    if _schema_linker is None and SCHEMA_LINKING:
+        _schema_linker = SchemaLinker()
+    return _schema_linker
@@ -1,6 +1,6 @@
 # Pydantic schemas for API requests and responses
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 class ChatMessage(BaseModel):
     session_id: str
@@ -12,16 +12,50 @@ class ChatMessage(BaseModel):
 class ChatHistoryRequest(BaseModel):
     session_id: str
     user_id: str
+    # page size (None = everything after the cursor) and incremental cursor (last_ts, last_id of the previous response)
+    limit: Optional[int] = None
+    after_ts: Optional[float] = None
+    after_id: Optional[str] = None
 
 class RAGQueryRequest(BaseModel):
     query: str
     user_id: Optional[str] = None
 
-class ExcelIngestRequest(BaseModel):
+class IngestOptions(BaseModel):
+    # "append" or "delta" (INGEST_MODE when empty); delta merges rows on natural_key (INGEST_NATURAL_KEY)
+    mode: Optional[str] = None
+    natural_key: Optional[List[str]] = None
+    # delta only: delete target rows whose key is missing from the load, limited to rows sharing a
+    # delete_scope value (e.g. region) with it
+    delete_missing: bool = False
+    delete_scope: Optional[List[str]] = None
+
+class ExcelIngestRequest(IngestOptions):
     container_name: str
     blob_name: str
+    sheet_name: Optional[str] = None
+
+class IngestJobRequest(IngestOptions):
+    container_name: str
+    # every .xlsx/.xlsm blob under the prefix (the whole container when empty)
+    prefix: Optional[str] = None
+    table_name: str = 'financials'
+    # sheets to load from each workbook; all sheets when empty
+    sheet_names: Optional[List[str]] = None
+    # reload workbooks even when their ETag was already ingested
+    force: bool = False
+    # parse only columns the table already has; new headers in the workbooks are ignored
+    known_columns_only: bool = False
 
 class AdvancedRAGRequest(BaseModel):
     query: str
     user_id: Optional[str] = None
+    # with user_id set, the endpoint saves the question/answer turn to this chat session
+    session_id: Optional[str] = None
     user_role: Optional[str] = 'user'
+    # attach per-stage timings and round-trip counts to the response
+    include_timings: bool = False
+
+class ResultPageRequest(BaseModel):
+    result_id: str
+    page: int = 1
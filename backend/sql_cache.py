@@ -0,0 +1,207 @@
+# NL->SQL cache in front of generate_sql_from_nl, keyed on the normalized question and a schema fingerprint
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+# "memory" (in-process LRU with TTL), "sqlite" (on-disk, survives restarts) or "off"
+SQL_CACHE_BACKEND = os.getenv("SQL_CACHE_BACKEND", "memory")
+SQL_CACHE_TTL_SECONDS = float(os.getenv("SQL_CACHE_TTL_SECONDS", "86400"))
+SQL_CACHE_MAX_ENTRIES = int(os.getenv("SQL_CACHE_MAX_ENTRIES", "2048"))
+SQL_CACHE_PATH = os.getenv("SQL_CACHE_PATH", str(BASE_DIR / '.cache' / 'sql_cache.db'))
+
+# (pattern, group index of year, month, day)
+_DATE_PATTERNS = [
+    (re.compile(r"\b(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\b"), (1, 2, 3)),
+    (re.compile(r"\b(\d{1,2})/(\d{1,2})/(\d{4})\b"), (3, 1, 2)),
+]
+_NUMBER = re.compile(r"(?<![\w.])\d[\d,]*(?:\.\d+)?(?![\w.])")
+_LITERAL_MARKER = "__lit{}__"
+
+def _canonical_number(token: str) -> str:
+    value = token.replace(",", "")
+    if "." in value:
+        value = value.rstrip("0").rstrip(".")
+    return value
+
+def normalize_question(question: str):
+    # Returns (template, literals): case/whitespace folded, dates in ISO form, numbers without separators,
+    # and every date/number literal replaced by a positional placeholder.
+    literals = []
+
+    def keep(value):
+        literals.append(value)
+        return f" <lit{len(literals) - 1}> "
+
+    text = question.strip().lower()
+    for pattern, (year, month, day) in _DATE_PATTERNS:
+        def to_iso(match):
+            try:
+                value = date(int(match.group(year)), int(match.group(month)), int(match.group(day)))
+            except ValueError:
+                return match.group(0)
+            return keep(value.isoformat())
+        text = pattern.sub(to_iso, text)
+    text = _NUMBER.sub(lambda m: keep(_canonical_number(m.group(0))), text)
+    text = re.sub(r"[?.!]+$", "", text.strip())
+    text = re.sub(r"\s+", " ", text).strip()
+    return text, literals
+
+def schema_fingerprint(table_schema: str) -> str:
+    return hashlib.sha256(table_schema.encode("utf-8")).hexdigest()[:16]
+
+def _key(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+def parameterize_sql(sql: str, literals: list):
+    # Turn generated SQL into a template by locating each question literal exactly once; returns None when
+    # the mapping is ambiguous (literal missing, repeated, or duplicated in the question).
+    if not literals or len(set(literals)) != len(literals):
+        return None
+    template = sql
+    for i, literal in enumerate(literals):
+        pattern = re.compile(rf"(?<![\w.]){re.escape(literal)}(?![\w.])")
+        if len(pattern.findall(template)) != 1:
+            return None
+        template = pattern.sub(_LITERAL_MARKER.format(i), template)
+    return template
+
+def render_sql(template: str, literals: list) -> str:
+    for i, literal in enumerate(literals):
+        template = template.replace(_LITERAL_MARKER.format(i), literal)
+    return template
+
+class MemoryCacheBackend:
+    def __init__(self, max_entries: int = SQL_CACHE_MAX_ENTRIES, ttl: float = SQL_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str):
+        self._entries[key] = (value, time.time() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class SQLiteCacheBackend:
+    def __init__(self, path: str = SQL_CACHE_PATH, ttl: float = SQL_CACHE_TTL_SECONDS):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS sql_cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+        self._conn.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM sql_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                self._conn.execute("DELETE FROM sql_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            return row[0]
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO sql_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                               (key, value, time.time() + self.ttl))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM sql_cache")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sql_cache").fetchone()[0]
+
+class NLSQLCache:
+    # Exact entries answer repeats of the same question; template entries (literals parameterized out of
+    # the SQL) answer the same question with different years/amounts/dates.
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.template_hits = 0
+        self.misses = 0
+
+    async def get_or_generate(self, question: str, table_schema: str, generate) -> str:
+        template, literals = normalize_question(question)
+        fingerprint = schema_fingerprint(table_schema)
+        exact_key = _key(fingerprint, template, literals)
+        sql = self.backend.get(exact_key)
+        if sql is not None:
+            self.hits += 1
+            return sql
+        template_key = _key(fingerprint, template) if literals else None
+        if template_key:
+            sql_template = self.backend.get(template_key)
+            if sql_template is not None:
+                self.hits += 1
+                self.template_hits += 1
+                return render_sql(sql_template, literals)
+        self.misses += 1
+        sql = await generate(question, table_schema)
+        self.backend.set(exact_key, sql)
+        if template_key:
+            sql_template = parameterize_sql(sql, literals)
+            if sql_template is not None:
+                self.backend.set(template_key, sql_template)
+        return sql
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "template_hits": self.template_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+class _NoCache:
+    async def get_or_generate(self, question: str, table_schema: str, generate) -> str:
+        return await generate(question, table_schema)
+
+    def stats(self) -> dict:
+        return {"backend": "off"}
+
+_sql_cache = None
+
+def get_sql_cache():
+    global _sql_cache
+    if _sql_cache is None:
+        if SQL_CACHE_BACKEND == "sqlite":
+            _sql_cache = NLSQLCache(SQLiteCacheBackend())
+        elif SQL_CACHE_BACKEND == "off":
+            _sql_cache = _NoCache()
+        else:
+            _sql_cache = NLSQLCache(MemoryCacheBackend())
+    return _sql_cache
@@ -0,0 +1,244 @@
+# Guard for LLM-generated SQL: a single read-only SELECT with a row cap, an EXPLAIN cost check before it
+# runs, and a read-only transaction with a per-query timeout. Rejections and estimated vs actual cost are
+# logged (and kept in stats()) so the thresholds can be tuned.
+import json
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+import sqlglot
+from sqlglot import exp
+from sqlalchemy import text
+
+# Row cap: a LIMIT is added when the query has none and larger limits are lowered (0 = no cap). The query
+# fetches one row more so a cut-off result can be reported (see row_cap)
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", "10000"))
+# EXPLAIN cost threshold - PostgreSQL planner cost units, or estimated rows visited on SQLite (0 = no EXPLAIN)
+SQL_MAX_COST = float(os.getenv("SQL_MAX_COST", "10000000"))
+# Over the threshold: "reject", or "limit" to retry with SQL_COST_FALLBACK_ROWS and reject only if still over
+SQL_COST_ACTION = os.getenv("SQL_COST_ACTION", "limit")
+SQL_COST_FALLBACK_ROWS = int(os.getenv("SQL_COST_FALLBACK_ROWS", "1000"))
+# Per-query timeout inside the read-only transaction (0 = none)
+SQL_QUERY_TIMEOUT_MS = int(os.getenv("SQL_QUERY_TIMEOUT_MS", "15000"))
+
+_SQLGLOT_DIALECTS = {"postgresql": "postgres", "sqlite": "sqlite"}
+_WRITE_NODES = tuple(getattr(exp, name) for name in ("Insert", "Update", "Delete", "Merge", "Create", "Drop", "Alter",
+                                                     "TruncateTable", "Command", "Copy", "Set", "Pragma")
+                     if hasattr(exp, name))
+# Functions with side effects or access outside the query (sleep, file/large-object access, other sessions)
+_BLOCKED_FUNCTIONS = {"pg_sleep", "pg_sleep_for", "pg_sleep_until", "pg_read_file", "pg_read_binary_file",
+                      "pg_ls_dir", "pg_stat_file", "lo_import", "lo_export", "dblink", "dblink_exec",
+                      "pg_terminate_backend", "pg_cancel_backend", "set_config", "pg_advisory_lock",
+                      "pg_advisory_xact_lock", "pg_reload_conf", "load_extension", "readfile", "writefile"}
+# SQLite plans carry no row estimates: an index search is taken as ~10 rows, an unknown source (CTE,
+# subquery) as 1000
+_SQLITE_SEARCH_ROWS = 10
+_SQLITE_UNKNOWN_ROWS = 1000
+
+logger = logging.getLogger(__name__)
+
+class QueryRejected(Exception):
+    pass
+
+class SQLGuard:
+    def __init__(self, dialect: str, max_rows: int = SQL_MAX_ROWS, max_cost: float = SQL_MAX_COST,
+                 cost_action: str = SQL_COST_ACTION, fallback_rows: int = SQL_COST_FALLBACK_ROWS,
+                 timeout_ms: int = SQL_QUERY_TIMEOUT_MS, samples: int = 100):
+        if cost_action not in ("reject", "limit"):
+            raise ValueError(f"SQL_COST_ACTION must be 'reject' or 'limit', not {cost_action!r}")
+        self.dialect = dialect
+        self.output_dialect = _SQLGLOT_DIALECTS.get(dialect, dialect)
+        self.max_rows = max_rows
+        self.max_cost = max_cost
+        self.cost_action = cost_action
+        self.fallback_rows = fallback_rows
+        self.timeout_ms = timeout_ms
+        self.checked = 0
+        self.limited = 0
+        self.rewritten = 0
+        self.timeouts = 0
+        self.rejections = {}
+        # (estimated cost, actual ms, rows) of recent queries, for tuning SQL_MAX_COST
+        self.recent = deque(maxlen=samples)
+
+    # --- static checks ---
+    def check(self, sql: str) -> str:
+        # Returns the SQL to run (with a LIMIT when capped); raises QueryRejected
+        self.checked += 1
+        try:
+            statements = [tree for tree in sqlglot.parse(sql, read="postgres") if tree is not None]
+        except sqlglot.errors.SqlglotError as e:
+            self._reject("parse_error", f"could not parse SQL ({e})", sql)
+        if len(statements) != 1:
+            self._reject("multiple_statements", f"expected one statement, got {len(statements)}", sql)
+        tree = statements[0]
+        if not isinstance(tree, exp.Query):
+            self._reject("not_select", f"only SELECT queries are allowed, not {tree.key.upper()}", sql)
+        for node in tree.walk():
+            if isinstance(node, _WRITE_NODES):
+                self._reject("not_select", f"{node.key.upper()} is not allowed", sql)
+            if isinstance(node, exp.Select) and (node.args.get("into") or node.args.get("locks")):
+                self._reject("not_select", "SELECT INTO / FOR UPDATE is not allowed", sql)
+            if isinstance(node, exp.Func):
+                name = (node.name if isinstance(node, exp.Anonymous) else node.sql_name()).lower()
+                if name in _BLOCKED_FUNCTIONS:
+                    self._reject("blocked_function", f"function {name}() is not allowed", sql)
+        limit = self._limit(tree)
+        if self.max_rows and (limit is None or limit > self.max_rows):
+            self.limited += 1
+            return tree.limit(self.max_rows + 1).sql(dialect=self.output_dialect)
+        return sql
+
+    def row_cap(self, sql: str, rewritten: bool = False):
+        # Rows to keep when `sql` carries the guard's own LIMIT (cap + 1; the cost fallback's when `rewritten`),
+        # else None. A row past the cap means the result was cut off.
+        cap = self.fallback_rows if rewritten else self.max_rows
+        try:
+            limit = self._limit(sqlglot.parse_one(sql, read=self.output_dialect))
+        except sqlglot.errors.SqlglotError:
+            return None
+        return cap if cap and limit == cap + 1 else None
+
+    def _limit(self, tree):
+        # The literal LIMIT of the outer query; None when missing, LIMIT ALL or an expression
+        limit = tree.args.get("limit")
+        if limit is None or not isinstance(limit.expression, exp.Literal) or limit.expression.is_string:
+            return None
+        return int(limit.expression.this)
+
+    def _reject(self, reason: str, message: str, sql: str):
+        self.rejections[reason] = self.rejections.get(reason, 0) + 1
+        logger.warning("SQL guard rejected query (%s): %s: %s", reason, message, sql)
+        raise QueryRejected(message)
+
+    # --- cost ---
+    async def enforce_cost(self, conn, sql: str):
+        # Returns (sql, estimated cost); over the threshold the query is re-planned with a smaller LIMIT
+        # (SQL_COST_ACTION=limit) or rejected
+        if not self.max_cost:
+            return sql, None
+        cost = await self.estimate(conn, sql)
+        if cost is None or cost <= self.max_cost:
+            return sql, cost
+        if self.cost_action == "limit" and self.fallback_rows:
+            tree = sqlglot.parse_one(sql, read=self.output_dialect)
+            limit = self._limit(tree)
+            if isinstance(tree, exp.Query) and (limit is None or limit > self.fallback_rows + 1):
+                rewritten = tree.limit(self.fallback_rows + 1).sql(dialect=self.output_dialect)
+                rewritten_cost = await self.estimate(conn, rewritten)
+                if rewritten_cost is not None and rewritten_cost <= self.max_cost:
+                    self.rewritten += 1
+                    logger.info("SQL guard: estimated cost %.0f over %.0f, running with LIMIT %d (cost %.0f): %s",
+                                cost, self.max_cost, self.fallback_rows, rewritten_cost, sql)
+                    return rewritten, rewritten_cost
+        self._reject("cost", f"estimated cost {cost:.0f} exceeds the limit of {self.max_cost:.0f}", sql)
+
+    async def estimate(self, conn, sql: str):
+        try:
+            if self.dialect == "postgresql":
+                # in a savepoint, so a failed EXPLAIN does not abort the surrounding transaction
+                async with conn.begin_nested():
+                    plan = (await conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))).scalar()
+                plan = json.loads(plan) if isinstance(plan, str) else plan
+                return float(plan[0]["Plan"]["Total Cost"])
+            if self.dialect == "sqlite":
+                return await self._sqlite_estimate(conn, sql)
+        except Exception as e:
+            # the query itself reports the error; without an estimate it runs under the timeout only
+            logger.info("SQL guard: EXPLAIN failed (%s): %s", e, sql)
+        return None
+
+    async def _sqlite_estimate(self, conn, sql: str) -> float:
+        # Rows visited: sibling SCAN/SEARCH steps under one parent are nested loops (multiplied), the
+        # parents (subqueries, compound parts) add up
+        tree = sqlglot.parse_one(sql, read="sqlite")
+        sources = {table.alias_or_name: table.name for table in tree.find_all(exp.Table)}
+        ctes = {cte.alias_or_name for cte in tree.find_all(exp.CTE)}
+        plan = (await conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))).fetchall()
+        loops = {}
+        counts = {}
+        for _, parent, _, detail in plan:
+            words = detail.split()
+            if len(words) < 2 or words[0] not in ("SCAN", "SEARCH"):
+                continue
+            if words[1] == "CONSTANT":
+                rows = 1
+            elif words[0] == "SEARCH":
+                rows = 1 if "PRIMARY KEY" in detail else _SQLITE_SEARCH_ROWS
+            else:
+                name = sources.get(words[1], words[1])
+                if name in ctes or name not in counts and not await self._sqlite_rows(conn, name, counts):
+                    rows = _SQLITE_UNKNOWN_ROWS
+                else:
+                    rows = counts[name]
+            loops[parent] = loops.get(parent, 1) * max(rows, 1)
+        return float(sum(loops.values()))
+
+    async def _sqlite_rows(self, conn, name: str, counts: dict) -> bool:
+        # MAX(rowid) is an index lookup, unlike COUNT(*)
+        try:
+            counts[name] = (await conn.execute(
+                text(f"SELECT MAX(rowid) FROM {conn.dialect.identifier_preparer.quote(name)}"))).scalar() or 0
+            return True
+        except Exception:
+            return False
+
+    # --- execution ---
+    @asynccontextmanager
+    async def read_only(self, conn):
+        # Read-only transaction with the per-query timeout. PostgreSQL: SET TRANSACTION READ ONLY and
+        # SET LOCAL statement_timeout. SQLite: PRAGMA query_only and a progress handler that interrupts the
+        # statement at the deadline (both reset before the connection goes back to the pool).
+        if self.dialect == "postgresql":
+            async with conn.begin():
+                await conn.execute(text("SET TRANSACTION READ ONLY"))
+                if self.timeout_ms:
+                    await conn.execute(text(f"SET LOCAL statement_timeout = {int(self.timeout_ms)}"))
+                yield conn
+            return
+        if self.dialect != "sqlite":
+            async with conn.begin():
+                yield conn
+            return
+        driver = (await conn.get_raw_connection()).driver_connection
+        if self.timeout_ms:
+            deadline = time.monotonic() + self.timeout_ms / 1000
+            await driver.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, 10000)
+        await conn.exec_driver_sql("PRAGMA query_only = ON")
+        try:
+            yield conn
+        finally:
+            await conn.rollback()
+            await conn.exec_driver_sql("PRAGMA query_only = OFF")
+            await conn.commit()
+            if self.timeout_ms:
+                await driver.set_progress_handler(None, 0)
+
+    def timed_out(self, error: Exception) -> bool:
+        message = str(error)
+        timed_out = "statement timeout" in message or "interrupted" in message
+        if timed_out:
+            self.timeouts += 1
+            logger.warning("SQL guard: query exceeded SQL_QUERY_TIMEOUT_MS=%d", self.timeout_ms)
+        return timed_out
+
+    def record(self, sql: str, cost, seconds: float, rows: int):
+        self.recent.append((cost, round(seconds * 1000, 3), rows))
+        logger.info("SQL guard: estimated cost %s, actual %.1f ms, %d rows: %s",
+                    f"{cost:.0f}" if cost is not None else "n/a", seconds * 1000, rows, sql)
+
+    def stats(self) -> dict:
+        return {"checked": self.checked, "limited": self.limited, "rewritten": self.rewritten,
+                "rejected": dict(self.rejections), "timeouts": self.timeouts, "max_rows": self.max_rows,
+                "max_cost": self.max_cost, "timeout_ms": self.timeout_ms,
+                "recent": [{"estimated_cost": cost, "actual_ms": ms, "rows": rows} for cost, ms, rows in self.recent]}
+
+_sql_guard = None
+
+def get_sql_guard() -> SQLGuard:
+    global _sql_guard
+    if _sql_guard is None:
+        from backend.db import engine
+        _sql_guard = SQLGuard(engine.dialect.name)
+    return _sql_guard
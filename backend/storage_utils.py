@@ -1,20 +1,318 @@
 # Azure Blob Storage and Excel ingestion utilities
+import asyncio
+import hashlib
+import importlib.util
+import json
+import logging
+import threading
 import pandas as pd
-from azure.identity.aio import DefaultAzureCredential
-from azure.storage.blob.aio import BlobServiceClient
+from datetime import date, datetime
+from io import BytesIO
+from openpyxl import load_workbook
 import os
+from pathlib import Path
+from backend.tracing import count
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+BASE_DIR = Path(__file__).resolve().parent.parent
 AZURE_STORAGE_ACCOUNT_URL = os.getenv("AZURE_STORAGE_ACCOUNT_URL", "https://yourstorageaccount.blob.core.windows.net/")
+# Takes precedence over the account URL + Azure AD credential (e.g. Azurite's development connection string)
+AZURE_STORAGE_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING", "")
+# "azure" for Blob Storage, "local" for a directory of <container>/<blob name> files (backend/fakes.py)
+BLOB_STORE = os.getenv("BLOB_STORE", "azure")
+BLOB_LOCAL_ROOT = os.getenv("BLOB_LOCAL_ROOT", str(BASE_DIR / "data"))
+EXCEL_SUFFIXES = (".xlsx", ".xlsm")
+# "auto" picks calamine (python-calamine) when installed, otherwise openpyxl
+EXCEL_PARSER = os.getenv("EXCEL_PARSER", "auto")
+# Parsed sheets are staged as Parquet keyed by the workbook's content hash; re-ingests skip parsing
+PARQUET_STAGING = os.getenv("PARQUET_STAGING", "true").lower() == "true"
+PARQUET_STAGING_DIR = os.getenv("PARQUET_STAGING_DIR", str(BASE_DIR / ".cache" / "parquet"))
+PARQUET_STAGING_MAX_BYTES = int(os.getenv("PARQUET_STAGING_MAX_BYTES", str(5 * 1024 ** 3)))
+
+logger = logging.getLogger(__name__)
+
+_blob_service_client = None
+_credential = None
+
+def get_blob_service_client():
+    # One credential and one pooled BlobServiceClient per process
+    global _blob_service_client, _credential
+    if _blob_service_client is None:
+        if BLOB_STORE == "local":
+            from backend.fakes import LocalBlobServiceClient
+            _blob_service_client = LocalBlobServiceClient(BLOB_LOCAL_ROOT)
+        elif AZURE_STORAGE_CONNECTION_STRING:
+            # the Azure SDKs are imported only when a real storage account is used
+            from azure.storage.blob.aio import BlobServiceClient
+            _blob_service_client = BlobServiceClient.from_connection_string(AZURE_STORAGE_CONNECTION_STRING)
+        else:
+            from azure.identity.aio import DefaultAzureCredential
+            from azure.storage.blob.aio import BlobServiceClient
+            _credential = DefaultAzureCredential()
+            _blob_service_client = BlobServiceClient(account_url=AZURE_STORAGE_ACCOUNT_URL, credential=_credential)
+    return _blob_service_client
+
+def set_blob_service_client(client):
+    global _blob_service_client
+    _blob_service_client = client
+
+async def close_blob_service_client():
+    global _blob_service_client, _credential
+    if _blob_service_client is not None:
+        await _blob_service_client.close()
+    if _credential is not None:
+        await _credential.close()
+    _blob_service_client = _credential = None
+
+async def list_excel_blobs(container_name: str, prefix: str = None) -> list:
+    # [{"name", "etag", "size"}] for every Excel workbook under the prefix
+    container_client = get_blob_service_client().get_container_client(container_name)
+    count("blob_round_trips")
+    return [{"name": blob.name, "etag": blob.etag, "size": blob.size}
+            async for blob in container_client.list_blobs(name_starts_with=prefix or None)
+            if blob.name.lower().endswith(EXCEL_SUFFIXES)]
 
 async def fetch_excel_from_blob(container_name: str, blob_name: str) -> bytes:
-    credential = DefaultAzureCredential()
-    blob_service_client = BlobServiceClient(account_url=AZURE_STORAGE_ACCOUNT_URL, credential=credential)
-    container_client = blob_service_client.get_container_client(container_name)
-    blob_client = container_client.get_blob_client(blob_name)
+    blob_client = get_blob_service_client().get_container_client(container_name).get_blob_client(blob_name)
+    count("blob_round_trips")
+    stream = await blob_client.download_blob()
+    return await stream.readall()
+
+async def download_blob_to_file(container_name: str, blob_name: str, path: str) -> str:
+    # Streams the blob to disk chunk by chunk (never held in memory whole); returns the downloaded ETag
+    blob_client = get_blob_service_client().get_container_client(container_name).get_blob_client(blob_name)
+    count("blob_round_trips")
     stream = await blob_client.download_blob()
-    data = await stream.readall()
-    await blob_service_client.close()
-    return data
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as target:
+        async for chunk in stream.chunks():
+            await asyncio.to_thread(target.write, chunk)
+    return stream.properties.etag
+
+def read_excel_to_df(excel_bytes: bytes, sheet_name: str = None) -> pd.DataFrame:
+    frames = list(iter_excel_chunks(excel_bytes, sheet_name=sheet_name))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+class OpenpyxlParser:
+    # Streams rows in openpyxl's read-only mode: low memory, but pure Python and slow on large sheets
+    name = "openpyxl"
+
+    def _open(self, source):
+        return load_workbook(BytesIO(source) if isinstance(source, bytes) else source, read_only=True, data_only=True)
+
+    def sheet_names(self, source) -> list:
+        workbook = self._open(source)
+        try:
+            return list(workbook.sheetnames)
+        finally:
+            workbook.close()
+
+    def iter_rows(self, source, sheet_name: str = None):
+        workbook = self._open(source)
+        try:
+            sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+            yield from sheet.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+
+class CalamineParser:
+    # Rust reader (python-calamine): several times faster than openpyxl; loads one sheet at a time
+    name = "calamine"
+
+    def _open(self, source):
+        from python_calamine import CalamineWorkbook
+        return CalamineWorkbook.from_filelike(BytesIO(source)) if isinstance(source, bytes) else CalamineWorkbook.from_path(source)
+
+    def sheet_names(self, source) -> list:
+        workbook = self._open(source)
+        try:
+            return list(workbook.sheet_names)
+        finally:
+            workbook.close()
+
+    def iter_rows(self, source, sheet_name: str = None):
+        workbook = self._open(source)
+        try:
+            sheet = workbook.get_sheet_by_name(sheet_name) if sheet_name else workbook.get_sheet_by_index(0)
+            for row in sheet.iter_rows():
+                yield tuple(_calamine_cell(value) for value in row)
+        finally:
+            workbook.close()
+
+def _calamine_cell(value):
+    # Match openpyxl's values: None for empty cells (calamine returns ""), int for whole numbers,
+    # datetime for date-only cells
+    if value == "":
+        return None
+    if type(value) is float and value.is_integer():
+        return int(value)
+    if type(value) is date:
+        return datetime(value.year, value.month, value.day)
+    return value
+
+EXCEL_PARSERS = {"openpyxl": OpenpyxlParser, "calamine": CalamineParser}
+
+def get_excel_parser(name: str = None):
+    name = name or EXCEL_PARSER
+    if name == "auto":
+        name = "calamine" if importlib.util.find_spec("python_calamine") else "openpyxl"
+    return EXCEL_PARSERS[name]()
+
+def list_sheet_names(source, parser: str = None) -> list:
+    return get_excel_parser(parser).sheet_names(source)
+
+_DTYPE_CONVERTERS = {
+    "int": lambda series: pd.to_numeric(series, errors="coerce").astype("Int64"),
+    "float": lambda series: pd.to_numeric(series, errors="coerce").astype(float),
+    "datetime": lambda series: pd.to_datetime(series, errors="coerce"),
+    "bool": lambda series: series.astype("boolean"),
+    "text": lambda series: series.where(series.isna(), series.astype(str)),
+}
+
+def apply_dtypes(df: pd.DataFrame, dtypes: dict = None) -> pd.DataFrame:
+    # dtypes: {column: "int" | "float" | "datetime" | "bool" | "text"}, e.g. from the table's catalog entry. A column
+    # the hint does not fit (text in a numeric column, fractions in an int one) keeps its parsed values, so that the
+    # load can widen the column instead of storing NULLs.
+    for col, kind in (dtypes or {}).items():
+        if col in df.columns:
+            try:
+                converted = _DTYPE_CONVERTERS[kind](df[col])
+            except (TypeError, ValueError):
+                continue
+            if converted.notna().sum() == df[col].notna().sum():
+                df[col] = converted
+    return df
+
+def iter_excel_chunks(excel_bytes, chunk_size: int = 10000, sheet_name: str = None, parser: str = None,
+                      dtypes: dict = None, usecols: list = None):
+    # Stream a sheet row by row and yield DataFrames of at most chunk_size rows, so a 200k-row workbook
+    # never has to be materialised as one DataFrame. Accepts bytes or a file path; usecols drops the
+    # other columns, dtypes converts the hinted ones.
+    rows = get_excel_parser(parser).iter_rows(excel_bytes, sheet_name)
+    header = next(rows, None)
+    if header is None:
+        return
+    columns = [str(name).strip() if name is not None else f"column_{i}" for i, name in enumerate(header)]
+    keep = [i for i, name in enumerate(columns) if usecols is None or name in usecols]
+    names = [columns[i] for i in keep]
+    batch = []
+    for row in rows:
+        if not any(value is not None for value in row):
+            continue
+        if usecols is None:
+            batch.append(tuple(row[:len(columns)]) + (None,) * (len(columns) - len(row)))
+        else:
+            batch.append(tuple(row[i] if i < len(row) else None for i in keep))
+        if len(batch) >= chunk_size:
+            yield apply_dtypes(pd.DataFrame.from_records(batch, columns=names), dtypes)
+            batch = []
+    if batch:
+        yield apply_dtypes(pd.DataFrame.from_records(batch, columns=names), dtypes)
+
+# --- Parquet staging cache: parsed sheets keyed by the workbook's content hash ---
+def file_digest(source) -> str:
+    # sha256 of the workbook's bytes or of the file at `source`
+    digest = hashlib.sha256()
+    if isinstance(source, bytes):
+        digest.update(source)
+    else:
+        with open(source, "rb") as workbook:
+            for block in iter(lambda: workbook.read(1024 * 1024), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+def _staging_path(digest: str, sheet_name: str, parser: str, dtypes: dict, usecols: list) -> Path:
+    options = hashlib.sha256(json.dumps([sheet_name, parser, dtypes, usecols], sort_keys=True).encode()).hexdigest()[:16]
+    return Path(PARQUET_STAGING_DIR) / digest[:2] / digest / f"{options}.parquet"
+
+def _arrow_table(frame: pd.DataFrame, schema=None):
+    # Mixed-type object columns are staged as text (what type inference would make of them anyway);
+    # all-empty columns as string instead of Arrow's null type
+    for col in frame.columns:
+        series = frame[col]
+        if series.dtype == object and series.notna().any():
+            try:
+                pa.array(series, from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                frame[col] = series.where(series.isna(), series.astype(str))
+    table = pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+    if schema is None:
+        table = table.cast(pa.schema([pa.field(field.name, pa.string()) if pa.types.is_null(field.type) else field
+                                      for field in table.schema]))
+    return table
+
+def stage_excel_sheet(source, sheet_name: str = None, digest: str = None, chunk_size: int = 10000,
+                      parser: str = None, dtypes: dict = None, usecols: list = None):
+    # Returns the staged Parquet file for one sheet, parsing the workbook only on a cache miss.
+    # None when staging is off, pyarrow is missing or later chunks do not fit the first chunk's types.
+    if not PARQUET_STAGING or pa is None:
+        return None
+    excel_parser = get_excel_parser(parser)
+    sheet_name = sheet_name or excel_parser.sheet_names(source)[0]
+    digest = digest or file_digest(source)
+    path = _staging_path(digest, sheet_name, excel_parser.name, dtypes, usecols)
+    if path.exists():
+        os.utime(path)
+        return str(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # concurrent ingests of the same workbook stage it in parallel threads; each writes its own partial file
+    partial = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.partial")
+    writer = None
+    try:
+        for frame in iter_excel_chunks(source, chunk_size, sheet_name, excel_parser.name, dtypes, usecols):
+            table = _arrow_table(frame, writer.schema if writer is not None else None)
+            if writer is None:
+                writer = pq.ParquetWriter(partial, table.schema)
+            writer.write_table(table)
+        if writer is None:
+            return None
+        writer.close()
+        writer = None
+        os.replace(partial, path)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, ValueError) as e:
+        logger.info("Not staging %s of %s as Parquet: %s", sheet_name, digest, e)
+        return None
+    finally:
+        if writer is not None:
+            writer.close()
+        partial.unlink(missing_ok=True)
+    _evict_staging()
+    return str(path)
+
+def _evict_staging():
+    # Least recently used staged sheets go first once the cache exceeds PARQUET_STAGING_MAX_BYTES
+    files = [(entry.stat().st_mtime, entry.stat().st_size, entry) for entry in Path(PARQUET_STAGING_DIR).glob("*/*/*.parquet")]
+    total = sum(size for _, size, _ in files)
+    for _, size, entry in sorted(files):
+        if total <= PARQUET_STAGING_MAX_BYTES:
+            break
+        entry.unlink(missing_ok=True)
+        total -= size
+
+def iter_parquet_chunks(path: str, chunk_size: int = 10000):
+    # Memory-mapped read of a staged sheet, one record batch (DataFrame) at a time
+    parquet = pq.ParquetFile(path, memory_map=True)
+    for batch in parquet.iter_batches(batch_size=chunk_size):
+        yield batch.to_pandas()
+
+def iter_staged_chunks(source, chunk_size: int = 10000, sheet_name: str = None, digest: str = None,
+                       dtypes: dict = None, usecols: list = None):
+    staged = stage_excel_sheet(source, sheet_name, digest, chunk_size, dtypes=dtypes, usecols=usecols)
+    if staged is not None:
+        yield from iter_parquet_chunks(staged, chunk_size)
+    else:
+        yield from iter_excel_chunks(source, chunk_size, sheet_name, dtypes=dtypes, usecols=usecols)
 
-def read_excel_to_df(excel_bytes: bytes) -> pd.DataFrame:
-    return pd.read_excel(excel_bytes)
+def read_excel_sheet(path: str, sheet_name: str = None, chunk_size: int = 10000, digest: str = None,
+                     dtypes: dict = None, usecols: list = None):
+    # Process-pool entry point: stages one sheet and returns the Parquet path (cheap to send back);
+    # without staging, returns the parsed chunk DataFrames
+    staged = stage_excel_sheet(path, sheet_name, digest, chunk_size, dtypes=dtypes, usecols=usecols)
+    if staged is not None:
+        return staged
+    return list(iter_excel_chunks(path, chunk_size, sheet_name, dtypes=dtypes, usecols=usecols))
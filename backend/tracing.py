@@ -0,0 +1,169 @@
+# Per-request tracing (stage timings, token/row/round-trip counts) and Prometheus-style metrics
+import bisect
+import contextvars
+import os
+import time
+
+# When false, stage()/count() return immediately and nothing is recorded
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+METRICS_PREFIX = "finance"
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, value: float, **labels):
+        self.observe_key(tuple(sorted(labels.items())), value)
+
+    def observe_key(self, key: tuple, value: float):
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self.buckets), 0, 0.0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += 1
+        series[2] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, (counts, count, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._series = {}
+
+    def inc(self, value: float = 1, **labels):
+        self.inc_key(tuple(sorted(labels.items())), value)
+
+    def inc_key(self, key: tuple, value: float):
+        self._series[key] = self._series.get(key, 0) + value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(key)} {value}" for key, value in sorted(self._series.items())]
+        return lines
+
+class MetricsRegistry:
+    def __init__(self, prefix: str = METRICS_PREFIX):
+        self.prefix = prefix
+        self._metrics = {}
+
+    def histogram(self, name: str, help_text: str = "") -> Histogram:
+        name = f"{self.prefix}_{name}"
+        if name not in self._metrics:
+            self._metrics[name] = Histogram(name, help_text or name)
+        return self._metrics[name]
+
+    def counter(self, name: str, help_text: str = "") -> Counter:
+        full_name = f"{self.prefix}_{name}_total"
+        if full_name not in self._metrics:
+            self._metrics[full_name] = Counter(full_name, help_text or f"Total {name.replace('_', ' ')}")
+        return self._metrics[full_name]
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram("stage_seconds", "Time spent in each pipeline stage")
+request_seconds = metrics.histogram("http_request_seconds", "HTTP request latency by route")
+
+class Trace:
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counts = {}
+
+    def summary(self) -> dict:
+        return {"total_ms": round((time.perf_counter() - self.started) * 1000, 3),
+                "stages_ms": {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()},
+                "counts": dict(self.counts)}
+
+def start_trace(name: str):
+    # Returns the new trace, or None when tracing is disabled
+    if not TRACING_ENABLED:
+        return None
+    trace = Trace(name)
+    _current_trace.set(trace)
+    return trace
+
+def current_trace():
+    return _current_trace.get()
+
+class _Stage:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        stage_seconds.observe_key((("stage", self.name),), elapsed)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.stages[self.name] = trace.stages.get(self.name, 0.0) + elapsed
+        return False
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_STAGE = _NoStage()
+
+def stage(name: str):
+    # `with stage("sql_execution"):` - repeated stages in one request add up
+    return _Stage(name) if TRACING_ENABLED else _NO_STAGE
+
+_counters = {}
+
+def count(name: str, value: float = 1):
+    # Adds to the request's counts and to the <prefix>_<name>_total counter
+    if not TRACING_ENABLED:
+        return
+    counter = _counters.get(name)
+    if counter is None:
+        counter = _counters[name] = metrics.counter(name)
+    counter.inc_key((), value)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.counts[name] = trace.counts.get(name, 0) + value
+
+def instrument_engine(engine):
+    # Counts database round trips (one per cursor execute) on an async engine
+    from sqlalchemy import event
+    event.listen(engine.sync_engine, "before_cursor_execute", lambda *args: count("db_round_trips"))
+    return engine
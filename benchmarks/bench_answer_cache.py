@@ -0,0 +1,163 @@
+# Benchmark + checks: a "morning" of repeated dashboard questions through run_rag_pipeline with the answer cache
+# off, in memory and on disk - LLM calls, database queries and time per request - then checks that an
+# ingestion (new data version) and a different role never get a stale or foreign answer - also while the
+# columnar mirror and rollups are still behind a committed load - and that the LRU stays within its byte budget.
+# Usage: python -m benchmarks.bench_answer_cache [--rows 200000] [--requests 200] [--latency-ms 300]
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from collections import Counter
+
+# (phrasings, SQL): several phrasings of one question generate the same SQL
+QUESTIONS = [
+    (["revenue by project", "What is the revenue per project?"],
+     "SELECT project, SUM(revenue) AS revenue FROM financials GROUP BY project"),
+    (["revenue by quarter", "show quarterly revenue"],
+     "SELECT period, SUM(revenue) AS revenue FROM financials GROUP BY period"),
+    (["top 10 projects by revenue"],
+     "SELECT project, SUM(revenue) AS revenue FROM financials GROUP BY project ORDER BY revenue DESC LIMIT 10"),
+    (["how many rows per quarter"], "SELECT period, COUNT(*) AS n FROM financials GROUP BY period"),
+    (["average revenue in 2024-Q1"], "SELECT AVG(revenue) AS revenue FROM financials WHERE period = '2024-Q1'"),
+    (["cost by project"], "SELECT project, SUM(cost) AS cost FROM financials GROUP BY project"),
+]
+ROLES = ["user", "user", "user", "admin"]
+
+def populate(path: str, rows: int):
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE financials (id INTEGER PRIMARY KEY, project TEXT, period TEXT, revenue FLOAT, cost FLOAT)")
+    con.executemany("INSERT INTO financials (project, period, revenue, cost) VALUES (?, ?, ?, ?)",
+                    ((f"Project {i % 200}", f"2024-Q{i % 4 + 1}", float(i % 9973), (i % 9973) * 0.6)
+                     for i in range(rows)))
+    con.commit()
+    con.close()
+
+def workload(requests: int) -> list:
+    rng = random.Random(7)
+    # a few questions dominate, as on a dashboard
+    weights = [8, 5, 3, 2, 1, 1]
+    picks = rng.choices(QUESTIONS, weights=weights, k=requests)
+    return [(rng.choice(phrasings), rng.choice(ROLES)) for phrasings, _ in picks]
+
+async def main(requests: int, latency: float):
+    import pandas as pd
+    from backend import rag_utils, answer_cache
+    from backend.answer_cache import AnswerCache, SizedMemoryBackend, SQLiteSizedBackend, _NoCache
+    from backend.db import engine
+    from backend.fakes import FakeChatModel
+    from backend.ingest_utils import load_frames, after_ingest
+    from backend.llm_client import LLMClient, set_llm_client
+    sql_for = {phrasing: sql for phrasings, sql in QUESTIONS for phrasing in phrasings}
+    model = FakeChatModel(latency=latency, responder=lambda messages: sql_for[messages[-1]["content"]]
+                          if "SQL expert" in messages[0]["content"] else f"Answer over {messages[-1]['content'][:60]!r}")
+    set_llm_client(LLMClient(model))
+    queries = Counter()
+    execute_streaming = rag_utils.execute_streaming
+
+    async def counted(sql):
+        queries["db"] += 1
+        return await execute_streaming(sql)
+    rag_utils.execute_streaming = counted
+
+    def reset(cache):
+        answer_cache._answer_cache = cache
+        model.calls = 0
+        queries.clear()
+
+    requests_list = workload(requests)
+    print(f"{requests} requests over {len(QUESTIONS)} questions, {len(ROLES)} role draws, "
+          f"LLM latency {latency * 1000:.0f} ms (the NL->SQL cache is on in every run)")
+    print(f"{'cache':8s} {'ms/req':>8} {'llm calls':>10} {'db queries':>11}  statuses")
+    baseline = None
+    disk_path = os.path.join(tempfile.mkdtemp(), "answer_cache.db")
+    for label, cache in (("off", _NoCache()), ("memory", AnswerCache(SizedMemoryBackend())),
+                         ("disk", AnswerCache(SQLiteSizedBackend(disk_path)))):
+        reset(cache)
+        statuses = Counter()
+        started = time.perf_counter()
+        for question, role in requests_list:
+            statuses[(await rag_utils.run_rag_pipeline(question, role))["cache"]] += 1
+        ms = (time.perf_counter() - started) / requests * 1000
+        baseline = baseline or ms
+        print(f"{label:8s} {ms:>8.1f} {model.calls:>10} {queries['db']:>11}  {dict(statuses)}  "
+              f"({baseline / ms:.1f}x)")
+
+    print("\nchecks (memory cache):")
+    reset(AnswerCache(SizedMemoryBackend()))
+    question, sql = "revenue by project", QUESTIONS[0][1]
+    first = await rag_utils.run_rag_pipeline(question, "user")
+    again = await rag_utils.run_rag_pipeline(question, "user")
+    other_phrasing = await rag_utils.run_rag_pipeline("What is the revenue per project?", "user")
+    admin = await rag_utils.run_rag_pipeline(question, "admin")
+    masked_user = await rag_utils.run_rag_pipeline("cost by project", "user")
+    masked_admin = await rag_utils.run_rag_pipeline("cost by project", "admin")
+    await load_frames(engine, "financials", [pd.DataFrame([{"project": "Project 0", "period": "2024-Q1",
+                                                             "revenue": 1e9, "cost": 1.0}])])
+    await after_ingest("financials")
+    after = await rag_utils.run_rag_pipeline(question, "user")
+    revenue = lambda result: next(row["revenue"] for row in result["data"] if row["project"] == "Project 0")
+    checks = [
+        ("first request misses", first["cache"] == "miss"),
+        ("repeat is served from cache", again["cache"] == "answer" and again["result"] == first["result"]),
+        ("new phrasing reuses the rows, new answer", other_phrasing["cache"] == "result"),
+        ("other role does not share entries", admin["cache"] == "miss"),
+        ("masked rows are not served to admin", masked_user["data"][0]["cost"] == "***" and
+         masked_admin["cache"] == "miss" and masked_admin["data"][0]["cost"] != "***"),
+        ("ingestion invalidates", after["cache"] == "miss" and revenue(after) == revenue(first) + 1e9),
+    ]
+    checks += await check_derived_stores_behind(engine, rag_utils)
+    backend = SizedMemoryBackend(max_bytes=64 * 1024)
+    for i in range(200):
+        backend.set(str(i), os.urandom(1024))
+    checks.append(("LRU stays within max_bytes", backend.bytes <= backend.max_bytes and backend.evictions > 0
+                   and backend.get("199") is not None and backend.get("0") is None))
+    for label, ok in checks:
+        print(f"  {'PASS' if ok else 'FAIL'}  {label}")
+    print(f"\nanswer cache stats: {answer_cache.get_answer_cache().stats()}")
+    await engine.dispose()
+    assert all(ok for _, ok in checks), "answer cache checks failed"
+
+async def check_derived_stores_behind(engine, rag_utils) -> list:
+    # A load has committed (new data version) but the mirror and rollups have not been refreshed yet - this
+    # worker's after_ingest is still running, or another worker ran the load: queries must not read them, and
+    # nothing from them may be cached under the new version
+    import pandas as pd
+    from backend import columnar, rollups
+    from backend.data_version import get_data_versions
+    from backend.ingest_utils import load_frames, after_ingest
+    columnar.COLUMNAR_ENGINE, rollups.ROLLUPS_ENABLED = True, True
+    columnar._columnar_engine, rollups._rollup_router = columnar.ColumnarFinancials(engine), rollups.RollupRouter(engine)
+    await after_ingest("financials")
+    questions = [("revenue by quarter", "2024-Q1", "revenue"), ("how many rows per quarter", "2024-Q1", "n")]
+    value = lambda result, period, column: next(row[column] for row in result["data"] if row["period"] == period)
+    before = {question: await rag_utils.run_rag_pipeline(question, "admin") for question, _, _ in questions}
+    await load_frames(engine, "financials", [pd.DataFrame([{"project": "Project 1", "period": "2024-Q1",
+                                                             "revenue": 5e8, "cost": 1.0}])])
+    get_data_versions().invalidate()
+    during = {question: await rag_utils.run_rag_pipeline(question, "admin") for question, _, _ in questions}
+    await after_ingest("financials")
+    after = {question: await rag_utils.run_rag_pipeline(question, "admin") for question, _, _ in questions}
+    expected = {"revenue": 5e8, "n": 1}
+    checks = []
+    for question, period, column in questions:
+        grew = lambda result: value(result, period, column) - value(before[question], period, column) == expected[column]
+        checks.append((f"{question!r} right while the mirror and rollups are behind", grew(during[question])))
+        checks.append((f"{question!r} cached under the new version is right", after[question]["cache"] == "answer"
+                       and grew(after[question])))
+    columnar.COLUMNAR_ENGINE, rollups.ROLLUPS_ENABLED = False, False
+    return checks
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    args = parser.parse_args()
+    path = os.path.join(tempfile.mkdtemp(), "bench_answer_cache.db")
+    populate(path, args.rows)
+    os.environ.update(DATABASE_URL=f"sqlite+aiosqlite:///{path}", LLM_BACKEND="fake", ROLLUPS_ENABLED="false",
+                      COLUMNAR_ENGINE="false")
+    asyncio.run(main(args.requests, args.latency_ms / 1000))
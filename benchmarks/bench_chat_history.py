@@ -0,0 +1,41 @@
+# Benchmark: Cosmos round trips per /chat/* request, per-call client setup vs the app-lifetime repository
+# Usage: python -m benchmarks.bench_chat_history [--requests 200] [--latency-ms 5]
+import argparse
+import asyncio
+import time
+from backend.cosmos_utils import ChatHistoryRepository
+from backend.fakes import InMemoryCosmosClient
+
+async def run_requests(client, get_repo, requests: int) -> float:
+    started = time.perf_counter()
+    for i in range(requests):
+        await (await get_repo()).save_chat_message({"session_id": f"s{i % 10}", "user_id": "u1", "user": "q", "assistant": "a"})
+        await (await get_repo()).get_chat_history(f"s{i % 10}", "u1")
+        await (await get_repo()).get_all_sessions("u1")
+    return (time.perf_counter() - started) / requests
+
+async def main(requests: int, latency: float):
+    # Previous behaviour: every call provisioned database + container before touching data
+    client = InMemoryCosmosClient(latency=latency)
+    per_call = await run_requests(client, lambda: ChatHistoryRepository.create(client, provision=True), requests)
+    print(f"per-call client:  {client.control_plane_calls / requests:.1f} control-plane, "
+          f"{client.data_plane_calls / requests:.1f} data-plane round trips/turn, {per_call * 1000:.1f} ms")
+
+    client = InMemoryCosmosClient(latency=latency)
+    repo = await ChatHistoryRepository.create(client)
+    warm = client.control_plane_calls
+
+    async def shared():
+        return repo
+
+    pooled = await run_requests(client, shared, requests)
+    print(f"app repository:   {(client.control_plane_calls - warm) / requests:.1f} control-plane, "
+          f"{client.data_plane_calls / requests:.1f} data-plane round trips/turn, {pooled * 1000:.1f} ms")
+    assert client.control_plane_calls == warm, "control-plane round trip on the hot path"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.latency_ms / 1000))
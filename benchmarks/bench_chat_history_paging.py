@@ -0,0 +1,94 @@
+# Benchmark: cost of one Streamlit rerun as a chat session grows, full-history refetch vs incremental reads
+# Usage: python -m benchmarks.bench_chat_history_paging [--turns 5000] [--reruns 50] [--latency-ms 5]
+import argparse
+import asyncio
+import time
+from backend.cosmos_utils import ChatHistoryRepository, SessionHistoryCache
+from backend.fakes import InMemoryCosmosClient
+
+SESSION, USER = "long-session", "u1"
+
+async def legacy_rerun(repo) -> int:
+    # Previous behaviour: cross-partition query draining the whole session on every rerun
+    query = "SELECT * FROM c WHERE c.session_id=@session_id AND c.user_id=@user_id ORDER BY c._ts ASC"
+    params = [{"name": "@session_id", "value": SESSION}, {"name": "@user_id", "value": USER}]
+    items = repo.container.query_items(query=query, parameters=params, enable_cross_partition_query=True)
+    return len([item async for item in items])
+
+async def measure(label: str, client, rerun, turns: int, reruns: int):
+    started_calls = client.data_plane_calls
+    transferred = 0
+    started = time.perf_counter()
+    for _ in range(reruns):
+        transferred += await rerun()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {turns:>6} turns: {(client.data_plane_calls - started_calls) / reruns:.2f} round trips, "
+          f"{transferred / reruns:8.1f} messages, {elapsed / reruns * 1000:7.2f} ms per rerun")
+
+async def main(turns: int, reruns: int, latency: float):
+    for cache_sessions in (0, 1000):
+        client = InMemoryCosmosClient(latency=latency)
+        repo = await ChatHistoryRepository.create(client, SessionHistoryCache(max_sessions=cache_sessions))
+        for i in range(turns):
+            await repo.save_chat_message({"session_id": SESSION, "user_id": USER, "user": f"q{i}", "assistant": "a"})
+        if cache_sessions == 0:
+            await measure("full refetch (before)", client, lambda: legacy_rerun(repo), turns, reruns)
+
+        state = {"last_ts": None}
+
+        async def incremental():
+            page = await repo.get_chat_history(SESSION, USER, limit=200, after_ts=state["last_ts"])
+            while True:
+                state["last_ts"] = page["last_ts"]
+                if not page["has_more"]:
+                    return len(page["history"])
+                page = await repo.get_chat_history(SESSION, USER, limit=200, after_ts=state["last_ts"])
+
+        await incremental()  # first load of the session pages through everything once
+        label = "incremental, cache" if cache_sessions else "incremental, no cache"
+        await measure(label, client, incremental, turns, reruns)
+        await repo.save_chat_message({"session_id": SESSION, "user_id": USER, "user": "new", "assistant": "a"})
+        new = await repo.get_chat_history(SESSION, USER, limit=200, after_ts=state["last_ts"])
+        assert [m["user"] for m in new["history"]] == ["new"], new
+        await check_cursor(cache_sessions)
+
+async def check_cursor(cache_sessions: int):
+    # Paging must neither skip nor repeat messages that share a created_at, nor lose ones saved before it existed
+    client = InMemoryCosmosClient()
+    repo = await ChatHistoryRepository.create(client, SessionHistoryCache(max_sessions=cache_sessions), provision=True)
+    for i in range(7):
+        await repo.save_chat_message({"session_id": "ties", "user_id": USER, "user": f"q{i}", "assistant": "a",
+                                      "created_at": 1000.0 + i // 3})
+    legacy = {"id": "legacy", "session_id": "ties", "user_id": USER, "user": "old", "assistant": "a"}
+    await repo.container.upsert_item(legacy)
+    migrated = await repo.backfill_created_at()
+    expected = await repo.get_chat_history("ties", USER)
+    paged, cursor = [], {"after_ts": None, "after_id": None}
+    while True:
+        page = await repo.get_chat_history("ties", USER, limit=2, **cursor)
+        paged += page["history"]
+        cursor = {"after_ts": page["last_ts"], "after_id": page["last_id"]}
+        if not page["has_more"]:
+            break
+    policy = (await repo.container.read())["indexingPolicy"]
+    checks = [
+        ("legacy message without created_at is migrated and listed",
+         migrated == 1 and "old" in [m["user"] for m in expected["history"]]),
+        ("pages of 2 over created_at ties return every message once, in order",
+         [m["id"] for m in paged] == [m["id"] for m in expected["history"]] and len(paged) == 8),
+        ("container has the (created_at, id) composite index",
+         [{"path": "/created_at", "order": "ascending"}, {"path": "/id", "order": "ascending"}]
+         in policy.get("compositeIndexes", [])),
+    ]
+    print(f"\nchecks ({'cache' if cache_sessions else 'no cache'}):")
+    for label, ok in checks:
+        print(f"  {'PASS' if ok else 'FAIL'}  {label}")
+    assert all(ok for _, ok in checks), "history cursor checks failed"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=5000)
+    parser.add_argument("--reruns", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.turns, args.reruns, args.latency_ms / 1000))
@@ -0,0 +1,76 @@
+# Benchmark: /chat/save/ latency and Cosmos round trips, synchronous upsert vs the write-behind queue,
+# plus spill-to-disk during an outage and replay on the next start
+# Usage: python -m benchmarks.bench_chat_write_behind [--messages 2000] [--sessions 20] [--latency-ms 10] [--concurrency 50]
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from backend.chat_writer import ChatWriteBehindQueue
+from backend.cosmos_utils import ChatHistoryRepository
+from backend.fakes import InMemoryCosmosClient
+
+def message(i: int, sessions: int) -> dict:
+    return {"session_id": f"s{i % sessions}", "user_id": "u1", "user": f"q{i}", "assistant": "a"}
+
+async def run(save, messages: int, sessions: int, concurrency: int) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            await save(message(i, sessions))
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(i) for i in range(messages)))
+    return sorted(latencies)
+
+def report(label: str, client, latencies: list, elapsed: float, messages: int):
+    p50, p99 = latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+    print(f"{label:<14} p50 {p50 * 1000:7.2f} ms  p99 {p99 * 1000:7.2f} ms  "
+          f"{client.data_plane_calls / messages:.2f} round trips/message  {messages / elapsed:8.0f} messages/s")
+
+async def main(messages: int, sessions: int, latency: float, concurrency: int):
+    client = InMemoryCosmosClient(latency=latency)
+    repo = await ChatHistoryRepository.create(client)
+    started = time.perf_counter()
+    latencies = await run(repo.save_chat_message, messages, sessions, concurrency)
+    report("synchronous", client, latencies, time.perf_counter() - started, messages)
+
+    client = InMemoryCosmosClient(latency=latency)
+    repo = await ChatHistoryRepository.create(client)
+    spill_path = os.path.join(tempfile.mkdtemp(), "chat_spill.jsonl")
+    writer = ChatWriteBehindQueue(repo, spill_path=spill_path)
+    await writer.start()
+    started = time.perf_counter()
+    latencies = await run(writer.enqueue, messages, sessions, concurrency)
+    await writer.close()
+    report("write-behind", client, latencies, time.perf_counter() - started, messages)
+    stored = sum(1 for key in repo.container.items if key[1] != "session-index")
+    assert stored == messages, (stored, messages)
+    print(f"  {writer.batches} flushes, {writer.written} messages written")
+
+    # Outage: every write fails, the queue spills to disk; the next start replays the file
+    client.unavailable = True
+    writer = ChatWriteBehindQueue(repo, spill_path=spill_path, backoff=0.01)
+    await writer.start()
+    await run(writer.enqueue, 200, sessions, concurrency)
+    await writer.close()
+    print(f"outage: {writer.spilled} messages spilled to {spill_path}")
+    client.unavailable = False
+    writer = ChatWriteBehindQueue(repo, spill_path=spill_path)
+    await writer.start()
+    await writer.close()
+    stored = sum(1 for key in repo.container.items if key[1] != "session-index")
+    print(f"restart: {writer.replayed} messages replayed, {stored} stored in total")
+    assert stored == messages + 200 and not os.path.exists(spill_path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.sessions, args.latency_ms / 1000, args.concurrency))
@@ -0,0 +1,113 @@
+# Benchmark + checks: a month-close burst of identical questions through run_rag_pipeline with and without
+# single-flight coalescing (answer cache off, so only coalescing deduplicates) - LLM calls, database queries and
+# latency of the first requester vs everyone else - then error propagation and cancellation checks.
+# Usage: python -m benchmarks.bench_coalescing [--burst 50] [--latency-ms 300]
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from collections import Counter
+
+def populate(path: str):
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE financials (id INTEGER PRIMARY KEY, project TEXT, period TEXT, revenue FLOAT, cost FLOAT)")
+    con.executemany("INSERT INTO financials (project, period, revenue, cost) VALUES (?, ?, ?, ?)",
+                    [(f"Project {i % 100}", f"2024-Q{i % 4 + 1}", float(i % 9973), (i % 9973) * 0.6)
+                     for i in range(100000)])
+    con.commit()
+    con.close()
+
+async def main(burst: int, latency: float):
+    from fastapi import HTTPException
+    from backend import rag_utils, coalescing
+    from backend.coalescing import SingleFlight
+    from backend.fakes import FakeChatModel
+    from backend.llm_client import LLMClient, set_llm_client
+
+    def responder(messages):
+        if "fail" in messages[-1]["content"]:
+            raise RuntimeError("model unavailable")
+        if "SQL expert" in messages[0]["content"]:
+            return FakeChatModel.DEFAULT_SQL
+        return "Total revenue this quarter is concentrated in the top projects."
+    model = FakeChatModel(latency=latency, responder=responder)
+    set_llm_client(LLMClient(model))
+    queries = Counter()
+    execute_streaming = rag_utils.execute_streaming
+
+    async def counted(sql):
+        queries["db"] += 1
+        return await execute_streaming(sql)
+    rag_utils.execute_streaming = counted
+
+    async def timed(question, role="user", delay=0.0):
+        await asyncio.sleep(delay)
+        started = time.perf_counter()
+        result = await rag_utils.run_rag_pipeline(question, role)
+        return time.perf_counter() - started, result
+
+    # arrivals spread over 100 ms, a few phrasings that normalize to the same question
+    phrasings = ["total revenue this quarter", "Total revenue this quarter?", "  total  revenue this quarter "]
+    print(f"burst of {burst} identical questions (+ {burst // 10} admin), arrivals over 100 ms, "
+          f"LLM latency {latency * 1000:.0f} ms")
+    for label, coalescer in (("off", None), ("single-flight", SingleFlight())):
+        coalescing._rag_coalescer = coalescer
+        coalescing.RAG_COALESCING = coalescer is not None
+        model.calls = 0
+        queries.clear()
+        started = time.perf_counter()
+        runs = [timed(phrasings[i % 3], delay=i * 0.1 / burst) for i in range(burst)]
+        runs += [timed(phrasings[0], role="admin", delay=i * 0.01) for i in range(burst // 10)]
+        results = await asyncio.gather(*runs)
+        wall = time.perf_counter() - started
+        first = results[0][0]
+        others = [seconds for seconds, _ in results[1:burst]]
+        print(f"  {label:13s} wall {wall:.2f}s, {model.calls} LLM calls, {queries['db']} queries, first requester "
+              f"{first * 1000:.0f} ms, others p50 {statistics.median(others) * 1000:.0f} / max "
+              f"{max(others) * 1000:.0f} ms, coalesced {sum(result['coalesced'] for _, result in results)}")
+
+    print("\nchecks:")
+    coalescer = coalescing._rag_coalescer = SingleFlight()
+    checks = []
+    outcomes = await asyncio.gather(*(rag_utils.run_rag_pipeline("fail this quarter") for _ in range(5)),
+                                    return_exceptions=True)
+    checks.append(("an error reaches every waiter", all(isinstance(o, HTTPException) and o.status_code == 500
+                                                        for o in outcomes) and coalescer.errors == 1))
+    checks.append(("a failed run is not reused", not coalescer.stats()["in_flight"]))
+
+    model.calls = 0
+    tasks = [asyncio.create_task(rag_utils.run_rag_pipeline("revenue by project")) for _ in range(3)]
+    await asyncio.sleep(latency / 2)
+    tasks[0].cancel()
+    done = await asyncio.gather(*tasks, return_exceptions=True)
+    checks.append(("cancelling one waiter leaves the others", isinstance(done[0], asyncio.CancelledError) and
+                   all(isinstance(result, dict) for result in done[1:]) and model.calls == 2))
+
+    model.calls = 0
+    tasks = [asyncio.create_task(rag_utils.run_rag_pipeline("cost by project")) for _ in range(3)]
+    await asyncio.sleep(latency / 2)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await asyncio.sleep(latency * 3)
+    checks.append(("cancelling every waiter stops the run", model.calls == 1 and coalescer.cancelled == 1))
+    result = await rag_utils.run_rag_pipeline("cost by project")
+    checks.append(("the next request starts fresh", result["coalesced"] is False and model.calls == 3))
+    for label, ok in checks:
+        print(f"  {'PASS' if ok else 'FAIL'}  {label}")
+    print(f"\ncoalescing stats: {coalescer.stats()}")
+    assert all(ok for _, ok in checks), "coalescing checks failed"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--burst", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    args = parser.parse_args()
+    path = os.path.join(tempfile.mkdtemp(), "bench_coalescing.db")
+    populate(path)
+    os.environ.update(DATABASE_URL=f"sqlite+aiosqlite:///{path}", LLM_BACKEND="fake", ANSWER_CACHE_BACKEND="off",
+                      SQL_CACHE_BACKEND="off", ROLLUPS_ENABLED="false", COLUMNAR_ENGINE="false")
+    asyncio.run(main(args.burst, args.latency_ms / 1000))
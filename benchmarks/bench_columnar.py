@@ -0,0 +1,139 @@
+# Micro-benchmark: analytic query latency on the columnar mirror vs the database
+# Usage: python -m benchmarks.bench_columnar [--rows 1000000] [--repeat 5] [--database-url postgresql+asyncpg://...]
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from backend import schema_catalog, data_version
+from backend.columnar import ColumnarFinancials
+
+QUERIES = [
+    "SELECT project, SUM(revenue) AS revenue, SUM(cost) AS cost FROM financials GROUP BY project ORDER BY revenue DESC",
+    "SELECT project, period, AVG(margin) AS margin FROM financials WHERE period IN ('2024-Q1', '2024-Q2') "
+    "GROUP BY project, period ORDER BY project, period",
+    "SELECT SUM(revenue) - SUM(cost) AS profit FROM financials WHERE revenue > 50 AND project LIKE 'P1%'",
+    "SELECT project, COUNT(*) AS n FROM financials WHERE cost BETWEEN 10 AND 20 GROUP BY project ORDER BY n DESC LIMIT 5",
+]
+# NULL semantics: negated and combined predicates over columns with NULLs must keep the same rows as the database
+NULL_QUERIES = [
+    "SELECT COUNT(*) AS n FROM financials WHERE NOT (cost > 25)",
+    "SELECT COUNT(*) AS n FROM financials WHERE NOT (cost BETWEEN 10 AND 20)",
+    "SELECT COUNT(*) AS n FROM financials WHERE project NOT IN ('P1', 'P2')",
+    "SELECT COUNT(*) AS n FROM financials WHERE NOT (project LIKE 'P1%')",
+    "SELECT COUNT(*) AS n FROM financials WHERE NOT (cost > 25 OR project = 'P3')",
+    "SELECT COUNT(*) AS n FROM financials WHERE NOT (cost > 25 AND revenue > 50)",
+    "SELECT COUNT(*) AS n FROM financials WHERE NOT NOT (cost > 25)",
+    "SELECT COUNT(*) AS n FROM financials WHERE NOT (cost IS NULL)",
+]
+
+# the mirror holds dates and timestamps as ISO strings; the database compares them as dates
+TEMPORAL_QUERIES = [
+    "SELECT COUNT(*) AS n FROM financials WHERE booked_at <= '2024-01-31'",
+    "SELECT COUNT(*) AS n FROM financials WHERE booked_at = '2024-01-02'",
+    "SELECT COUNT(*) AS n FROM financials WHERE '2024-02-01' > booked_at",
+    "SELECT booked_at, SUM(revenue) AS revenue FROM financials GROUP BY booked_at",
+]
+
+async def populate(engine, rows: int):
+    rng = random.Random(7)
+    async with engine.begin() as conn:
+        await conn.execute(text("DROP TABLE IF EXISTS financials"))
+        await conn.execute(text("CREATE TABLE financials (id INTEGER PRIMARY KEY, project TEXT, period TEXT, "
+                                "revenue FLOAT, cost FLOAT, margin FLOAT, booked_at TIMESTAMP)"))
+        batch = 50000
+        for start in range(0, rows, batch):
+            records = []
+            for i in range(start, min(start + batch, rows)):
+                revenue, cost = rng.uniform(0, 100), rng.uniform(0, 50)
+                records.append({"id": i + 1, "project": None if i % 89 == 0 else f"P{i % 200}",
+                                "period": f"2024-Q{i % 4 + 1}", "revenue": revenue,
+                                "cost": None if i % 97 == 0 else cost, "margin": revenue - cost,
+                                "booked_at": datetime(2024, 1, 1) + timedelta(hours=i % 2000)})
+            await conn.execute(text("INSERT INTO financials (id, project, period, revenue, cost, margin, booked_at) "
+                                    "VALUES (:id, :project, :period, :revenue, :cost, :margin, :booked_at)"), records)
+
+async def main(rows: int, repeat: int, database_url: str):
+    url = database_url or f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_columnar.db')}"
+    engine = create_async_engine(url)
+    print(f"loading {rows} rows into {engine.dialect.name} ...")
+    await populate(engine, rows)
+    schema_catalog._schema_catalog = schema_catalog.SchemaCatalog(engine)
+    columnar = ColumnarFinancials(engine)
+    started = time.perf_counter()
+    await columnar.refresh()
+    print(f"columnar mirror built in {time.perf_counter() - started:.2f}s")
+
+    for sql in QUERIES:
+        db_times, col_times = [], []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            async with engine.connect() as conn:
+                expected = [dict(row._mapping) for row in await conn.execute(text(sql))]
+            db_times.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            rows_out = columnar.execute(sql)
+            col_times.append(time.perf_counter() - started)
+        assert rows_out is not None and len(rows_out) == len(expected), sql
+        db_ms, col_ms = min(db_times) * 1000, min(col_times) * 1000
+        print(f"{sql[:70]:<72} db {db_ms:8.1f} ms  columnar {col_ms:7.1f} ms  ({db_ms / col_ms:.1f}x)")
+
+    print("\nNULL semantics (columnar vs database):")
+    mismatches = []
+    for sql in NULL_QUERIES:
+        async with engine.connect() as conn:
+            expected = [dict(row._mapping) for row in await conn.execute(text(sql))]
+        got = columnar.execute(sql)
+        ok = got == expected
+        print(f"  {'PASS' if ok else 'FAIL'}  {sql[36:]:<58} db {expected[0]['n']} columnar {got and got[0]['n']}")
+        if not ok:
+            mismatches.append(sql)
+    assert not mismatches, f"columnar results differ from the database: {mismatches}"
+
+    async with engine.begin() as conn:
+        await conn.execute(text("INSERT INTO financials (id, project, period, revenue, cost, margin) "
+                                "VALUES (:id, 'P0', '2025-Q1', 1, 1, 0)"), {"id": rows + 1})
+    started = time.perf_counter()
+    await columnar.refresh()
+    print(f"incremental refresh after ingesting 1 row: {(time.perf_counter() - started) * 1000:.1f} ms")
+    print(columnar.stats())
+
+    checks = [(f"falls back to the database: {sql.split(' FROM financials ')[-1]}", columnar.execute(sql) is None)
+              for sql in TEMPORAL_QUERIES]
+    checks += await check_other_worker_load(engine, rows + 2)
+    print("\nchecks:")
+    for label, ok in checks:
+        print(f"  {'PASS' if ok else 'FAIL'}  {label}")
+    await engine.dispose()
+    assert all(ok for _, ok in checks), "columnar checks failed"
+
+async def check_other_worker_load(engine, next_id: int) -> list:
+    # Another worker loads a row and bumps the data version; this worker's after_ingest never runs. Once the
+    # version is read again (the TTL expired), the mirror is behind: the database answers and it catches up.
+    versions = data_version._data_versions = data_version.DataVersions(engine)
+    worker = ColumnarFinancials(engine)
+    await worker.refresh()
+    rows_before = worker.row_count
+    async with engine.begin() as conn:
+        await conn.execute(text("INSERT INTO financials (id, project, period, revenue, cost, margin) "
+                                "VALUES (:id, 'P0', '2025-Q2', 1, 1, 0)"), {"id": next_id})
+        await data_version.bump_data_version(conn, "financials")
+    versions.invalidate()
+    behind = not await worker.catch_up()
+    if worker._catch_up is not None:
+        await worker._catch_up
+    return [("a mirror behind the data version is not used", behind),
+            ("a mirror behind the data version catches up in the background",
+             await worker.catch_up() and worker.row_count == rows_before + 1)]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat, args.database_url))
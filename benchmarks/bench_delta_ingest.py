@@ -0,0 +1,144 @@
+# Benchmark: monthly refresh of a table where ~1% of rows changed - truncate + full reload vs a delta merge
+# on the natural key (project, period). Parsing is done once up front; only the database work is timed. "cold" is
+# a process that has not loaded the table before (the key index is read back from the table). Then checks that the
+# table and the columnar mirror stay right after delta loads that update and delete rows, after a change by
+# another writer, and for keys with NULL parts.
+# Usage: python -m benchmarks.bench_delta_ingest [--rows 200000] [--changed 0.01] [--database-url ...]
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from backend import ingest_utils
+from backend.data_version import bump_data_version
+from backend.ingest_utils import load_frames
+
+NATURAL_KEY = ["project", "period"]
+
+def make_frames(rows: int, chunk_size: int, seed: int = 42) -> list:
+    # (project, period) is unique: four quarters per project
+    rng = random.Random(seed)
+    revenue = [round(rng.uniform(1000, 100000), 2) for _ in range(rows)]
+    frame = pd.DataFrame({
+        "project": [f"Project {i // 4}" for i in range(rows)],
+        "period": [f"2024-Q{i % 4 + 1}" for i in range(rows)],
+        "revenue": revenue,
+        "cost": [round(value * rng.uniform(0.4, 0.9), 2) for value in revenue],
+        "region": [rng.choice(["EMEA", "APAC", "AMER"]) for _ in range(rows)],
+    })
+    return [frame.iloc[start:start + chunk_size].reset_index(drop=True) for start in range(0, rows, chunk_size)]
+
+def change(frames: list, fraction: float, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    changed = []
+    for frame in frames:
+        frame = frame.copy()
+        picks = [i for i in range(len(frame)) if rng.random() < fraction]
+        frame.loc[picks, "revenue"] = frame.loc[picks, "revenue"] * 1.1
+        changed.append(frame)
+    return changed
+
+async def timed(label: str, coro):
+    started = time.perf_counter()
+    stats = await coro
+    seconds = time.perf_counter() - started
+    print(f"{label:28s} {seconds:7.2f}s  {stats}")
+    return seconds
+
+async def full_reload(engine, frames: list) -> dict:
+    async with engine.begin() as conn:
+        await conn.execute(text("DELETE FROM bench_full"))
+    return await load_frames(engine, "bench_full", frames)
+
+async def main(rows: int, fraction: float, chunk_size: int, database_url: str):
+    url = database_url or f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_delta.db')}"
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        for name in ("bench_full", "bench_delta"):
+            await conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+    frames = make_frames(rows, chunk_size)
+    refreshed = change(frames, fraction)
+    print(f"{rows} rows, ~{fraction:.1%} changed in the refresh ({engine.dialect.name})")
+
+    await timed("append: initial load", load_frames(engine, "bench_full", frames))
+    full = await timed("append: truncate + reload", full_reload(engine, refreshed))
+
+    await timed("delta: initial load", load_frames(engine, "bench_delta", frames, natural_key=NATURAL_KEY))
+    await timed("delta: unchanged re-ingest", load_frames(engine, "bench_delta", frames, natural_key=NATURAL_KEY))
+    delta = await timed("delta: refresh", load_frames(engine, "bench_delta", refreshed, natural_key=NATURAL_KEY))
+    ingest_utils._key_indexes.clear()
+    cold = await timed("delta: refresh, cold", load_frames(engine, "bench_delta", change(refreshed, fraction, seed=9),
+                                                           natural_key=NATURAL_KEY))
+    print(f"delta refresh takes {delta / full:.0%} of a full reload ({cold / full:.0%} cold)")
+
+    checks = await check_mirror(engine, refreshed) + await check_other_writer(engine, refreshed) + \
+        await check_null_keys(engine)
+    print("\nchecks:")
+    for label, ok in checks:
+        print(f"  {'PASS' if ok else 'FAIL'}  {label}")
+    await engine.dispose()
+    assert all(ok for _, ok in checks), "delta ingest checks failed"
+
+async def check_mirror(engine, frames: list):
+    # The mirror's incremental refresh only reads ids past the last mirrored one, so after_ingest must rebuild it
+    # when a delta load updated or deleted rows in place
+    from backend import columnar, rollups, schema_catalog
+    from backend.ingest_utils import after_ingest, rewrites_rows
+    schema_catalog._schema_catalog = schema_catalog.SchemaCatalog(engine)
+    rollups.ROLLUPS_ENABLED, columnar.COLUMNAR_ENGINE = False, True
+    mirror = columnar._columnar_engine = columnar.ColumnarFinancials(engine, "bench_delta")
+    await mirror.refresh()
+    sql = "SELECT COUNT(*) AS n, SUM(revenue) AS revenue FROM bench_delta"
+    loads = [("updated rows", change(frames, 0.01, seed=11), False),
+             ("deleted rows", [frames[0].iloc[:-100]] + frames[1:], True)]
+    checks = []
+    for label, refreshed, delete_missing in loads:
+        stats = await load_frames(engine, "bench_delta", refreshed, natural_key=NATURAL_KEY, delete_missing=delete_missing)
+        await after_ingest("bench_delta", rebuild=rewrites_rows(stats))
+        async with engine.connect() as conn:
+            expected = dict((await conn.execute(text(sql))).one()._mapping)
+        got = mirror.execute(sql)[0]
+        loaded = pd.concat(refreshed)
+        checks.append((f"table holds exactly the last load after a delta load with {label}",
+                       expected["n"] == len(loaded) and abs(expected["revenue"] - loaded["revenue"].sum()) < 1e-6 * expected["revenue"]))
+        checks.append((f"columnar mirror matches the table after a delta load with {label}",
+                       got["n"] == expected["n"] and abs(got["revenue"] - expected["revenue"]) < 1e-6 * expected["revenue"]))
+    return checks
+
+async def check_other_writer(engine, frames: list) -> list:
+    # A change committed by another process bumps the data version, so this process's key index is not reused
+    await load_frames(engine, "bench_delta", frames, natural_key=NATURAL_KEY)
+    async with engine.begin() as conn:
+        touched = (await conn.execute(text("UPDATE bench_delta SET revenue = revenue + 1, _row_hash = 0 "
+                                           "WHERE id % 1000 = 0"))).rowcount
+        await bump_data_version(conn, "bench_delta")
+    stats = await load_frames(engine, "bench_delta", frames, natural_key=NATURAL_KEY)
+    return [("a change by another writer is detected and reverted by the next load", stats["updated"] == touched > 0)]
+
+async def check_null_keys(engine) -> list:
+    # A NULL key part is a key like any other: re-loading the row updates it instead of inserting it again
+    async with engine.begin() as conn:
+        await conn.execute(text("DROP TABLE IF EXISTS bench_null_keys"))
+    frame = pd.DataFrame({"project": ["A", "B", None], "period": ["2024-Q1"] * 3, "revenue": [1.0, 2.0, 3.0]})
+    for _ in range(3):
+        await load_frames(engine, "bench_null_keys", [frame], natural_key=NATURAL_KEY)
+    ingest_utils._key_indexes.clear()
+    changed = frame.assign(revenue=[1.0, 2.0, 30.0])
+    stats = await load_frames(engine, "bench_null_keys", [changed], natural_key=NATURAL_KEY)
+    async with engine.connect() as conn:
+        rows = (await conn.execute(text("SELECT project, revenue FROM bench_null_keys ORDER BY id"))).all()
+    return [("a key with a NULL part is merged, not inserted again",
+             stats["updated"] == 1 and stats["inserted"] == 0 and [tuple(row) for row in rows] == [("A", 1.0), ("B", 2.0), (None, 30.0)])]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--changed", type=float, default=0.01)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.changed, args.chunk_size, args.database_url))
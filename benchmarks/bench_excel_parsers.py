@@ -0,0 +1,70 @@
+# Benchmark: parse time and peak memory per Excel engine on a generated workbook - pd.read_excel (previous
+# read_excel_to_df), openpyxl streaming, calamine, and a Parquet staging-cache hit. Each engine runs in
+# its own process so peak RSS is not shared.
+# Usage: python -m benchmarks.bench_excel_parsers [--rows 200000] [--chunk-size 10000]
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.bench_ingest_jobs import write_workbook
+
+ENGINES = ["pandas", "openpyxl", "calamine", "parquet-miss", "parquet-hit"]
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def measure(engine: str, path: str, chunk_size: int, staging_dir: str) -> dict:
+    os.environ["PARQUET_STAGING_DIR"] = staging_dir
+    from backend import storage_utils
+    import pandas as pd
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    rows = 0
+    if engine == "pandas":
+        rows = len(pd.read_excel(path))
+    elif engine in ("openpyxl", "calamine"):
+        for chunk in storage_utils.iter_excel_chunks(path, chunk_size, parser=engine):
+            rows += len(chunk)
+    else:
+        staged = storage_utils.stage_excel_sheet(path, chunk_size=chunk_size, parser="calamine")
+        for chunk in storage_utils.iter_parquet_chunks(staged, chunk_size):
+            rows += len(chunk)
+    return {"seconds": time.perf_counter() - started, "rows": rows, "peak_mb": peak_rss_mb() - baseline}
+
+def main(rows: int, chunk_size: int):
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "bench.xlsx")
+    print(f"writing a {rows}-row workbook ...")
+    write_workbook(path, rows, 1, 0)
+    print(f"{os.path.getsize(path) / 1e6:.1f} MB on disk")
+    staging_dir = os.path.join(workdir, "parquet")
+    results = {}
+    for engine in ENGINES:
+        output = subprocess.run([sys.executable, "-m", "benchmarks.bench_excel_parsers", "--measure", engine,
+                                 "--path", path, "--chunk-size", str(chunk_size), "--staging-dir", staging_dir],
+                                check=True, capture_output=True, text=True).stdout
+        results[engine] = json.loads(output.strip().splitlines()[-1])
+        result = results[engine]
+        print(f"{engine:13s} {result['seconds']:7.2f}s  {result['rows'] / result['seconds']:9.0f} rows/s  "
+              f"peak +{result['peak_mb']:6.1f} MB  ({result['rows']} rows)")
+    baseline = results["pandas"]["seconds"]
+    print("speed-up vs pd.read_excel: " + ", ".join(f"{engine} {baseline / result['seconds']:.1f}x"
+                                                   for engine, result in results.items() if engine != "pandas"))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--measure", choices=ENGINES)
+    parser.add_argument("--path")
+    parser.add_argument("--staging-dir")
+    args = parser.parse_args()
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.path, args.chunk_size, args.staging_dir)))
+    else:
+        main(args.rows, args.chunk_size)
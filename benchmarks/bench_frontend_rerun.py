@@ -0,0 +1,191 @@
+# Benchmark + checks: backend round trips, new TCP connections and render time per Streamlit rerun of
+# frontend/main_app.py (run headless with streamlit.testing AppTest) against a local stub of the chat/RAG API
+# with a fixed per-request latency. Compares sequential calls without caching, concurrent calls without caching
+# and the default client (concurrent + short-TTL cache), over a first render, idle reruns, selecting a session
+# whose title another session shares, sending a message and the rerun after it.
+# Usage: python -m benchmarks.bench_frontend_rerun [--latency-ms 50] [--reruns 5] [--frontend path/to/frontend]
+import argparse
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FRONTEND = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend")
+USER_ID = "demo_user"
+
+class StubBackend(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency: float, sessions: int = 8, messages: int = 30):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.latency = latency
+        self.requests = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+        # titles (first questions) differ, except the last two sessions share one
+        self.history = {f"session-{i}": [{"id": f"m{j:04d}", "user": f"question {j}" if j else
+                                          f"opening question {min(i, sessions - 2)}", "assistant": f"answer {j}",
+                                          "ts": float(j + 1)} for j in range(messages)] for i in range(sessions)}
+
+    def counters(self) -> tuple:
+        with self.lock:
+            return self.requests, self.connections
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # as uvicorn does; otherwise headers and body written separately stall on delayed ACKs over keep-alive
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body: bytes, content_type: str = "application/json"):
+        with self.server.lock:
+            self.server.requests += 1
+        time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        assert url.path == "/chat/sessions/", url.path
+        assert parse_qs(url.query)["user_id"] == [USER_ID]
+        details = [{"session_id": session_id, "title": messages[0]["user"], "message_count": len(messages),
+                    "last_active": 1.7e9 + i * 3600} for i, (session_id, messages) in enumerate(self.server.history.items())]
+        self._send(json.dumps({"sessions": list(self.server.history), "details": details}).encode())
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path == "/chat/history/":
+            after = (body.get("after_ts") or 0, body.get("after_id") or "")
+            newer = [message for message in self.server.history.get(body["session_id"], [])
+                     if (message["ts"], message["id"]) > after]
+            page = newer[:body.get("limit") or len(newer)]
+            self._send(json.dumps({"history": page, "last_ts": page[-1]["ts"] if page else body.get("after_ts"),
+                                   "last_id": page[-1]["id"] if page else body.get("after_id"),
+                                   "has_more": len(page) < len(newer)}).encode())
+        elif self.path == "/rag-advanced/stream/":
+            # the backend saves the turn before the done event
+            messages = self.server.history.setdefault(body["session_id"], [])
+            answer = f"Stub answer to {body['query']}"
+            messages.append({"id": f"m{len(messages):04d}", "user": body["query"], "assistant": answer,
+                             "ts": float(len(messages) + 1)})
+            events = [("stage", {"stage": "generating_sql"}), ("sql", {"sql": "SELECT 1"}),
+                      ("rows", {"row_count": 1, "summarized": False, "preview": []}),
+                      ("token", {"text": answer}), ("done", {"result": answer})]
+            self._send("".join(f"event: {event}\ndata: {json.dumps(payload)}\n\n" for event, payload in events).encode(),
+                       "text/event-stream")
+        else:
+            self.send_error(404)
+
+def run_scenario(server, reruns: int) -> list:
+    # (step, round trips, new connections, render seconds, session shown) for each run of the page script
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(os.path.join(FRONTEND, "main_app.py"), default_timeout=30)
+    steps = []
+
+    def step(label, action=None):
+        requests_before, connections_before = server.counters()
+        started = time.perf_counter()
+        (action or at.run)()
+        elapsed = time.perf_counter() - started
+        assert not at.exception, at.exception
+        requests_after, connections_after = server.counters()
+        steps.append((label, requests_after - requests_before, connections_after - connections_before, elapsed,
+                      at.session_state["session_id"]))
+
+    step("first render")
+    for _ in range(reruns):
+        step("idle rerun")
+    # one of the two sessions sharing a title
+    duplicate = list(server.history)[-2]
+    step("select session", lambda: at.sidebar.selectbox[0].select(duplicate).run())
+    step("rerun after select")
+
+    def send():
+        at.text_input(key="user_query").input("revenue by project")
+        at.button[-1].click().run()
+    step("send message", send)
+    step("rerun after send")
+    shown = "".join(element.value for element in at.markdown)
+    assert "Stub answer to revenue by project" in shown, "sent message missing after the rerun"
+    return steps
+
+def main(latency: float, reruns: int):
+    import streamlit as st
+    sys.path.insert(0, FRONTEND)
+    from config import settings
+    import core
+    # threads resolving the st.cache_resource client; the API client's pool threads have no ScriptRunContext
+    resolved_on = set()
+    get_api_client = core.get_api_client
+
+    def recording_get_api_client():
+        resolved_on.add(threading.current_thread().name)
+        return get_api_client()
+    core.get_api_client = recording_get_api_client
+    server = StubBackend(latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    settings.RAG_API_URL = f"http://127.0.0.1:{server.server_port}/rag-advanced/"
+    print(f"stub backend latency {latency * 1000:.0f} ms per request, {len(server.history)} sessions, "
+          f"{reruns} idle reruns\n")
+    print(f"{'client':28s} {'step':17s} {'round trips':>11s} {'new conns':>9s} {'render ms':>9s}")
+    results = {}
+    for label, parallel, ttl in (("sequential, no cache", False, 0), ("concurrent, no cache", True, 0),
+                                 ("concurrent + TTL cache", True, 15)):
+        settings.API_PARALLEL_FETCH, settings.API_CACHE_TTL_SECONDS = parallel, ttl
+        st.cache_resource.clear()  # on the bench's own thread; its warning is expected
+        steps = results[label] = run_scenario(server, reruns)
+        for step, trips, connections, elapsed, _ in steps:
+            if step != "idle rerun":
+                print(f"{label:28s} {step:17s} {trips:11d} {connections:9d} {elapsed * 1000:9.0f}")
+        idle = [s for s in steps if s[0] == "idle rerun"]
+        print(f"{label:28s} {'idle rerun (avg)':17s} {statistics.mean(s[1] for s in idle):11.1f} "
+              f"{statistics.mean(s[2] for s in idle):9.1f} {statistics.median(s[3] for s in idle) * 1000:9.0f}")
+    server.shutdown()
+
+    def idle(label, field):
+        return statistics.median(s[field] for s in results[label] if s[0] == "idle rerun")
+    cached = results["concurrent + TTL cache"]
+    checks = [
+        ("idle reruns within the TTL make no round trips", idle("concurrent + TTL cache", 1) == 0),
+        ("sending a message invalidates: the next rerun refetches", cached[-1][1] > 0),
+        ("connections are reused across reruns",
+         all(sum(s[2] for s in steps) <= 4 < sum(s[1] for s in steps) for steps in results.values())),
+        ("concurrent fetch renders faster than sequential",
+         idle("concurrent, no cache", 3) < idle("sequential, no cache", 3) - latency / 2),
+        ("the client is resolved on the script thread only",
+         not [name for name in resolved_on if name.startswith("api")]),
+        ("the shown session stays put across idle reruns",
+         all(s[4] == steps[0][4] for steps in results.values() for s in steps if s[0] == "idle rerun")),
+        ("a session sharing its title with another stays selected",
+         all(s[4] == list(server.history)[-2] for steps in results.values() for s in steps
+             if s[0] in ("select session", "rerun after select"))),
+    ]
+    print("\nchecks:")
+    for label, ok in checks:
+        print(f"  {'PASS' if ok else 'FAIL'}  {label}")
+    assert all(ok for _, ok in checks), "frontend rerun checks failed"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--reruns", type=int, default=5)
+    parser.add_argument("--frontend", help="run another checkout's frontend directory (e.g. before a change)")
+    args = parser.parse_args()
+    if args.frontend:
+        FRONTEND = os.path.abspath(args.frontend)
+    main(args.latency_ms / 1000, args.reruns)
@@ -0,0 +1,106 @@
+# Startup budget check: `python -X importtime -c "import backend.main"` in fresh interpreters, summarized per
+# top-level package and per backend module, with the heavy query/ingestion dependencies that must stay out of
+# the import path; then cold start of the app under uvicorn until it answers its first request.
+# Usage: python -m benchmarks.bench_import_time [--runs 5] [--budget-ms 2000] [--ready-budget-ms 5000]
+#        [--save-report importtime.txt]
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+# imported on first use (or by the background warm-up), never by `import backend.main`
+DEFERRED = ["pandas", "numpy", "pyarrow", "openpyxl", "openai", "langchain", "langchain_core", "sqlglot",
+            "azure.identity", "azure.storage.blob", "backend.rag_utils", "backend.ingest_utils",
+            "backend.storage_utils", "backend.columnar"]
+
+def parse(report: str) -> list:
+    # (module, self us, cumulative us, depth) per `import time:` line
+    modules = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return modules
+
+def import_report(env: dict) -> str:
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import backend.main"], env=env,
+                            capture_output=True, text=True, check=True)
+    return result.stderr
+
+def cold_start(env: dict, port: int) -> float:
+    # seconds from process launch until GET / answers
+    import httpx
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port),
+                               "--log-level", "warning"], env=env)
+    try:
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.HTTPError:
+                time.sleep(0.02)
+        raise RuntimeError("server did not start")
+    finally:
+        server.terminate()
+        server.wait()
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="bench_import_time_")
+    env = dict(os.environ, DATABASE_URL=f"sqlite+aiosqlite:///{os.path.join(workdir, 'financials.db')}",
+               LLM_BACKEND="fake", CHAT_STORE="memory", BLOB_STORE="local", BLOB_LOCAL_ROOT=workdir)
+    # the first run also compiles bytecode; it is reported but not part of the median
+    first = parse(import_report(env))
+    runs = [parse(import_report(env)) for _ in range(args.runs)]
+    totals = [next(cumulative for name, _, cumulative, _ in run if name == "backend.main") / 1000 for run in runs]
+    modules = runs[totals.index(statistics.median_low(totals))]
+    if args.save_report:
+        with open(args.save_report, "w", encoding="utf-8") as f:
+            f.write(import_report(env))
+    print(f"import backend.main: median {statistics.median(totals):.0f} ms over {args.runs} runs "
+          f"(min {min(totals):.0f}, max {max(totals):.0f}; first run with bytecode compile "
+          f"{next(c for n, _, c, _ in first if n == 'backend.main') / 1000:.0f} ms), {len(modules)} modules")
+
+    packages = defaultdict(int)
+    for name, self_us, _, _ in modules:
+        packages[name.split(".")[0]] += self_us
+    print("\nself time by top-level package:")
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  {package}")
+    print("\nbackend modules (cumulative, includes what they import first):")
+    for name, _, cumulative_us, _ in sorted((m for m in modules if m[0].startswith("backend")), key=lambda m: -m[2]):
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    ready = [cold_start(env, args.port) for _ in range(args.cold_starts)]
+    print(f"\ncold start to first response: median {statistics.median(ready) * 1000:.0f} ms "
+          f"over {args.cold_starts} launches")
+
+    imported = {name for name, _, _, _ in modules}
+    loaded = [name for name in DEFERRED if name in imported]
+    checks = [
+        (f"no deferred module imported at startup{' (found ' + ', '.join(loaded) + ')' if loaded else ''}", not loaded),
+        (f"import time within {args.budget_ms:.0f} ms", statistics.median(totals) <= args.budget_ms),
+        (f"cold start within {args.ready_budget_ms:.0f} ms", statistics.median(ready) * 1000 <= args.ready_budget_ms),
+    ]
+    print("\nchecks:")
+    for label, ok in checks:
+        print(f"  {'PASS' if ok else 'FAIL'}  {label}")
+    assert all(ok for _, ok in checks), "startup budget checks failed"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--cold-starts", type=int, default=3)
+    parser.add_argument("--top", type=int, default=12)
+    parser.add_argument("--budget-ms", type=float, default=2000)
+    parser.add_argument("--ready-budget-ms", type=float, default=5000)
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--save-report", help="write one raw -X importtime report to this file")
+    main(parser.parse_args())
@@ -0,0 +1,114 @@
+# Benchmark: per-row INSERT ingestion (previous /ingest-excel-blob/ path) vs the chunked bulk pipeline. Then checks
+# that values a later chunk (or load) does not fit the column types for are kept by widening the columns, on an
+# engine with a pool of one connection.
+# Usage: python -m benchmarks.bench_ingest --rows 100000 [--database-url sqlite+aiosqlite:///bench.db]
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import pandas as pd
+from io import BytesIO
+from openpyxl import Workbook
+from sqlalchemy import MetaData, Table, Column, Integer, String, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
+from backend.ingest_utils import ingest_excel_bytes
+
+def make_workbook(rows: int) -> bytes:
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("financials")
+    sheet.append(["project", "period", "revenue", "cost", "margin", "region"])
+    rng = random.Random(42)
+    for i in range(rows):
+        revenue = round(rng.uniform(1000, 100000), 2)
+        cost = round(revenue * rng.uniform(0.4, 0.9), 2)
+        sheet.append([f"Project {i % 250}", f"2024-Q{i % 4 + 1}", revenue, cost, round(revenue - cost, 2),
+                      rng.choice(["EMEA", "APAC", "AMER"])])
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+async def legacy_ingest(engine, excel_bytes: bytes, table_name: str) -> int:
+    df_blob = pd.read_excel(BytesIO(excel_bytes))
+    metadata = MetaData()
+    columns = [Column(col, String(255)) for col in df_blob.columns]
+    table = Table(table_name, metadata, Column('id', Integer, primary_key=True, autoincrement=True), *columns)
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+        for _, row in df_blob.iterrows():
+            await conn.execute(table.insert().values(**row.to_dict()))
+    return len(df_blob)
+
+async def main(rows: int, database_url: str):
+    print(f"Generating {rows}-row workbook...")
+    excel_bytes = make_workbook(rows)
+    engine = create_async_engine(database_url)
+    async with engine.begin() as conn:
+        for name in ("bench_legacy", "bench_bulk"):
+            await conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+
+    started = time.perf_counter()
+    legacy_rows = await legacy_ingest(engine, excel_bytes, "bench_legacy")
+    legacy_seconds = time.perf_counter() - started
+    print(f"per-row insert: {legacy_rows} rows in {legacy_seconds:.2f}s ({legacy_rows / legacy_seconds:.0f} rows/sec)")
+
+    stats = await ingest_excel_bytes(engine, excel_bytes, table_name="bench_bulk")
+    print(f"bulk pipeline:  {stats['rows']} rows in {stats['seconds']:.2f}s ({stats['rows_per_sec']:.0f} rows/sec)")
+    print(f"speed-up: {legacy_seconds / stats['seconds']:.1f}x")
+    await engine.dispose()
+
+    checks = await check_widening(database_url)
+    print("\nchecks:")
+    for label, ok in checks:
+        print(f"  {'PASS' if ok else 'FAIL'}  {label}")
+    assert all(ok for _, ok in checks), "ingest checks failed"
+
+def make_mixed_workbook(rows: list) -> bytes:
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("financials")
+    sheet.append(["project", "units", "revenue"])
+    for row in rows:
+        sheet.append(row)
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+async def check_widening(database_url: str) -> list:
+    # DDL runs outside the load transaction, so one connection is enough; a hang fails the check instead of the run
+    engine = create_async_engine(database_url, pool_size=1, max_overflow=0, pool_timeout=10)
+    numeric = [[f"Project {i}", i, i * 10.5] for i in range(100)]
+    # the first chunk of 50 is numeric; the second has text in revenue and fractions in units
+    mixed = numeric[:50] + [[f"Project {i}", i + 0.5, "n/a" if i % 10 == 0 else i * 10.5] for i in range(50, 100)]
+    checks = []
+    for table_name, loads, label in (("bench_widen", [mixed], "a later chunk"),
+                                     ("bench_widen_later", [numeric, mixed], "a later load")):
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
+        try:
+            for rows in loads:
+                await asyncio.wait_for(ingest_excel_bytes(engine, make_mixed_workbook(rows), table_name, chunk_size=50), 60)
+        except (asyncio.TimeoutError, PoolTimeoutError):
+            checks.append((f"ingest completes on a pool of one connection ({label})", False))
+            continue
+        async with engine.connect() as conn:
+            scalar = lambda sql: conn.scalar(text(sql.format(table=table_name)))
+            rows = await scalar("SELECT COUNT(*) FROM {table}")
+            texts = await scalar("SELECT COUNT(*) FROM {table} WHERE revenue = 'n/a'")
+            fractions = await scalar("SELECT COUNT(*) FROM {table} WHERE units = 50.5")
+            nulls = await scalar("SELECT COUNT(*) FROM {table} WHERE units IS NULL OR revenue IS NULL")
+        checks.append((f"ingest completes on a pool of one connection ({label})", rows == 100 * len(loads)))
+        checks.append((f"text in a numeric column of {label} is kept", texts == 5))
+        checks.append((f"fractions in an integer column of {label} are kept", fractions == 1))
+        checks.append((f"no value of {label} is loaded as NULL", nulls == 0))
+    await engine.dispose()
+    return checks
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+    url = args.database_url or f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_ingest.db')}"
+    asyncio.run(main(args.rows, url))
@@ -0,0 +1,116 @@
+# Benchmark: one-blob-at-a-time ingestion (previous /ingest-excel-blob/ loop) vs an ingestion job
+# (concurrent downloads, process-pool parsing, bounded concurrent loads), then a re-run that skips
+# unchanged workbooks by ETag. Blobs come from a local directory with a simulated per-call latency.
+# Usage: python -m benchmarks.bench_ingest_jobs [--workbooks 12] [--rows 5000] [--sheets 2] [--latency 0.2]
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from openpyxl import Workbook
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from backend.fakes import LocalBlobServiceClient
+from backend.storage_utils import set_blob_service_client, list_excel_blobs, fetch_excel_from_blob, list_sheet_names
+from backend import ingest_utils
+from backend.ingest_utils import ingest_excel_bytes
+from backend.ingest_jobs import IngestionScheduler, IngestionJob, INGEST_PARSE_WORKERS
+
+REGIONS = ["emea", "apac", "amer", "latam"]
+
+def write_workbook(path: str, rows: int, sheets: int, seed: int):
+    workbook = Workbook(write_only=True)
+    rng = random.Random(seed)
+    for index in range(sheets):
+        sheet = workbook.create_sheet(f"2024-Q{index + 1}")
+        sheet.append(["project", "period", "revenue", "cost", "margin", "region"])
+        for i in range(rows):
+            revenue = round(rng.uniform(1000, 100000), 2)
+            cost = round(revenue * rng.uniform(0.4, 0.9), 2)
+            sheet.append([f"Project {i % 250}", f"2024-Q{index + 1}", revenue, cost, round(revenue - cost, 2),
+                          REGIONS[seed % len(REGIONS)]])
+    workbook.save(path)
+
+async def sequential(engine, container: str) -> int:
+    rows = 0
+    for blob in await list_excel_blobs(container, "close/"):
+        excel_bytes = await fetch_excel_from_blob(container, blob["name"])
+        for sheet in list_sheet_names(excel_bytes):
+            rows += (await ingest_excel_bytes(engine, excel_bytes, table_name="bench_sequential", sheet_name=sheet))["rows"]
+    return rows
+
+async def run_job(scheduler, container: str) -> IngestionJob:
+    job = scheduler.submit(IngestionJob(container, "close/", table_name="bench_jobs"))
+    await job.task
+    return job
+
+def check_table_allowlist() -> list:
+    # Jobs may only load into INGEST_TABLES: the ledger, the data versions and the rollups are refused with a 400
+    from fastapi.testclient import TestClient
+    from backend.main import app
+    client = TestClient(app)
+    checks = []
+    for table_name in ("ingest_ledger", "data_versions", "financials_rollup_total"):
+        response = client.post("/ingest/jobs/", json={"container_name": "finance", "table_name": table_name})
+        checks.append((f"a job into {table_name} is refused", response.status_code == 400))
+    return checks
+
+async def main(workbooks: int, rows: int, sheets: int, latency: float, workers: int):
+    ingest_utils.INGEST_TABLES = [*ingest_utils.INGEST_TABLES, "bench_jobs"]
+    root = tempfile.mkdtemp()
+    os.makedirs(os.path.join(root, "finance", "close"))
+    print(f"writing {workbooks} workbooks x {sheets} sheets x {rows} rows ...")
+    for index in range(workbooks):
+        write_workbook(os.path.join(root, "finance", "close", f"region_{index:02d}.xlsx"), rows, sheets, index)
+    blob_client = LocalBlobServiceClient(root, latency=latency)
+    set_blob_service_client(blob_client)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(root, 'bench_ingest_jobs.db')}")
+
+    started = time.perf_counter()
+    loaded = await sequential(engine, "finance")
+    sequential_seconds = time.perf_counter() - started
+    print(f"sequential:   {loaded} rows in {sequential_seconds:.2f}s ({blob_client.round_trips} blob calls)")
+
+    scheduler = IngestionScheduler(engine, parse_workers=workers, spool_dir=os.path.join(root, "spool"))
+    blob_client.round_trips = 0
+    job = await run_job(scheduler, "finance")
+    summary = job.summary(with_blobs=False)
+    print(f"job:          {summary['rows']} rows in {summary['seconds']:.2f}s ({blob_client.round_trips} blob calls, "
+          f"{workers} parse workers on {os.cpu_count()} CPUs) -> {sequential_seconds / summary['seconds']:.1f}x, "
+          f"{summary['progress']}")
+
+    blob_client.round_trips = 0
+    job = await run_job(scheduler, "finance")
+    summary = job.summary(with_blobs=False)
+    print(f"re-run:       {summary['rows']} rows in {summary['seconds']:.2f}s ({blob_client.round_trips} blob calls), "
+          f"{summary['progress']}")
+
+    # touching one workbook changes its ETag; only that one is reloaded
+    changed = os.path.join(root, "finance", "close", "region_00.xlsx")
+    write_workbook(changed, rows, sheets, 100)
+    job = await run_job(scheduler, "finance")
+    summary = job.summary(with_blobs=False)
+    print(f"one changed:  {summary['rows']} rows in {summary['seconds']:.2f}s, {summary['progress']}")
+
+    async with engine.connect() as conn:
+        total = (await conn.execute(text("SELECT COUNT(*) FROM bench_jobs"))).scalar()
+    print(f"bench_jobs holds {total} rows")
+    await scheduler.close()
+    await engine.dispose()
+
+    checks = check_table_allowlist()
+    print("\nchecks:")
+    for label, ok in checks:
+        print(f"  {'PASS' if ok else 'FAIL'}  {label}")
+    assert all(ok for _, ok in checks), "ingestion job checks failed"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workbooks", type=int, default=12)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--sheets", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--workers", type=int, default=INGEST_PARSE_WORKERS)
+    args = parser.parse_args()
+    asyncio.run(main(args.workbooks, args.rows, args.sheets, args.latency, args.workers))
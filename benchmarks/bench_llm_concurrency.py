@@ -0,0 +1,46 @@
+# Load test: RAG-style LLM traffic (two completions per request) through LLMClient against the fake model,
+# compared with the previous blocking SDK call pattern.
+# Usage: python -m benchmarks.bench_llm_concurrency [--requests 20] [--latency-ms 300] [--rate-limit-every 0]
+import argparse
+import asyncio
+import time
+from backend.fakes import FakeChatModel
+from backend.llm_client import LLMClient
+
+SQL_MESSAGES = [{"role": "system", "content": "You are a financial analytics SQL expert."},
+                {"role": "user", "content": "Q1 revenue by project"}]
+ANSWER_MESSAGES = [{"role": "system", "content": "You are a financial analytics assistant."},
+                   {"role": "user", "content": "Context: ..."}]
+
+async def blocking_request(latency: float):
+    # What openai.ChatCompletion.create did inside an async def: the event loop is held for each completion
+    time.sleep(latency)
+    time.sleep(latency)
+
+async def client_request(client: LLMClient):
+    await client.chat(SQL_MESSAGES, max_tokens=256)
+    await client.chat(ANSWER_MESSAGES, max_tokens=512, temperature=0.2)
+
+async def timed(requests: int, make_request) -> float:
+    started = time.perf_counter()
+    await asyncio.gather(*(make_request() for _ in range(requests)))
+    return time.perf_counter() - started
+
+async def main(requests: int, latency: float, concurrency: int, rate_limit_every: int):
+    elapsed = await timed(requests, lambda: blocking_request(latency))
+    print(f"blocking SDK:  {requests} requests in {elapsed:.2f}s ({requests / elapsed:.1f} req/s)")
+
+    model = FakeChatModel(latency=latency, rate_limit_every=rate_limit_every)
+    client = LLMClient(model, max_concurrency=concurrency, backoff=0.05)
+    elapsed = await timed(requests, lambda: client_request(client))
+    print(f"async client:  {requests} requests in {elapsed:.2f}s ({requests / elapsed:.1f} req/s), "
+          f"{model.calls} model calls, peak in-flight {model.max_in_flight} (limit {concurrency})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.latency_ms / 1000, args.concurrency, args.rate_limit_every))
@@ -0,0 +1,265 @@
+# Load test: the real app under uvicorn with local stand-ins (fake LLM with configurable latency and token rate,
+# in-memory chat store, filesystem blob store, SQLite or a given Postgres with generated financials data), driven
+# at a target concurrency with a synthetic traffic mix or a recorded one (JSONL). Reports p50/p95/p99 latency,
+# RPS and errors per endpoint plus server memory; saves the run as a baseline JSON and compares against one.
+# Usage: python -m benchmarks.bench_load [--requests 2000] [--concurrency 32] [--mix rag=30,chat_save=25,...]
+#        [--traffic recorded.jsonl] [--save-traffic mix.jsonl] [--save-baseline base.json] [--compare base.json]
+#        [--database-url postgresql+asyncpg://...] [--url http://host:port] [--env KEY=VALUE ...]
+# Traffic lines: {"name": "rag", "method": "POST", "path": "/rag-advanced/", "json": {...}, "params": {...}}
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_MIX = "rag=30,chat_save=25,chat_history=25,chat_sessions=15,ingest=5"
+BLOB_CONTAINER = "loadtest"
+BLOB_NAME = "financials.xlsx"
+QUESTIONS = ["revenue by project", "total revenue in {period}", "top {n} projects by revenue",
+             "average margin by region", "cost by project for {period}", "which projects grew revenue in {period}",
+             "revenue and cost by region", "projects with margin above {n} percent"]
+USERS = 50
+SESSIONS_PER_USER = 3
+
+def financials_frame(rows: int, seed: int = 1):
+    import pandas as pd
+    rng = random.Random(seed)
+    # (project, period) is unique, so delta ingestion of the workbook merges instead of appending
+    periods = [f"{year}-Q{quarter}" for year in range(2015, 2025) for quarter in range(1, 5)]
+    return pd.DataFrame([{"project": f"Project {i // len(periods)}", "period": periods[i % len(periods)],
+                          "region": rng.choice(["EMEA", "APAC", "Americas"]),
+                          "revenue": round(rng.uniform(1e4, 1e6), 2), "cost": round(rng.uniform(1e4, 6e5), 2),
+                          "margin": round(rng.uniform(-0.2, 0.6), 4)} for i in range(rows)])
+
+async def prepare_database(rows: int):
+    from sqlalchemy import inspect, text
+    from backend.db import engine
+    from backend.ingest_utils import load_frames
+    async with engine.connect() as conn:
+        exists = await conn.run_sync(lambda sync_conn: inspect(sync_conn).has_table("financials"))
+        existing = (await conn.execute(text("SELECT COUNT(*) FROM financials"))).scalar() if exists else 0
+    if existing:
+        print(f"financials already has {existing} rows, not generating data")
+    else:
+        await load_frames(engine, "financials", [financials_frame(rows)])
+    await engine.dispose()
+
+def write_workbook(blob_root: str, rows: int):
+    path = os.path.join(blob_root, BLOB_CONTAINER, BLOB_NAME)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    financials_frame(rows, seed=2).to_excel(path, index=False)
+
+def synthetic_traffic(requests: int, mix: dict, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    names = list(mix)
+    traffic = []
+    for name in rng.choices(names, weights=[mix[name] for name in names], k=requests):
+        user = f"user-{rng.randrange(USERS)}"
+        session = f"{user}-session-{rng.randrange(SESSIONS_PER_USER)}"
+        if name == "rag":
+            query = rng.choice(QUESTIONS).format(period=f"{rng.randrange(2015, 2025)}-Q{rng.randrange(1, 5)}",
+                                                 n=rng.choice([5, 10, 20]))
+            traffic.append({"name": name, "method": "POST", "path": "/rag-advanced/",
+                            "json": {"query": query, "user_role": rng.choice(["user", "user", "admin"]),
+                                     "user_id": user, "session_id": session}})
+        elif name == "chat_save":
+            traffic.append({"name": name, "method": "POST", "path": "/chat/save/",
+                            "json": {"session_id": session, "user_id": user, "user": "How did revenue develop?",
+                                     "assistant": "Revenue grew 4% quarter over quarter. " * rng.randrange(1, 20)}})
+        elif name == "chat_history":
+            traffic.append({"name": name, "method": "POST", "path": "/chat/history/",
+                            "json": {"session_id": session, "user_id": user, "limit": 50}})
+        elif name == "chat_sessions":
+            traffic.append({"name": name, "method": "GET", "path": "/chat/sessions/", "params": {"user_id": user}})
+        elif name == "ingest":
+            traffic.append({"name": name, "method": "POST", "path": "/ingest-excel-blob/",
+                            "json": {"container_name": BLOB_CONTAINER, "blob_name": BLOB_NAME, "mode": "delta"}})
+        else:
+            raise ValueError(f"Unknown traffic type {name!r}")
+    return traffic
+
+def read_traffic(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def rss_mb(pid: int):
+    # (current, peak) resident set size of the server process; None off Linux
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f)
+    except OSError:
+        return None, None
+    return int(fields["VmRSS"].split()[0]) / 1024, int(fields["VmHWM"].split()[0]) / 1024
+
+def start_server(port: int, env: dict) -> subprocess.Popen:
+    import httpx
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port),
+                               "--log-level", "warning"], env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                return server
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("server did not start")
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+async def drive(base_url: str, traffic: list, requests: int, concurrency: int, pid: int = None) -> dict:
+    import httpx
+    samples = {}
+    rss_samples = []
+    counter = itertools.count()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def worker(client):
+        while (i := next(counter)) < requests:
+            request = traffic[i % len(traffic)]
+            started = time.perf_counter()
+            try:
+                response = await client.request(request["method"], request["path"], json=request.get("json"),
+                                                params=request.get("params"))
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            samples.setdefault(request["name"], []).append((time.perf_counter() - started, ok))
+
+    async def sample_memory():
+        while True:
+            rss_samples.append(rss_mb(pid)[0])
+            await asyncio.sleep(0.5)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        monitor = asyncio.create_task(sample_memory()) if pid else None
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        if monitor is not None:
+            monitor.cancel()
+
+    def summarize(entries: list) -> dict:
+        latencies = [seconds * 1000 for seconds, _ in entries]
+        return {"count": len(entries), "errors": sum(1 for _, ok in entries if not ok),
+                "rps": round(len(entries) / elapsed, 2), "p50_ms": round(percentile(latencies, 50), 2),
+                "p95_ms": round(percentile(latencies, 95), 2), "p99_ms": round(percentile(latencies, 99), 2)}
+    report = {"seconds": round(elapsed, 3), "total": summarize([entry for entries in samples.values() for entry in entries]),
+              "endpoints": {name: summarize(entries) for name, entries in sorted(samples.items())}}
+    if pid:
+        rss, peak = rss_mb(pid)
+        report["memory"] = {"rss_mb": round(rss, 1) if rss else None, "peak_rss_mb": round(peak, 1) if peak else None,
+                            "avg_rss_mb": round(sum(rss_samples) / len(rss_samples), 1)
+                            if rss_samples and None not in rss_samples else None}
+    return report
+
+def compare(baseline: dict, report: dict, tolerance: float) -> list:
+    # Regressions beyond `tolerance` (fraction): slower p95/p99, lower RPS, more errors, more peak memory
+    regressions = []
+    for name, current in [("total", report["total"])] + list(report["endpoints"].items()):
+        base = baseline["total"] if name == "total" else baseline["endpoints"].get(name)
+        if base is None:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if current[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name} {key}: {base[key]} -> {current[key]}")
+        if current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{name} rps: {base['rps']} -> {current['rps']}")
+        if current["errors"] / current["count"] > base["errors"] / max(base["count"], 1) + 0.01:
+            regressions.append(f"{name} errors: {base['errors']}/{base['count']} -> {current['errors']}/{current['count']}")
+    base_peak = (baseline.get("memory") or {}).get("peak_rss_mb")
+    peak = (report.get("memory") or {}).get("peak_rss_mb")
+    if base_peak and peak and peak > base_peak * (1 + tolerance):
+        regressions.append(f"server peak RSS: {base_peak} MB -> {peak} MB")
+    return regressions
+
+def print_report(report: dict):
+    print(f"\n{'endpoint':15s} {'count':>6} {'errors':>6} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, row in list(report["endpoints"].items()) + [("total", report["total"])]:
+        print(f"{name:15s} {row['count']:>6} {row['errors']:>6} {row['rps']:>8.1f} {row['p50_ms']:>9.1f} "
+              f"{row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f}")
+    if report.get("memory"):
+        print(f"server memory: {report['memory']}")
+
+def main(args):
+    mix = {name: float(weight) for name, weight in (part.split("=") for part in args.mix.split(","))}
+    traffic = read_traffic(args.traffic) if args.traffic else synthetic_traffic(args.requests, mix, args.seed)
+    if args.save_traffic:
+        with open(args.save_traffic, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(request) + "\n" for request in traffic)
+    server = None
+    pid = args.pid
+    base_url = args.url
+    if base_url is None:
+        workdir = tempfile.mkdtemp(prefix="bench_load_")
+        database_url = args.database_url or f"sqlite+aiosqlite:///{os.path.join(workdir, 'financials.db')}"
+        blob_root = os.path.join(workdir, "blobs")
+        env = dict(os.environ, DATABASE_URL=database_url, LLM_BACKEND="fake", CHAT_STORE="memory", BLOB_STORE="local",
+                   BLOB_LOCAL_ROOT=blob_root, FAKE_LLM_LATENCY_MS=str(args.latency_ms),
+                   FAKE_LLM_TOKENS_PER_SECOND=str(args.tokens_per_second))
+        env.update(part.split("=", 1) for part in args.env)
+        os.environ["DATABASE_URL"] = database_url
+        asyncio.run(prepare_database(args.rows))
+        write_workbook(blob_root, args.workbook_rows)
+        server = start_server(args.port, env)
+        pid = server.pid
+        base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        if args.warmup:
+            asyncio.run(drive(base_url, traffic, args.warmup, args.concurrency))
+        print(f"{args.requests} requests ({len(traffic)} distinct, "
+              f"{'recorded: ' + args.traffic if args.traffic else 'mix ' + args.mix}) at concurrency "
+              f"{args.concurrency} against {base_url}")
+        report = asyncio.run(drive(base_url, traffic, args.requests, args.concurrency, pid))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    report["config"] = {"requests": args.requests, "concurrency": args.concurrency, "mix": args.mix,
+                        "traffic": args.traffic, "latency_ms": args.latency_ms,
+                        "tokens_per_second": args.tokens_per_second, "rows": args.rows, "env": args.env,
+                        "python": platform.python_version(), "cpus": os.cpu_count()}
+    print_report(report)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline saved to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        print(f"{len(regressions)} regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--traffic", help="replay a recorded JSONL traffic file instead of the synthetic mix")
+    parser.add_argument("--save-traffic", help="write the traffic that is driven to a JSONL file")
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--tokens-per-second", type=float, default=0)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--workbook-rows", type=int, default=400)
+    parser.add_argument("--database-url", help="e.g. a local Postgres; financials is generated when missing or empty")
+    parser.add_argument("--url", help="drive an already running app instead of starting one")
+    parser.add_argument("--pid", type=int, help="with --url: server process to sample memory from")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--env", nargs="*", default=[], help="extra server settings, KEY=VALUE")
+    parser.add_argument("--save-baseline")
+    parser.add_argument("--compare")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    main(parser.parse_args())
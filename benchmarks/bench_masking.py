@@ -0,0 +1,120 @@
+# Benchmark + checks: role masking of a 500k-row result - the previous per-row Python mask_data loop after
+# fetching vs the role policy's projection rewrite (masked values never leave the database), and masking
+# checks over aliases, aggregates, CTEs and SELECT * that the old loop got wrong.
+# Usage: python -m benchmarks.bench_masking [--rows 500000] [--repeat 3]
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+
+CHECKS = [
+    # (query, output column that must come back masked)
+    ("SELECT project, cost FROM financials LIMIT 5", "cost"),
+    ("SELECT project, cost AS c FROM financials LIMIT 5", "c"),
+    ("SELECT SUM(cost) AS total FROM financials", "total"),
+    ("SELECT project, SUM(cost) AS total FROM financials GROUP BY project", "total"),
+    ("SELECT project, revenue - cost AS profit FROM financials LIMIT 5", "profit"),
+    ("SELECT * FROM financials LIMIT 5", "cost"),
+    ("WITH t AS (SELECT project, cost AS spend FROM financials) SELECT project, spend FROM t LIMIT 5", "spend"),
+    ("SELECT project, MAX(cost) FROM financials GROUP BY project", "MAX(cost)"),
+    # identifiers fold case in the database, so the policy must too
+    ("SELECT COST FROM financials LIMIT 5", "cost"),
+    ("SELECT Cost AS c FROM financials LIMIT 5", "c"),
+    ('SELECT "COST" FROM financials LIMIT 5', "cost"),
+    ("SELECT * FROM FINANCIALS LIMIT 5", "cost"),
+    ("SELECT f.* FROM financials f LIMIT 5", "cost"),
+]
+REJECTED = [
+    "SELECT project FROM financials WHERE cost > 5000",
+    "SELECT project FROM financials ORDER BY cost DESC LIMIT 5",
+    "SELECT project FROM financials WHERE COST > 5000",
+    # whole-row references carry every column
+    "SELECT row_to_json(f) FROM financials f",
+    "SELECT f FROM financials f",
+    "SELECT to_json(financials.*) FROM financials",
+    "SELECT (f).cost FROM financials f",
+    "SELECT project FROM financials f WHERE row_to_json(f)::text LIKE '%cost%'",
+    "SELECT (SELECT row_to_json(f)) FROM financials f",
+]
+
+def legacy_mask_data(rows, user_role):
+    # the previous backend.rag_utils / backend.main implementation
+    if user_role != 'admin':
+        for row in rows:
+            if 'cost' in row:
+                row['cost'] = '***'
+    return rows
+
+def populate(path: str, rows: int):
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE financials (id INTEGER PRIMARY KEY, project TEXT, period TEXT, revenue FLOAT, "
+                "cost FLOAT, margin FLOAT)")
+    con.executemany("INSERT INTO financials (project, period, revenue, cost, margin) VALUES (?, ?, ?, ?, ?)",
+                    ((f"Project {i % 500}", f"2024-Q{i % 4 + 1}", float(i % 9973), (i % 9973) * 0.6,
+                      (i % 9973) * 0.4) for i in range(rows)))
+    con.commit()
+    con.close()
+
+async def fetch(engine, sql: str, role: str = None) -> list:
+    from sqlalchemy import text
+    rows = []
+    async with engine.connect() as conn:
+        result = await conn.stream(text(sql))
+        async for batch in result.partitions(1000):
+            batch = [dict(row._mapping) for row in batch]
+            rows += legacy_mask_data(batch, role) if role else batch
+    return rows
+
+async def main(repeat: int):
+    from backend.db import engine
+    from backend.role_policy import get_policy_engine, PolicyViolation, MASK_VALUE
+    from backend.schema_catalog import get_schema_catalog
+    table = await get_schema_catalog().get("financials")
+    policy = get_policy_engine().for_role("user")
+
+    sql = "SELECT * FROM financials"
+    rewritten = policy.apply(sql, table, engine.dialect.name)
+    started = time.perf_counter()
+    for _ in range(1000):
+        policy.apply(sql, table, engine.dialect.name)
+    rewrite_ms = (time.perf_counter() - started)
+    timings = {}
+    for label, query, role in (("python loop", sql, "user"), ("sql rewrite", rewritten, None)):
+        await fetch(engine, query, role)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            rows = await fetch(engine, query, role)
+        timings[label] = (time.perf_counter() - started) / repeat
+        print(f"{label:12s} {len(rows)} rows in {timings[label]:.2f}s, cost={rows[0]['cost']!r}")
+    print(f"rewrite: {rewrite_ms:.3f} ms per query ({rewritten[:90]}...), "
+          f"{timings['python loop'] / timings['sql rewrite']:.2f}x end to end")
+
+    print("\nmasking checks (role 'user'):")
+    failures = 0
+    for query, column in CHECKS:
+        legacy = await fetch(engine, query, "user")
+        masked = await fetch(engine, policy.apply(query, table, engine.dialect.name))
+        ok = bool(masked) and all(row.get(column) == MASK_VALUE for row in masked)
+        legacy_ok = all(row.get(column) == MASK_VALUE for row in legacy)
+        failures += not ok
+        print(f"  {'PASS' if ok else 'FAIL'}  (old loop {'masked' if legacy_ok else 'LEAKED'})  {query}")
+    for query in REJECTED:
+        try:
+            policy.apply(query, table, engine.dialect.name)
+            failures += 1
+            print(f"  FAIL  not rejected: {query}")
+        except PolicyViolation as e:
+            print(f"  PASS  rejected ({e}): {query}")
+    assert not failures, f"{failures} masking checks failed"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    path = os.path.join(tempfile.mkdtemp(), "bench_masking.db")
+    populate(path, args.rows)
+    os.environ.update(DATABASE_URL=f"sqlite+aiosqlite:///{path}", ROLLUPS_ENABLED="false")
+    asyncio.run(main(args.repeat))
@@ -0,0 +1,106 @@
+# Concurrency test: 100 parallel /rag-advanced/ requests against a local SQLite database, once per pool
+# configuration, showing how requests queue for connections (pool wait), overflow and - with a short
+# DB_POOL_TIMEOUT - fail fast with 503 once the pool is saturated. Each configuration runs in its own
+# process because the pool is configured from the environment when backend.db is imported.
+# Usage: python -m benchmarks.bench_pool_saturation [--requests 100] [--rows 200000] [--llm-latency-ms 50]
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# (pool_size, max_overflow, pool_timeout seconds)
+CONFIGS = [(1, 0, 30), (5, 0, 30), (5, 15, 30), (20, 10, 30), (2, 0, 0.5)]
+
+def populate(path: str, rows: int):
+    con = sqlite3.connect(path)
+    con.execute("DROP TABLE IF EXISTS financials")
+    con.execute("CREATE TABLE financials (id INTEGER PRIMARY KEY, project TEXT, period TEXT, revenue FLOAT, cost FLOAT)")
+    con.executemany("INSERT INTO financials (project, period, revenue, cost) VALUES (?, ?, ?, ?)",
+                    [(f"Project {i % 200}", f"2024-Q{i % 4 + 1}", float(i % 9973), (i % 9973) * 0.6)
+                     for i in range(rows)])
+    con.commit()
+    con.close()
+
+async def run_child(requests: int, llm_latency: float):
+    import httpx
+    from backend.fakes import FakeChatModel
+    from backend.llm_client import LLMClient, set_llm_client
+    from backend.main import app
+    from backend.db import engine, pool_stats
+    set_llm_client(LLMClient(FakeChatModel(latency=llm_latency)))
+    peak = 0
+
+    async def sample():
+        nonlocal peak
+        while True:
+            peak = max(peak, engine.pool.checkedout())
+            await asyncio.sleep(0.002)
+
+    async def one(client) -> tuple:
+        started = time.perf_counter()
+        resp = await client.post("/rag-advanced/", json={"query": "revenue by project", "user_role": "admin",
+                                                          "include_timings": True})
+        body = resp.json()
+        wait = body.get("timings", {}).get("stages_ms", {}).get("db_pool_wait", 0.0) if resp.status_code == 200 else None
+        return resp.status_code, time.perf_counter() - started, wait
+
+    # ASGITransport does not run the lifespan (startup/shutdown handlers), so run it here
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            await one(client)
+            sampler = asyncio.create_task(sample())
+            started = time.perf_counter()
+            results = await asyncio.gather(*(one(client) for _ in range(requests)))
+            elapsed = time.perf_counter() - started
+            sampler.cancel()
+        stats = pool_stats()
+    ok = sorted(seconds for status, seconds, _ in results if status == 200)
+    waits = sorted(wait for status, _, wait in results if status == 200)
+    quantile = lambda values, q: values[min(int(len(values) * q), len(values) - 1)] if values else None
+    print(json.dumps({"ok": len(ok), "errors": {str(status): sum(1 for s, _, _ in results if s == status)
+                                                for status in {s for s, _, _ in results if s != 200}},
+                      "seconds": elapsed, "p50": statistics.median(ok) if ok else None, "p99": quantile(ok, 0.99),
+                      "wait_p50": statistics.median(waits) if waits else None, "wait_max": waits[-1] if waits else None,
+                      "peak_checked_out": peak, "connects": stats["connects"], "timeouts": stats["timeouts"]}))
+
+def main(requests: int, rows: int, llm_latency: float):
+    path = os.path.join(tempfile.mkdtemp(), "bench_pool.db")
+    print(f"loading {rows} rows ...")
+    populate(path, rows)
+    print(f"{requests} parallel /rag-advanced/ requests, fake model {llm_latency * 1000:.0f} ms per call, "
+          f"GROUP BY over {rows} rows per request")
+    print(f"{'pool+overflow':>14} {'timeout':>8} {'ok':>4} {'errors':>10} {'req/s':>7} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'wait p50':>9} {'wait max':>9} {'peak out':>9} {'connects':>9}")
+    for pool_size, max_overflow, timeout in CONFIGS:
+        env = dict(os.environ, DATABASE_URL=f"sqlite+aiosqlite:///{path}", LLM_BACKEND="fake", CHAT_STORE="memory",
+                   SQL_CACHE_BACKEND="off", ANSWER_CACHE_BACKEND="off", ROLLUPS_ENABLED="false", COLUMNAR_ENGINE="false",
+                   LLM_MAX_CONCURRENCY=str(requests), DB_POOL_SIZE=str(pool_size),
+                   DB_MAX_OVERFLOW=str(max_overflow), DB_POOL_TIMEOUT=str(timeout))
+        out = subprocess.run([sys.executable, "-m", "benchmarks.bench_pool_saturation", "--child",
+                              "--requests", str(requests), "--llm-latency-ms", str(llm_latency * 1000)],
+                             env=env, capture_output=True, text=True, check=True)
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        ms = lambda value: f"{value * 1000:.0f}" if value is not None else "-"
+        wait = lambda value: f"{value:.0f}" if value is not None else "-"
+        print(f"{pool_size:>6}+{max_overflow:<7} {timeout:>7}s {r['ok']:>4} {str(r['errors'] or '-'):>10} "
+              f"{requests / r['seconds']:>7.1f} {ms(r['p50']):>8} {ms(r['p99']):>8} {wait(r['wait_p50']):>9} "
+              f"{wait(r['wait_max']):>9} {r['peak_checked_out']:>9} {r['connects']:>9}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--child", action="store_true")
+    args = parser.parse_args()
+    if args.child:
+        asyncio.run(run_child(args.requests, args.llm_latency_ms / 1000))
+    else:
+        main(args.requests, args.rows, args.llm_latency_ms / 1000)
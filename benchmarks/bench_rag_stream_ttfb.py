@@ -0,0 +1,72 @@
+# TTFB: /rag-advanced/ (single JSON response) vs /rag-advanced/stream/ (server-sent events), against a local
+# uvicorn server with the fake model, in-memory chat store and a SQLite financials table.
+# Usage: python -m benchmarks.bench_rag_stream_ttfb [--latency-ms 400] [--tokens-per-second 40] [--runs 5]
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+def prepare_env():
+    path = os.path.join(tempfile.mkdtemp(), "bench_stream.db")
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE financials (id INTEGER PRIMARY KEY, project TEXT, revenue FLOAT, cost FLOAT, margin FLOAT)")
+    con.executemany("INSERT INTO financials (project, revenue, cost, margin) VALUES (?, ?, ?, ?)",
+                    [(f"Project {i % 40}", float(i), i * 0.6, i * 0.4) for i in range(2000)])
+    con.commit()
+    con.close()
+    os.environ.update(DATABASE_URL=f"sqlite+aiosqlite:///{path}", LLM_BACKEND="fake", CHAT_STORE="memory",
+                      SQL_CACHE_BACKEND="off", ANSWER_CACHE_BACKEND="off")
+
+def serve(port: int):
+    import uvicorn
+    from backend.main import app
+    server = uvicorn.Server(uvicorn.Config(app, port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+def main(latency: float, tokens_per_second: float, runs: int, port: int):
+    prepare_env()
+    from backend.fakes import FakeChatModel
+    from backend.llm_client import LLMClient, set_llm_client
+    answer = " ".join(["Revenue grew across the top projects this quarter."] * 6)
+    model = FakeChatModel(latency=latency, tokens_per_second=tokens_per_second,
+                          responder=lambda messages: FakeChatModel.DEFAULT_SQL if "SQL expert" in messages[0]["content"] else answer)
+    set_llm_client(LLMClient(model))
+    server = serve(port)
+    import httpx
+    body = {"query": "revenue by project", "user_role": "admin"}
+    blocking, first_byte, first_token, streamed = [], [], [], []
+    with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+        for _ in range(runs):
+            started = time.perf_counter()
+            with client.stream("POST", "/rag-advanced/", json=body) as resp:
+                next(resp.iter_bytes())
+                blocking.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            with client.stream("POST", "/rag-advanced/stream/", json=body) as resp:
+                got_token = False
+                for i, line in enumerate(resp.iter_lines()):
+                    if i == 0:
+                        first_byte.append(time.perf_counter() - started)
+                    if line == "event: token" and not got_token:
+                        first_token.append(time.perf_counter() - started)
+                        got_token = True
+                streamed.append(time.perf_counter() - started)
+    server.should_exit = True
+    ms = lambda values: f"{statistics.median(values) * 1000:.0f} ms"
+    print(f"/rag-advanced/         TTFB (= full answer): {ms(blocking)}")
+    print(f"/rag-advanced/stream/  TTFB: {ms(first_byte)}, first answer token: {ms(first_token)}, complete: {ms(streamed)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency-ms", type=float, default=400)
+    parser.add_argument("--tokens-per-second", type=float, default=40)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    main(args.latency_ms / 1000, args.tokens_per_second, args.runs, args.port)
@@ -0,0 +1,65 @@
+# Peak-RSS check: fetchall + full-context prompt (previous run_rag_pipeline) vs streaming summarization,
+# for a SELECT * over a large synthetic financials table. Each mode runs in its own process.
+# Usage: python -m benchmarks.bench_result_streaming [--rows 2000000]
+import argparse
+import asyncio
+import os
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from backend.result_utils import ResultSummarizer, RESULT_STREAM_BATCH
+
+def build_table(path: str, rows: int):
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE financials (id INTEGER PRIMARY KEY, project TEXT, period TEXT, "
+                "revenue FLOAT, cost FLOAT, margin FLOAT)")
+    batch = 100000
+    for start in range(0, rows, batch):
+        con.executemany("INSERT INTO financials (project, period, revenue, cost, margin) VALUES (?, ?, ?, ?, ?)",
+                        ((f"Project {i % 500}", f"2024-Q{i % 4 + 1}", float(i % 9973), (i % 9973) * 0.6,
+                          (i % 9973) * 0.4) for i in range(start, min(start + batch, rows))))
+    con.commit()
+    con.close()
+
+async def run(path: str, mode: str):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    started = time.perf_counter()
+    if mode == "legacy":
+        async with engine.begin() as conn:
+            result = await conn.execute(text("SELECT * FROM financials"))
+            rows = [dict(row._mapping) for row in result.fetchall()]
+        context = "\n".join(str(row) for row in rows)
+        row_count = len(rows)
+    else:
+        summary = ResultSummarizer()
+        async with engine.connect() as conn:
+            result = await conn.stream(text("SELECT * FROM financials"))
+            async for batch in result.partitions(RESULT_STREAM_BATCH):
+                for row in batch:
+                    summary.add(dict(row._mapping))
+        context = summary.context()
+        row_count = summary.row_count
+    elapsed = time.perf_counter() - started
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{mode:9s} rows={row_count} context={len(context) / 1024:.0f} KiB peak_rss={peak_mb:.0f} MiB time={elapsed:.1f}s")
+    await engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--mode", choices=["legacy", "stream"])
+    parser.add_argument("--db")
+    args = parser.parse_args()
+    if args.mode:
+        asyncio.run(run(args.db, args.mode))
+    else:
+        path = os.path.join(tempfile.mkdtemp(), "bench_results.db")
+        build_table(path, args.rows)
+        for mode in ("legacy", "stream"):
+            subprocess.run([sys.executable, "-m", "benchmarks.bench_result_streaming", "--mode", mode, "--db", path],
+                           check=True)
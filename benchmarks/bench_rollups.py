@@ -0,0 +1,112 @@
+# Micro-benchmark: common aggregate questions answered from rollups vs scanning the base table
+# Usage: python -m benchmarks.bench_rollups [--rows 1000000] [--repeat 5] [--database-url postgresql+asyncpg://...]
+import argparse
+import asyncio
+import math
+import os
+import tempfile
+import time
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from backend import schema_catalog
+from backend.data_version import bump_data_version
+from backend.rollups import RollupRouter
+from benchmarks.bench_columnar import populate
+
+QUERIES = [
+    "SELECT project, SUM(revenue) AS revenue, SUM(cost) AS cost, AVG(margin) AS margin FROM financials "
+    "GROUP BY project ORDER BY revenue DESC",
+    "SELECT period, SUM(revenue) - SUM(cost) AS profit FROM financials GROUP BY period ORDER BY period",
+    "SELECT project, SUM(revenue) AS revenue FROM financials GROUP BY project ORDER BY revenue DESC LIMIT 10",
+    "SELECT SUM(revenue) AS revenue, COUNT(*) AS n FROM financials WHERE period = '2024-Q3'",
+    "SELECT project, SUM(revenue) AS revenue FROM financials WHERE revenue > 50 GROUP BY project",
+]
+
+async def timed(engine, sql: str, repeat: int):
+    best, rows = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        async with engine.connect() as conn:
+            rows = (await conn.execute(text(sql))).fetchall()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000, rows
+
+async def main(rows: int, repeat: int, database_url: str):
+    url = database_url or f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_rollups.db')}"
+    engine = create_async_engine(url)
+    print(f"loading {rows} rows into {engine.dialect.name} ...")
+    await populate(engine, rows)
+    schema_catalog._schema_catalog = schema_catalog.SchemaCatalog(engine)
+    router = RollupRouter(engine)
+    started = time.perf_counter()
+    await router.refresh()
+    print(f"rollups built in {time.perf_counter() - started:.2f}s: {router.stats()['rollups']}")
+
+    for sql in QUERIES:
+        routed, rollup = router.route(sql)
+        base_ms, expected = await timed(engine, sql, repeat)
+        if rollup is None:
+            print(f"{sql[:70]:<72} base {base_ms:8.1f} ms  (not routable, falls through)")
+            continue
+        rollup_ms, actual = await timed(engine, routed, repeat)
+        assert len(actual) == len(expected), sql
+        print(f"{sql[:70]:<72} base {base_ms:8.1f} ms  rollup {rollup_ms:6.2f} ms  ({base_ms / rollup_ms:.0f}x, "
+              f"{rollup.name})")
+
+    checks = await check_refresh_after_load(engine, router, rows)
+    print("\nchecks:")
+    for label, ok in checks:
+        print(f"  {'PASS' if ok else 'FAIL'}  {label}")
+    await engine.dispose()
+    assert all(ok for _, ok in checks), "rollup checks failed"
+
+def same_rows(left: list, right: list) -> bool:
+    # order-insensitive, floats equal up to summation order
+    key = lambda row: tuple((value is None, str(value)) for value in row if not isinstance(value, float))
+    return len(left) == len(right) and all(
+        len(a) == len(b) and all(x == y or (isinstance(x, (int, float)) and isinstance(y, (int, float))
+                                            and math.isclose(x, y, rel_tol=1e-9, abs_tol=1e-6)) for x, y in zip(a, b))
+        for a, b in zip(sorted(left, key=key), sorted(right, key=key)))
+
+async def check_refresh_after_load(engine, router, rows: int) -> list:
+    # After each kind of load: how the rollups refreshed, how long it took, and whether every routed query still
+    # returns what the base table does
+    async def load(sql: str, rewrites: bool = False, **params):
+        async with engine.begin() as conn:
+            await conn.execute(text(sql), params)
+            await bump_data_version(conn, "financials", rewrites=rewrites)
+        started = time.perf_counter()
+        await router.refresh()
+        elapsed = time.perf_counter() - started
+        answers = []
+        for sql in QUERIES:
+            routed, rollup = router.route(sql)
+            if rollup is not None:
+                answers.append(same_rows((await timed(engine, routed, 1))[1], (await timed(engine, sql, 1))[1]))
+        return router.last_refresh, elapsed, all(answers)
+
+    insert = ("INSERT INTO financials (id, project, period, revenue, cost, margin) "
+              "VALUES (:id, :project, '2024-Q3', 12.5, NULL, 3)")
+    appended = await load(insert, id=rows + 1, project="P7")
+    new_group = await load(insert, id=rows + 2, project="P-new")
+    updated = await load("UPDATE financials SET revenue = revenue + 1000 WHERE id = 1", rewrites=True)
+    # committed after the last build with an id below the highest one it covered
+    late = await load(insert, id=0, project="P7")
+    print(f"\nrefresh after appending 1 row {appended[1] * 1000:.1f} ms, after updating 1 row (full build) "
+          f"{updated[1] * 1000:.1f} ms")
+    return [
+        ("an append merges into the rollups", appended[0] == "merged" and appended[2]),
+        ("an append with a new group merges into the rollups", new_group[0] == "merged" and new_group[2]),
+        ("merging 1 row is faster than the full build", appended[1] < updated[1] / 2),
+        ("an update rebuilds the rollups", updated[0] == "rebuilt" and updated[2]),
+        ("rows committed below the covered id rebuild the rollups", late[0] == "rebuilt" and late[2]),
+    ]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat, args.database_url))
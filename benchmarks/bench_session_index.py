@@ -0,0 +1,79 @@
+# Benchmark: /chat/sessions/ cost with 10k sessions, DISTINCT scan over every message vs the session index point read
+# Usage: python -m benchmarks.bench_session_index [--sessions 10000] [--messages-per-session 3] [--requests 20]
+import argparse
+import asyncio
+import time
+from backend.cosmos_utils import ChatHistoryRepository
+from backend.fakes import InMemoryCosmosClient
+
+USER = "u1"
+
+async def legacy_sessions(repo) -> list:
+    # Previous behaviour: cross-partition DISTINCT over the user's messages, de-duplicated in Python
+    query = "SELECT DISTINCT c.session_id FROM c WHERE c.user_id=@user_id"
+    params = [{"name": "@user_id", "value": USER}]
+    items = repo.container.query_items(query=query, parameters=params, enable_cross_partition_query=True)
+    return list({item["session_id"] async for item in items})
+
+async def measure(label: str, client, call, requests: int):
+    calls, scanned = client.data_plane_calls, client.documents_scanned
+    started = time.perf_counter()
+    for _ in range(requests):
+        sessions = await call()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<22} {len(sessions):>6} sessions: {(client.data_plane_calls - calls) / requests:.1f} round trips, "
+          f"{(client.documents_scanned - scanned) / requests:9.0f} documents scanned, "
+          f"{elapsed / requests * 1000:8.2f} ms per request")
+    return sessions
+
+async def main(sessions: int, per_session: int, requests: int):
+    client = InMemoryCosmosClient()
+    repo = await ChatHistoryRepository.create(client)
+    started = time.perf_counter()
+    for i in range(sessions):
+        for turn in range(per_session):
+            await repo.save_chat_message({"session_id": f"s{i:05d}", "user_id": USER,
+                                          "user": f"question {turn} in session {i}", "assistant": "a"})
+    saves = sessions * per_session
+    print(f"{saves} saves (message upsert + index patch): {(time.perf_counter() - started) / saves * 1e6:.0f} us per save")
+
+    legacy = await measure("DISTINCT scan (before)", client, lambda: legacy_sessions(repo), requests)
+    indexed = await measure("session index", client, lambda: repo.list_sessions(USER), requests)
+    assert sorted(legacy) == sorted(entry["session_id"] for entry in indexed)
+    assert indexed[0]["session_id"] == f"s{sessions - 1:05d}" and indexed[0]["message_count"] == per_session
+
+    # Migration path: drop the index and rebuild it from the messages
+    for key in [key for key in repo.container.items if key[1] == "session-index"]:
+        del repo.container.items[key]
+    started = time.perf_counter()
+    users = await repo.backfill_all_session_indexes()
+    print(f"backfill of {users} user(s): {time.perf_counter() - started:.2f}s")
+    rebuilt = await repo.list_sessions(USER)
+    assert [(e["session_id"], e["message_count"]) for e in rebuilt] == [(e["session_id"], e["message_count"]) for e in indexed]
+
+    checks = await check_concurrent_first_saves()
+    print("\nchecks:")
+    for label, ok in checks:
+        print(f"  {'PASS' if ok else 'FAIL'}  {label}")
+    assert all(ok for _, ok in checks), "session index checks failed"
+
+async def check_concurrent_first_saves() -> list:
+    # Two first saves to a new session race (both find no entry, both add one): neither message may be lost
+    client = InMemoryCosmosClient(latency=0.01)
+    repo = await ChatHistoryRepository.create(client)
+    await repo.save_chat_message({"session_id": "existing", "user_id": USER, "user": "q", "assistant": "a"})
+    checks = []
+    for session_id in ("new", 'new "quoted" \\ session'):
+        await asyncio.gather(*(repo.save_chat_message({"session_id": session_id, "user_id": USER, "user": f"q{i}",
+                                                       "assistant": "a"}) for i in range(2)))
+        entry = next(entry for entry in await repo.list_sessions(USER) if entry["session_id"] == session_id)
+        checks.append((f"concurrent first saves to {session_id!r} count both messages", entry["message_count"] == 2))
+    return checks
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--messages-per-session", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.sessions, args.messages_per_session, args.requests))
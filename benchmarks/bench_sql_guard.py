@@ -0,0 +1,128 @@
+# Benchmark: SQL guard on a local SQLite financials table - per-query overhead of the checks (parse, LIMIT,
+# EXPLAIN, read-only transaction), estimated cost vs actual time for a few query shapes (what SQL_MAX_COST is
+# tuned from), a runaway cross join run unguarded vs rejected / cut off by the guard, and checks that results cut
+# off by the row cap are flagged.
+# Usage: python -m benchmarks.bench_sql_guard [--rows 200000] [--repeat 20] [--runaway-seconds 20]
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+QUERIES = [
+    "SELECT project, SUM(revenue) AS revenue FROM financials GROUP BY project",
+    "SELECT * FROM financials WHERE id = 42",
+    "SELECT * FROM financials WHERE project = 'Project 7'",
+    "SELECT * FROM financials",
+    "SELECT a.project, COUNT(*) FROM financials a JOIN financials b ON a.project = b.project AND a.period = b.period "
+    "WHERE a.id < 200 GROUP BY a.project",
+]
+RUNAWAY = "SELECT COUNT(*) FROM financials a, financials b WHERE a.revenue > b.revenue"
+
+def populate(path: str, rows: int):
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE financials (id INTEGER PRIMARY KEY, project TEXT, period TEXT, revenue FLOAT, cost FLOAT)")
+    con.executemany("INSERT INTO financials (project, period, revenue, cost) VALUES (?, ?, ?, ?)",
+                    [(f"Project {i % 500}", f"2024-Q{i % 4 + 1}", float(i % 9973), (i % 9973) * 0.6)
+                     for i in range(rows)])
+    con.execute("CREATE INDEX ix_financials_project ON financials (project)")
+    con.commit()
+    con.close()
+
+def run_with_deadline(path: str, sql: str, seconds: float) -> bool:
+    # Plain sqlite3 so the runaway can be interrupted from a timer; returns False when it was
+    con = sqlite3.connect(path, check_same_thread=False)
+    timer = threading.Timer(seconds, con.interrupt)
+    timer.start()
+    try:
+        con.execute(sql).fetchall()
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        timer.cancel()
+        con.close()
+
+async def main(repeat: int, runaway_seconds: float):
+    from sqlalchemy import text
+    from fastapi import HTTPException
+    from backend.db import engine
+    from backend.sql_guard import get_sql_guard
+    from backend.rag_utils import execute_streaming, result_entry
+    guard = get_sql_guard()
+
+    async def unguarded(sql: str):
+        async with engine.connect() as conn:
+            result = await conn.stream(text(sql))
+            async for _ in result.partitions(1000):
+                pass
+
+    async def guarded(sql: str):
+        return await execute_streaming(guard.check(sql))
+
+    sql = QUERIES[0]
+    await unguarded(sql)
+    await guarded(sql)
+    timings = {}
+    for label, run in (("unguarded", unguarded), ("guarded", guarded)):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            await run(sql)
+        timings[label] = (time.perf_counter() - started) / repeat * 1000
+    print(f"group-by query: {timings['unguarded']:.2f} ms unguarded, {timings['guarded']:.2f} ms guarded "
+          f"(+{timings['guarded'] - timings['unguarded']:.2f} ms for parse, LIMIT, EXPLAIN, read-only transaction)")
+
+    print(f"\n{'estimated cost':>15} {'actual ms':>10} {'rows':>7}  query")
+    for sql in QUERIES:
+        await guarded(sql)
+        cost, ms, rows = guard.recent[-1]
+        print(f"{cost if cost is not None else float('nan'):>15.0f} {ms:>10.1f} {rows:>7}  {sql[:80]}")
+
+    print(f"\nrunaway: {RUNAWAY}")
+    started = time.perf_counter()
+    finished = await asyncio.to_thread(run_with_deadline, engine.url.database, RUNAWAY, runaway_seconds)
+    print(f"  unguarded:         {'finished' if finished else 'still running, interrupted'} after "
+          f"{time.perf_counter() - started:.1f}s")
+    for label, max_cost in (("cost check", guard.max_cost), ("timeout only", 0)):
+        guard.max_cost = max_cost
+        started = time.perf_counter()
+        try:
+            await guarded(RUNAWAY)
+            outcome = "ran"
+        except HTTPException as e:
+            outcome = f"{e.status_code} {e.detail.splitlines()[0]}"
+        print(f"  guard, {label + ':':13s} {outcome} after {(time.perf_counter() - started) * 1000:.0f} ms")
+    print(f"\nguard stats: { {key: value for key, value in guard.stats().items() if key != 'recent'} }")
+
+    # row cap: a result cut off by the guard's LIMIT is flagged (in the model's context too), one that merely
+    # reaches the cap or asked for fewer rows is not
+    guard.max_cost, guard.max_rows = 0, 1000
+    capped = result_entry(*await guarded("SELECT * FROM financials"))
+    exact = result_entry(*await guarded("SELECT * FROM financials LIMIT 1000"))
+    small = result_entry(*await guarded("SELECT project, SUM(revenue) FROM financials GROUP BY project"))
+    checks = [
+        ("uncapped query stops at the cap and is flagged", capped["row_count"] == 1000 and capped["capped"]),
+        ("the model is told totals are partial", "cut off at the 1000-row limit" in capped["context"]),
+        ("LIMIT equal to the cap is not flagged", exact["row_count"] == 1000 and not exact["capped"]),
+        ("result under the cap is not flagged", small["row_count"] == 500 and not small["capped"]),
+    ]
+    print("\nchecks:")
+    for label, ok in checks:
+        print(f"  {'PASS' if ok else 'FAIL'}  {label}")
+    await engine.dispose()
+    assert all(ok for _, ok in checks), "row cap checks failed"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--runaway-seconds", type=float, default=20)
+    parser.add_argument("--timeout-ms", type=int, default=2000)
+    args = parser.parse_args()
+    path = os.path.join(tempfile.mkdtemp(), "bench_sql_guard.db")
+    populate(path, args.rows)
+    os.environ.update(DATABASE_URL=f"sqlite+aiosqlite:///{path}", ROLLUPS_ENABLED="false", COLUMNAR_ENGINE="false",
+                      SQL_QUERY_TIMEOUT_MS=str(args.timeout_ms))
+    asyncio.run(main(args.repeat, args.runaway_seconds))
@@ -0,0 +1,66 @@
+# Micro-benchmark: tracing overhead per instrumented call and per RAG request, enabled vs disabled
+# Usage: python -m benchmarks.bench_tracing [--calls 1000000] [--requests 200]
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from sqlalchemy import text
+# backend.db owns the engine; point it at a scratch SQLite file before anything imports it. Every request
+# runs the full pipeline, so the answer cache is off
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_tracing.db')}"
+os.environ["ANSWER_CACHE_BACKEND"] = "off"
+from backend import tracing, rag_utils
+from backend.db import engine
+from backend.fakes import FakeChatModel
+from backend.llm_client import LLMClient, set_llm_client
+from backend.tracing import stage, count, start_trace
+
+def per_call_ns(calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        with stage("bench"):
+            count("bench")
+    return (time.perf_counter() - started) / calls * 1e9
+
+def baseline_ns(calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        pass
+    return (time.perf_counter() - started) / calls * 1e9
+
+async def per_request_ms(requests: int) -> float:
+    started = time.perf_counter()
+    for _ in range(requests):
+        start_trace("bench")
+        await rag_utils.run_rag_pipeline("revenue by project")
+    return (time.perf_counter() - started) / requests * 1000
+
+async def main(calls: int, requests: int):
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE TABLE financials (id INTEGER PRIMARY KEY, project TEXT, revenue FLOAT, cost FLOAT)"))
+        await conn.execute(text("INSERT INTO financials (project, revenue, cost) VALUES (:p, :r, :c)"),
+                           [{"p": f"P{i % 20}", "r": i * 1.5, "c": i * 0.7} for i in range(2000)])
+    # zero-latency model so the measurement is dominated by our own code
+    set_llm_client(LLMClient(FakeChatModel(latency=0)))
+    await per_request_ms(10)
+
+    base = baseline_ns(calls)
+    results = {}
+    for enabled in (False, True):
+        tracing.TRACING_ENABLED = enabled
+        results[enabled] = (per_call_ns(calls) - base, await per_request_ms(requests))
+    for enabled, (call_ns, request_ms) in results.items():
+        print(f"tracing {'enabled ' if enabled else 'disabled'}: {call_ns:7.1f} ns per stage()+count(), "
+              f"{request_ms:.3f} ms per RAG request")
+    overhead = results[True][1] - results[False][1]
+    print(f"per-request overhead when enabled: {overhead:.3f} ms "
+          f"({overhead / results[False][1] * 100:.1f}% of a zero-latency request)")
+    await engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=1000000)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.calls, args.requests))
@@ -0,0 +1,161 @@
+# Backend API client for the Streamlit UI: one pooled keep-alive requests.Session per Streamlit server process
+# (shared by every browser session via st.cache_resource) with timeouts and retries, a small thread pool for
+# independent calls, and short-TTL caches for the session list and chat history pages.
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import settings
+
+class TTLCache:
+    # Thread-safe: the pool threads fill it while the script thread reads it
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.ttl > 0:
+            with self._lock:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, user_id: str, session_id: str = None):
+        # keys are (kind, user_id, session_id, ...); the session list has no session_id
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == user_id and
+                        (session_id is None or key[0] == "sessions" or key[2] == session_id)]:
+                del self._entries[key]
+
+class ApiClient:
+    def __init__(self, rag_api_url: str = None):
+        rag_api_url = rag_api_url or settings.RAG_API_URL
+        self.rag_url = rag_api_url
+        self.sessions_url = rag_api_url.replace('/rag-advanced/', '/chat/sessions/')
+        self.history_url = rag_api_url.replace('/rag-advanced/', '/chat/history/')
+        self.timeout = (settings.API_CONNECT_TIMEOUT, settings.API_READ_TIMEOUT)
+        self.cache = TTLCache(settings.API_CACHE_TTL_SECONDS)
+        self.round_trips = 0
+        self.session = requests.Session()
+        # reads are safe to repeat; the RAG endpoints (which save the turn) only retry a failed connect.
+        # The longest mounted prefix wins.
+        backoff = {"backoff_factor": settings.API_RETRY_BACKOFF, "raise_on_status": False}
+        self.session.mount(rag_api_url.replace('/rag-advanced/', '/'), HTTPAdapter(
+            pool_maxsize=settings.API_POOL_SIZE, max_retries=Retry(
+                total=settings.API_RETRIES, status_forcelist=(502, 503, 504), allowed_methods=None, **backoff)))
+        self.session.mount(rag_api_url, HTTPAdapter(
+            pool_maxsize=settings.API_POOL_SIZE, max_retries=Retry(
+                total=settings.API_RETRIES, read=0, status=0, other=0, **backoff)))
+        self.executor = ThreadPoolExecutor(max_workers=settings.API_MAX_WORKERS, thread_name_prefix="api")
+
+    def _request(self, method: str, url: str, **kwargs):
+        self.round_trips += 1
+        return self.session.request(method, url, timeout=kwargs.pop("timeout", self.timeout), **kwargs)
+
+    def submit(self, fn, *args) -> Future:
+        # Independent calls run concurrently; with API_PARALLEL_FETCH off they run inline, one after the other
+        if settings.API_PARALLEL_FETCH:
+            return self.executor.submit(fn, *args)
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    def invalidate(self, user_id: str, session_id: str = None):
+        self.cache.invalidate(user_id, session_id)
+
+    def get_sessions(self, user_id: str) -> list:
+        # Session index entries (session_id, title, last_active, message_count), most recently active first
+        key = ("sessions", user_id)
+        sessions = self.cache.get(key)
+        if sessions is not None:
+            return sessions
+        try:
+            resp = self._request("GET", self.sessions_url, params={"user_id": user_id})
+        except requests.RequestException:
+            return []
+        if resp.status_code != 200:
+            return []
+        body = resp.json()
+        sessions = body.get("details") or [{"session_id": session_id, "title": session_id} for session_id in body.get("sessions", [])]
+        self.cache.put(key, sessions)
+        return sessions
+
+    def get_history_page(self, session_id: str, user_id: str, after_ts=None, limit=None, after_id=None) -> dict:
+        # One page of messages after the (after_ts, after_id) cursor:
+        # {"history": [...], "last_ts": ..., "last_id": ..., "has_more": ...}
+        key = ("history", user_id, session_id, after_ts, after_id, limit)
+        page = self.cache.get(key)
+        if page is not None:
+            return page
+        empty = {"history": [], "last_ts": after_ts, "last_id": after_id, "has_more": False}
+        try:
+            resp = self._request("POST", self.history_url, json={"session_id": session_id, "user_id": user_id,
+                                                                 "after_ts": after_ts, "after_id": after_id,
+                                                                 "limit": limit})
+        except requests.RequestException:
+            return empty
+        if resp.status_code != 200:
+            return empty
+        page = resp.json()
+        self.cache.put(key, page)
+        return page
+
+    def send_rag_query(self, query, user_id, user_role, session_id=None):
+        # With session_id the backend saves the turn to the chat history itself
+        try:
+            return self._request("POST", self.rag_url, json={
+                "query": query,
+                "user_id": user_id,
+                "user_role": user_role,
+                "session_id": session_id
+            })
+        finally:
+            self.invalidate(user_id, session_id)
+
+    def stream_rag_query(self, query, user_id, user_role, session_id=None):
+        # Yields (event, payload) pairs from the /rag-advanced/stream/ server-sent events endpoint
+        try:
+            with self._request("POST", self.rag_url.rstrip('/') + '/stream/', json={
+                "query": query,
+                "user_id": user_id,
+                "user_role": user_role,
+                "session_id": session_id
+            }, stream=True, timeout=(settings.API_CONNECT_TIMEOUT, settings.API_STREAM_READ_TIMEOUT)) as resp:
+                if resp.status_code != 200:
+                    yield "error", {"error": resp.text}
+                    return
+                event, data = "message", []
+                for line in resp.iter_lines(decode_unicode=True):
+                    if line.startswith("event:"):
+                        event = line[len("event:"):].strip()
+                    elif line.startswith("data:"):
+                        data.append(line[len("data:"):].strip())
+                    elif not line and data:
+                        yield event, json.loads("\n".join(data))
+                        event, data = "message", []
+        except requests.RequestException as e:
+            yield "error", {"error": f"Request failed: {e}"}
+        finally:
+            self.invalidate(user_id, session_id)
+
+    def stats(self) -> dict:
+        return {"round_trips": self.round_trips, "cache_hits": self.cache.hits, "cache_misses": self.cache.misses}
+
+@st.cache_resource
+def get_api_client() -> ApiClient:
+    return ApiClient()
@@ -13,5 +13,20 @@ class Settings:
     AUTHORITY = f"https://login.microsoftonline.com/{TENANT_ID}"
     SCOPE = ["User.Read"]
     RAG_API_URL = os.getenv("RAG_API_URL", "http://localhost:8000/rag-advanced/")
+    HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "200"))
+    # Backend API client: (connect, read) timeouts in seconds; streamed answers allow a longer gap between events
+    API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "3.05"))
+    API_READ_TIMEOUT = float(os.getenv("API_READ_TIMEOUT", "30"))
+    API_STREAM_READ_TIMEOUT = float(os.getenv("API_STREAM_READ_TIMEOUT", "120"))
+    # Retries with backoff for reads (connection errors, 502/503/504); RAG queries are only retried when the
+    # connection could not be opened, never after the request was sent
+    API_RETRIES = int(os.getenv("API_RETRIES", "2"))
+    API_RETRY_BACKOFF = float(os.getenv("API_RETRY_BACKOFF", "0.3"))
+    # Keep-alive connections per host shared by every browser session, and threads for concurrent calls
+    API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "10"))
+    API_MAX_WORKERS = int(os.getenv("API_MAX_WORKERS", "4"))
+    API_PARALLEL_FETCH = os.getenv("API_PARALLEL_FETCH", "true").lower() == "true"
+    # Session list and history pages are reused for this long (0 = off); sending a message invalidates them
+    API_CACHE_TTL_SECONDS = float(os.getenv("API_CACHE_TTL_SECONDS", "15"))
 
 settings = Settings()
@@ -1,8 +1,10 @@
 import streamlit as st
-import requests
 import uuid
+from collections import Counter
+from datetime import datetime
 # from msal_streamlit_auth import msal_authentication
 from config import settings
+from api_client import get_api_client
 
 # --- Auth & Session ---
 # result = msal_authentication(
@@ -18,31 +20,65 @@ from config import settings
 # if not user_id:
 #     st.error("Could not determine user identity from Azure AD login.")
 #     st.stop()
-user_id = "demo_user"  # Temporary for UI preview
-if "session_id" not in st.session_state:
-    st.session_state["session_id"] = str(uuid.uuid4())
-if "user_id" not in st.session_state:
-    st.session_state["user_id"] = user_id
+def init_session(user_id="demo_user"):  # Temporary user for UI preview
+    # Called at the top of every run: this module is imported once per process, not once per browser session
+    if "session_id" not in st.session_state:
+        st.session_state["session_id"] = str(uuid.uuid4())
+    if "user_id" not in st.session_state:
+        st.session_state["user_id"] = user_id
 
 # --- API Utilities ---
+# All calls go through the process-wide client in api_client.py (pooled connections, timeouts, retries, TTL cache)
 def fetch_all_sessions(user_id):
-    api_url = f"{settings.RAG_API_URL.replace('/rag-advanced/', '/chat/sessions/')}"
-    resp = requests.get(api_url, params={"user_id": user_id})
-    if resp.status_code == 200:
-        return resp.json().get("sessions", [])
-    return []
-
-def fetch_chat_history(session_id, user_id):
-    api_url = f"{settings.RAG_API_URL.replace('/rag-advanced/', '/chat/history/')}"
-    resp = requests.post(api_url, json={"session_id": session_id, "user_id": user_id})
-    if resp.status_code == 200:
-        return resp.json().get("history", [])
-    return []
-
-def send_rag_query(query, user_id, user_role):
-    resp = requests.post(settings.RAG_API_URL, json={
-        "query": query,
-        "user_id": user_id,
-        "user_role": user_role
-    })
-    return resp
+    return get_api_client().get_sessions(user_id)
+
+def session_labels(sessions, reserved=()):
+    # Sidebar label per session id. Streamlit maps the chosen label back to its option, so labels must be unique:
+    # a title several sessions share (or a reserved label) gets the last-active time, and the session id if that
+    # is shared too
+    counts = Counter(s.get("title") or s["session_id"] for s in sessions)
+    labels = {}
+    for s in sessions:
+        label = s.get("title") or s["session_id"]
+        if counts[label] > 1 or label in reserved:
+            last_active = s.get("last_active")
+            label = f"{label} · {datetime.fromtimestamp(last_active):%b %d %H:%M}" if last_active else label
+        labels[s["session_id"]] = label
+    counts = Counter(labels.values())
+    return {session_id: f"{label} · {session_id}" if counts[label] > 1 or label in reserved else label
+            for session_id, label in labels.items()}
+
+def fetch_chat_history(session_id, user_id, after_ts=None, limit=None, after_id=None):
+    return get_api_client().get_history_page(session_id, user_id, after_ts, limit, after_id)
+
+def prefetch_chat_history(session_id, user_id):
+    # Starts the first history page request for a session in the background (e.g. while the session list loads);
+    # pass the result to load_chat_history. The client is resolved here, on the script thread: the pool thread has
+    # no ScriptRunContext for st.cache_resource
+    entry = st.session_state.setdefault("history_cache", {}).get(session_id, {"last_ts": None, "last_id": None})
+    client = get_api_client()
+    return client.submit(client.get_history_page, session_id, user_id, entry["last_ts"], settings.HISTORY_PAGE_SIZE,
+                         entry.get("last_id"))
+
+def load_chat_history(session_id, user_id, first_page=None):
+    # History is kept in st.session_state per session; each rerun only asks for messages after the last one seen
+    cache = st.session_state.setdefault("history_cache", {})
+    entry = cache.setdefault(session_id, {"history": [], "last_ts": None, "last_id": None})
+    page = first_page.result() if first_page is not None else None
+    while True:
+        if page is None:
+            page = fetch_chat_history(session_id, user_id, entry["last_ts"], settings.HISTORY_PAGE_SIZE,
+                                      entry.get("last_id"))
+        entry["history"].extend(page.get("history", []))
+        entry["last_ts"] = page.get("last_ts", entry["last_ts"])
+        entry["last_id"] = page.get("last_id", entry.get("last_id"))
+        if not page.get("has_more"):
+            return entry["history"]
+        page = None
+
+def send_rag_query(query, user_id, user_role, session_id=None):
+    return get_api_client().send_rag_query(query, user_id, user_role, session_id)
+
+def stream_rag_query(query, user_id, user_role, session_id=None):
+    # Yields (event, payload) pairs from the /rag-advanced/stream/ server-sent events endpoint
+    yield from get_api_client().stream_rag_query(query, user_id, user_role, session_id)
@@ -1,18 +1,27 @@
 import streamlit as st
-from core import fetch_all_sessions, fetch_chat_history, send_rag_query
+from core import (init_session, fetch_all_sessions, session_labels, prefetch_chat_history, load_chat_history,
+                  stream_rag_query)
+from api_client import get_api_client
 import uuid
 
 st.set_page_config(page_title="NextGen Revenue Insights Assistant", layout="wide")
+init_session()
 
 # --- Sidebar: Session Management ---
+# On reruns the history of the session already shown is fetched concurrently with the session list
+shown_session = st.session_state["session_id"]
+history_page = (prefetch_chat_history(shown_session, st.session_state["user_id"])
+                if shown_session in st.session_state.get("history_cache", {}) else None)
 st.sidebar.title("💼 Sessions")
 sessions = fetch_all_sessions(st.session_state["user_id"])
-session_options = [s for s in sessions]
-selected_session = st.sidebar.selectbox("Select a chat session", session_options + ["+ New Chat"], index=0 if session_options else None)
+session_options = [s["session_id"] for s in sessions]
+session_titles = session_labels(sessions, reserved=("+ New Chat",))
+selected_session = st.sidebar.selectbox("Select a chat session", session_options + ["+ New Chat"], index=0 if session_options else None,
+                                        format_func=lambda session_id: session_titles.get(session_id, session_id))
 if selected_session == "+ New Chat" or not session_options:
     if st.sidebar.button("Start New Chat Session"):
         st.session_state["session_id"] = str(uuid.uuid4())
-        st.cache_data.clear()
+        get_api_client().invalidate(st.session_state["user_id"])
         st.experimental_rerun()
 else:
     st.session_state["session_id"] = selected_session
@@ -29,7 +38,8 @@ st.markdown("""
 st.title("💡 NextGen Revenue Insights Assistant")
 st.caption("A secure, LLM-powered conversational system for accurate financial intelligence.")
 
-chat_history = fetch_chat_history(st.session_state["session_id"], st.session_state["user_id"])
+chat_history = load_chat_history(st.session_state["session_id"], st.session_state["user_id"],
+                                 history_page if st.session_state["session_id"] == shown_session else None)
 st.subheader("Chat History")
 for chat in chat_history:
     st.markdown(f'<div class="chat-container"><div class="user-msg">You:</div><div>{chat["user"]}</div><div class="assistant-msg">{chat["assistant"]}</div></div>', unsafe_allow_html=True)
@@ -40,14 +50,29 @@ with st.form(key="chat_form", clear_on_submit=True):
     submit = st.form_submit_button("Send")
 
 if submit and query:
-    with st.spinner("Thinking..."):
-        response = send_rag_query(query, st.session_state["user_id"], "admin" if st.session_state["user_id"] == "admin_id" else "user")
-        if response.status_code == 200:
-            result = response.json().get("result", "No result returned.")
-            st.session_state.setdefault("chat_history", []).append({"user": query, "assistant": result})
-            st.success(result)
-        else:
-            error_msg = response.json().get("error", response.text)
-            st.error(f"Error: {error_msg}")
+    status = st.status("Generating SQL...")
+    answer_box = st.empty()
+    answer = ""
+    for event, payload in stream_rag_query(query, st.session_state["user_id"], "admin" if st.session_state["user_id"] == "admin_id" else "user",
+                                           st.session_state["session_id"]):
+        if event == "stage":
+            status.update(label=payload["stage"].replace("_", " ").capitalize() + "...")
+        elif event == "sql":
+            status.code(payload["sql"], language="sql")
+        elif event == "rows":
+            status.write(f"{payload['row_count']} rows" + (" (summarized for the model)" if payload["summarized"] else "")
+                         + (" - cut off at the row limit, totals are partial" if payload.get("capped") else ""))
+            if payload["preview"]:
+                status.dataframe(payload["preview"])
+        elif event == "token":
+            answer += payload["text"]
+            answer_box.markdown(answer + "▌")
+        elif event == "done":
+            status.update(label="Done", state="complete", expanded=False)
+            answer_box.success(payload["result"])
+            st.session_state.setdefault("chat_history", []).append({"user": query, "assistant": payload["result"]})
+        elif event == "error":
+            status.update(label="Failed", state="error")
+            st.error(f"Error: {payload['error']}")
 
 st.info("Role-based access and secure data handling enabled.")